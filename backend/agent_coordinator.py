@@ -0,0 +1,323 @@
+"""分布式压测：登记远程 agent、分派负载并汇总它们发回的记录
+
+agent（``python -m tester.agent``）主动连接服务端，全部通信都是 agent 发起的
+HTTP 请求，因此 agent 可以在 NAT/防火墙之后：
+
+  1. 注册后长轮询领取任务分片（与多进程分片相同的 ``shard_config`` 拆分）
+  2. 运行期间周期性上传紧凑编码的记录批次（``tester.record_codec``），
+     同时携带它估计的时钟偏移；服务端在入库前把 start/end 换算到本进程的
+     ``perf_counter`` 时间轴，所以来自所有 agent 的记录落在同一套分位数
+     sketch 和时间分桶里，可以直接合并
+  3. 上传的响应里带回取消标志，结束时上报完成或错误
+"""
+import asyncio
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from tester.latency_tester import ModelConfig, RecordCallback, RequestRecord, StreamCallback
+from tester.process_runner import shard_config
+from tester.record_codec import decode_records
+
+
+@dataclass
+class AgentInfo:
+    """已注册的 agent"""
+    agent_id: str
+    name: str
+    processes: int = 1
+    registered_at: float = field(default_factory=time.time)
+    last_seen: float = field(default_factory=time.monotonic)
+    # agent 时钟换算到服务端 perf_counter 的偏移（秒）及测量时的往返时延
+    clock_offset_s: Optional[float] = None
+    rtt_ms: Optional[float] = None
+    assignment_id: Optional[str] = None
+    inbox: "asyncio.Queue[Assignment]" = field(default_factory=asyncio.Queue, repr=False)
+
+    def to_dict(self, timeout_s: float) -> Dict[str, Any]:
+        idle_s = time.monotonic() - self.last_seen
+        return {
+            "agent_id": self.agent_id,
+            "name": self.name,
+            "processes": self.processes,
+            "online": idle_s <= timeout_s,
+            "busy": self.assignment_id is not None,
+            "idle_s": idle_s,
+            "clock_offset_s": self.clock_offset_s,
+            "rtt_ms": self.rtt_ms,
+        }
+
+
+@dataclass(eq=False)
+class Assignment:
+    """派给某个 agent 的一个负载分片"""
+    assignment_id: str
+    agent_id: str
+    payload: Dict[str, Any]
+    on_records: Callable[[List[RequestRecord]], None]
+    done: asyncio.Future
+    cancelled: bool = False
+    # agent 已通过长轮询领走该分片
+    delivered: bool = False
+    records: int = 0
+
+
+class AgentCoordinator:
+    """agent 注册表与分片调度（单事件循环内使用，不需要加锁）"""
+
+    def __init__(self, timeout_s: float = 30.0, poll_timeout_s: float = 20.0):
+        self.timeout_s = timeout_s
+        self.poll_timeout_s = poll_timeout_s
+        self._agents: Dict[str, AgentInfo] = {}
+        self._assignments: Dict[str, Assignment] = {}
+
+    def register(self, name: str, processes: int = 1) -> AgentInfo:
+        """注册 agent；同名 agent 重新注册（例如重启）时替换旧登记"""
+        for agent_id, agent in list(self._agents.items()):
+            if agent.name == name:
+                self._fail_assignment(agent, f"agent {name} 已重新注册")
+                del self._agents[agent_id]
+        agent = AgentInfo(agent_id=uuid.uuid4().hex, name=name, processes=max(1, processes))
+        self._agents[agent.agent_id] = agent
+        return agent
+
+    def get(self, agent_id: str) -> Optional[AgentInfo]:
+        agent = self._agents.get(agent_id)
+        if agent is not None:
+            agent.last_seen = time.monotonic()
+        return agent
+
+    def is_online(self, agent: AgentInfo) -> bool:
+        return time.monotonic() - agent.last_seen <= self.timeout_s
+
+    def list_agents(self) -> List[Dict[str, Any]]:
+        return [agent.to_dict(self.timeout_s) for agent in self._agents.values()]
+
+    def resolve(self, names: Iterable[str]) -> List[AgentInfo]:
+        """按名称（或 ID）选取在线 agent；``*`` 表示所有在线且空闲的 agent"""
+        names = list(names)
+        online = [a for a in self._agents.values() if self.is_online(a)]
+        if "*" in names:
+            return [a for a in online if a.assignment_id is None]
+        selected = []
+        for name in names:
+            match = next((a for a in online if name in (a.name, a.agent_id)), None)
+            if match is None:
+                raise ValueError(f"agent 不在线: {name}")
+            if match.assignment_id is not None:
+                raise ValueError(f"agent 正在执行其他任务: {name}")
+            selected.append(match)
+        return selected
+
+    async def next_assignment(self, agent: AgentInfo) -> Optional[Assignment]:
+        """长轮询：等待下一个分片，超时返回 None（已被放弃的分片直接跳过）"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.poll_timeout_s
+        try:
+            while True:
+                try:
+                    assignment = await asyncio.wait_for(agent.inbox.get(), timeout=deadline - loop.time())
+                except asyncio.TimeoutError:
+                    return None
+                if assignment.assignment_id in self._assignments:
+                    assignment.delivered = True
+                    return assignment
+        finally:
+            agent.last_seen = time.monotonic()
+
+    def fail_abandoned(self, agent: AgentInfo) -> None:
+        """agent 仍持有已领走的分片却再次领取任务，说明它没能上报完成（例如运行中出错
+        且上报失败），让该分片以错误结束，避免任务一直等待
+        """
+        assignment = self._assignments.get(agent.assignment_id or "")
+        if assignment is not None and assignment.delivered:
+            self._fail_assignment(agent, f"agent {agent.name} 未上报完成即重新领取任务")
+
+    def assign(
+        self,
+        agent: AgentInfo,
+        payload: Dict[str, Any],
+        on_records: Callable[[List[RequestRecord]], None],
+    ) -> Assignment:
+        assignment = Assignment(
+            assignment_id=uuid.uuid4().hex,
+            agent_id=agent.agent_id,
+            payload=payload,
+            on_records=on_records,
+            done=asyncio.get_running_loop().create_future(),
+        )
+        self._assignments[assignment.assignment_id] = assignment
+        agent.assignment_id = assignment.assignment_id
+        agent.inbox.put_nowait(assignment)
+        return assignment
+
+    def _lookup(self, agent: AgentInfo, assignment_id: str) -> Assignment:
+        assignment = self._assignments.get(assignment_id)
+        if assignment is None or assignment.agent_id != agent.agent_id:
+            raise KeyError(assignment_id)
+        return assignment
+
+    def ingest(
+        self,
+        agent: AgentInfo,
+        assignment_id: str,
+        data: bytes,
+        clock_offset_s: float,
+        rtt_ms: Optional[float] = None,
+    ) -> bool:
+        """接收一批记录并校正时钟，返回该分片是否已被取消"""
+        assignment = self._lookup(agent, assignment_id)
+        agent.clock_offset_s = clock_offset_s
+        agent.rtt_ms = rtt_ms
+        if data and not assignment.done.done():
+            records = decode_records(data)
+            for record in records:
+                record.start_time += clock_offset_s
+                record.end_time += clock_offset_s
+            assignment.records += len(records)
+            assignment.on_records(records)
+        return assignment.cancelled
+
+    def finish(self, agent: AgentInfo, assignment_id: str, error: Optional[str] = None) -> None:
+        assignment = self._lookup(agent, assignment_id)
+        self._release(agent, assignment)
+        if not assignment.done.done():
+            if error:
+                assignment.done.set_exception(RuntimeError(f"agent {agent.name}: {error}"))
+            else:
+                assignment.done.set_result(assignment.records)
+
+    def cancel(self, assignment: Assignment) -> None:
+        """标记取消，agent 在下一次上传时收到通知"""
+        assignment.cancelled = True
+
+    def check_timeouts(self, assignments: Iterable[Assignment]) -> None:
+        """失联的 agent 让其分片以错误结束，避免整个任务一直挂起"""
+        for assignment in assignments:
+            agent = self._agents.get(assignment.agent_id)
+            if agent is not None and not assignment.done.done() and not self.is_online(agent):
+                self._fail_assignment(agent, f"agent {agent.name} 超过 {self.timeout_s:g} 秒未响应")
+
+    def _fail_assignment(self, agent: AgentInfo, reason: str) -> None:
+        assignment = self._assignments.get(agent.assignment_id or "")
+        if assignment is None:
+            return
+        self._release(agent, assignment)
+        if not assignment.done.done():
+            assignment.done.set_exception(RuntimeError(reason))
+
+    def _release(self, agent: AgentInfo, assignment: Assignment) -> None:
+        self._assignments.pop(assignment.assignment_id, None)
+        if agent.assignment_id == assignment.assignment_id:
+            agent.assignment_id = None
+
+    def discard(self, assignment: Assignment) -> None:
+        """调用方放弃等待（被取消）时清理分片"""
+        agent = self._agents.get(assignment.agent_id)
+        assignment.cancelled = True
+        if agent is not None:
+            self._release(agent, assignment)
+        if not assignment.done.done():
+            assignment.done.cancel()
+
+
+class DistributedTester:
+    """Same interface as ``LatencyTester``; the load runs on remote agents.
+
+    Each ``run_models`` call splits every config across the agents with
+    ``shard_config`` and waits for all shards. Request ids are remapped to
+    ``local_id * agents + index`` so they stay unique. Streaming increments
+    are not forwarded; each record still carries its final response text.
+    """
+
+    def __init__(
+        self,
+        coordinator: AgentCoordinator,
+        agents: List[AgentInfo],
+        request_timeout: float = 60.0,
+    ):
+        self.coordinator = coordinator
+        self.agents = agents
+        self.request_timeout = request_timeout
+        self.cancelled = False
+        self._active: Set[Assignment] = set()
+        # 每个 agent 累计完成的请求数（写入报告）
+        self.request_counts: Dict[str, int] = {agent.name: 0 for agent in agents}
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        for assignment in list(self._active):
+            self.coordinator.cancel(assignment)
+
+    def agent_report(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "name": agent.name,
+                "requests": self.request_counts.get(agent.name, 0),
+                "clock_offset_s": agent.clock_offset_s,
+                "rtt_ms": agent.rtt_ms,
+            }
+            for agent in self.agents
+        ]
+
+    async def run_models(
+        self,
+        configs: Iterable[ModelConfig],
+        question: Optional[str] = None,
+        stream_callback: Optional[StreamCallback] = None,
+        record_callback: Optional[RecordCallback] = None,
+        keep_records: bool = True,
+    ) -> List[RequestRecord]:
+        records: List[RequestRecord] = []
+        if self.cancelled:
+            return records
+        configs = list(configs)
+        shards = len(self.agents)
+
+        def receiver(index: int, agent: AgentInfo):
+            def on_records(batch: List[RequestRecord]):
+                self.request_counts[agent.name] += len(batch)
+                for record in batch:
+                    record.request_id = record.request_id * shards + index
+                    if keep_records:
+                        records.append(record)
+                    if record_callback:
+                        record_callback(record)
+            return on_records
+
+        assignments = []
+        for index, agent in enumerate(self.agents):
+            shard_configs = [
+                cfg for cfg in (shard_config(c, index, shards) for c in configs) if cfg is not None
+            ]
+            if not shard_configs:
+                continue
+            assignments.append(self.coordinator.assign(agent, {
+                "configs": [asdict(cfg) for cfg in shard_configs],
+                "question": question,
+                "request_timeout": self.request_timeout,
+            }, receiver(index, agent)))
+        self._active.update(assignments)
+
+        try:
+            pending = {a.done for a in assignments}
+            while pending:
+                _, pending = await asyncio.wait(pending, timeout=1.0)
+                self.coordinator.check_timeouts(assignments)
+        except BaseException:
+            for assignment in assignments:
+                self.coordinator.discard(assignment)
+            raise
+        finally:
+            self._active.difference_update(assignments)
+
+        # 被 discard() 取消的 future 调用 exception() 会抛出 CancelledError，先排除
+        errors = [
+            str(a.done.exception())
+            for a in assignments
+            if not a.done.cancelled() and a.done.exception() is not None
+        ]
+        if errors:
+            raise RuntimeError("; ".join(errors))
+        return records
@@ -0,0 +1,180 @@
+"""流式增量合并推送"""
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from backend.task_manager import QUEUE_POLICIES
+
+PushFunc = Callable[[str, dict], Awaitable[None]]
+
+
+def _event_bytes(data: dict) -> int:
+    """流式输出事件携带的文本字节数（按字符计）"""
+    if data.get("type") == "chunks":
+        return sum(len(frame.get("chunk", "")) for frame in data["frames"])
+    return len(data.get("chunk") or "")
+
+
+class ChunkCoalescer:
+    """按 (model, request_id) 合并流式增量，定时或超过字节阈值时作为一个事件推送
+
+    取代“每个 token 一个 asyncio.create_task(push_data)”：所有推送都由单个
+    flush 协程按顺序完成，因此同一请求的增量不会乱序；非增量事件（如请求完成）
+    通过 ``add_event`` 入队，保证排在此前缓冲的增量之后。
+
+    订阅者读得慢时 flush 协程会阻塞在事件日志上，缓冲（未推送的增量与事件）
+    以 ``max_buffer_bytes`` / ``max_buffer_events`` 为上限，达到上限后按与事件日志
+    相同的策略处理：
+    - block: 流式回调改用 ``add_wait``，等待缓冲腾出空间，把背压传给压测请求；
+      请求完成事件来自同步回调无法等待，最多再超出一倍上限，之后淘汰最旧的事件
+    - drop_chunks / latest: 丢弃新的增量与完成事件（计入 ``dropped``），
+      统计与控制事件不经过这里，不受影响
+    """
+
+    def __init__(
+        self,
+        task_id: str,
+        push: PushFunc,
+        flush_interval_ms: float = 30,
+        max_bytes: int = 16384,
+        policy: str = "drop_chunks",
+        max_buffer_bytes: int = 4 * 1024 * 1024,
+        max_buffer_events: int = 2000,
+    ):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"未知的队列策略: {policy}")
+        self.task_id = task_id
+        self._push = push
+        self._interval = flush_interval_ms / 1000
+        self._max_bytes = max_bytes
+        self.policy = policy
+        self.max_buffer_bytes = max(1, max_buffer_bytes)
+        self.max_buffer_events = max(1, max_buffer_events)
+        # 因缓冲达到上限而丢弃的增量 / 事件数
+        self.dropped = 0
+        # 保持插入顺序，同一 key 的增量拼接
+        self._pending: Dict[Tuple[str, int], List[str]] = {}
+        self._pending_bytes = 0
+        # 已封装好、等待按序推送的事件
+        self._outbox: List[dict] = []
+        # 尚未推送完成的字节数与事件数（缓冲中的增量 + 待推送与正在推送的事件）
+        self.buffered_bytes = 0
+        self.buffered_events = 0
+        self._space = asyncio.Event()
+        self._space.set()
+        self._wakeup = asyncio.Event()
+        self._runner: Optional[asyncio.Task] = None
+        self._closed = False
+        self._flush_lock = asyncio.Lock()
+
+    def start(self):
+        """启动后台 flush 协程"""
+        if self._runner is None:
+            self._runner = asyncio.create_task(self._run())
+
+    @property
+    def full(self) -> bool:
+        return self.buffered_bytes >= self.max_buffer_bytes or self.buffered_events >= self.max_buffer_events
+
+    def add(self, model: str, request_id: int, chunk: str):
+        """缓冲一个增量（同步调用，可直接作为 stream_callback）；缓冲已满时丢弃"""
+        if self.full:
+            self.dropped += 1
+            self._wakeup.set()
+            return
+        self._buffer(model, request_id, chunk)
+
+    async def add_wait(self, model: str, request_id: int, chunk: str):
+        """缓冲一个增量，缓冲已满时等待推送腾出空间（block 策略的 stream_callback）"""
+        while self.full and not self._closed:
+            self._space.clear()
+            self._wakeup.set()
+            await self._space.wait()
+        self._buffer(model, request_id, chunk)
+
+    @property
+    def stream_callback(self) -> Callable:
+        """按策略选择流式回调：block 时等待空间，否则满时丢弃"""
+        return self.add_wait if self.policy == "block" else self.add
+
+    def _buffer(self, model: str, request_id: int, chunk: str):
+        key = (model, request_id)
+        if key not in self._pending:
+            self._pending[key] = []
+            if len(self._pending) == 1:
+                # 新的一批增量封装后占一个事件位置
+                self.buffered_events += 1
+        self._pending[key].append(chunk)
+        self._pending_bytes += len(chunk)
+        self.buffered_bytes += len(chunk)
+        if self._pending_bytes >= self._max_bytes or self.full:
+            self._wakeup.set()
+
+    def add_event(self, data: dict):
+        """在已缓冲的增量之后追加一个普通事件"""
+        size = _event_bytes(data)
+        if self.full:
+            if self.policy != "block":
+                self.dropped += 1
+                self._wakeup.set()
+                return
+            self._seal_pending()
+            # 完成事件无法等待：超出一倍上限后淘汰最旧的待推送事件
+            while self._outbox and (
+                self.buffered_bytes + size > 2 * self.max_buffer_bytes
+                or self.buffered_events >= 2 * self.max_buffer_events
+            ):
+                self._release(self._outbox.pop(0))
+                self.dropped += 1
+        self._seal_pending()
+        self._outbox.append(data)
+        self.buffered_bytes += size
+        self.buffered_events += 1
+        self._wakeup.set()
+
+    def _seal_pending(self):
+        if not self._pending:
+            return
+        frames = [
+            {"model": model, "request_id": request_id, "chunk": "".join(parts)}
+            for (model, request_id), parts in self._pending.items()
+        ]
+        self._pending = {}
+        self._pending_bytes = 0
+        # 字节数与事件数在缓冲时已计入
+        self._outbox.append({"type": "chunks", "frames": frames})
+
+    def _release(self, data: dict):
+        """一个事件推送完成或被淘汰，释放其占用的缓冲"""
+        self.buffered_bytes -= _event_bytes(data)
+        self.buffered_events -= 1
+        if not self.full:
+            self._space.set()
+
+    async def flush(self):
+        """立即推送所有缓冲内容"""
+        async with self._flush_lock:
+            self._seal_pending()
+            outbox, self._outbox = self._outbox, []
+            for data in outbox:
+                await self._push(self.task_id, data)
+                self._release(data)
+
+    async def _run(self):
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def stop(self):
+        """停止后台协程并推送剩余内容（可重复调用）"""
+        self._closed = True
+        self._wakeup.set()
+        # 唤醒仍在等待空间的生产者
+        self._space.set()
+        if self._runner is not None:
+            await self._runner
+            self._runner = None
+        await self.flush()
@@ -17,12 +17,48 @@ class Settings(BaseSettings):
     ALLOWED_ORIGINS: str = "*"  # 逗号分隔的来源列表
     
     # 数据存储配置
-    HISTORY_FILE: str = "data/test_history.json"
-    MAX_HISTORY_RECORDS: int = 100
+    HISTORY_DB: str = "data/history.db"  # SQLite 历史库
+    HISTORY_FILE: str = "data/test_history.json"  # 旧版 JSON 历史，启动时一次性迁移
+    MAX_HISTORY_RECORDS: int = 0  # 0 表示不限制
+    RECORD_ARCHIVE_ENABLED: bool = True  # 保存每次运行的原始请求记录（列式归档）
+    RECORD_ARCHIVE_DIR: str = "data/records"
+    CALIBRATION_FILE: str = "data/calibration.json"  # 压测工具自身开销的校准结果，附加到每次运行的报告
+    CORPUS_DIR: str = "data/corpus"  # 提示词语料目录（JSONL / CSV），测试请求只能引用其中的文件
     
     # 任务配置
-    TASK_CLEANUP_INTERVAL: int = 3600  # 1小时
+    TASK_CLEANUP_INTERVAL: int = 3600  # 已结束的任务保留 1 小时（供断线重连回放）
+    TASK_ABANDON_TIMEOUT: int = 1800  # 任务没有订阅者超过该秒数视为被遗弃：运行中的取消，已结束的清理；0 表示不检测
+    TASK_SWEEP_INTERVAL: int = 60  # 检查过期与被遗弃任务的间隔（秒）
+    TASK_QUEUE_MAXSIZE: int = 2000  # 每个任务流式输出环形缓冲的容量（统计与控制事件不占用）
+    TASK_QUEUE_POLICY: str = "drop_chunks"  # 订阅者落后于环形缓冲时的策略: block / drop_chunks / latest
+    SSE_PING_INTERVAL: int = 15  # SSE 心跳间隔（秒），用于发现已断开的消费者
     REQUEST_TIMEOUT: float = 60.0
+    REQUEST_MAX_RETRIES: int = 0  # 429 / 5xx 的默认重试次数（0 表示不重试，失败直接记为错误）
+    RETRY_BACKOFF_MS: float = 500.0  # 指数退避基数（毫秒）；响应带 Retry-After 时按其等待
+    RETRY_MAX_BACKOFF_MS: float = 30000.0  # 单次退避上限（毫秒）
+    RATE_LIMIT_UTILIZATION: float = 0.95  # 客户端限流按 models.yaml 中 rpm/tpm 配额的该比例放行
+    AGENT_TOKEN: str = ""  # 分布式 agent 接入令牌（为空时不校验）
+    AGENT_TIMEOUT: float = 30.0  # agent 超过该秒数无心跳视为离线，其分片以错误结束
+    AGENT_POLL_TIMEOUT: float = 20.0  # agent 领取任务的长轮询时长（秒）
+    LOAD_PROCESSES: int = 1  # 默认压测进程数：1 在服务进程内运行，大于 1 时拆到子进程（可设为 CPU 核数）
+    
+    # HTTP 连接池配置（所有测试任务共享）
+    HTTP_POOL_LIMIT: int = 1000  # 连接总数上限
+    HTTP_POOL_LIMIT_PER_HOST: int = 200  # 每个 endpoint 的连接上限
+    HTTP_DNS_CACHE_TTL: int = 300  # DNS 缓存时间（秒）
+    HTTP_KEEPALIVE_TIMEOUT: float = 60.0  # 空闲连接保活时间（秒）
+    HTTP_TRACE_PHASES: bool = True  # 记录每个请求的连接阶段耗时（DNS、建连、等待响应头等）
+    
+    # 流式推送合并配置
+    STREAM_FLUSH_INTERVAL_MS: float = 30  # 增量合并推送间隔（毫秒）
+    STREAM_FLUSH_MAX_BYTES: int = 16384  # 缓冲超过该字节数立即推送
+    STREAM_BUFFER_MAX_BYTES: int = 4194304  # 订阅者读得慢时待推送文本的上限，达到后按 TASK_QUEUE_POLICY 处理
+    
+    # 定时/长稳测试配置
+    SOAK_SNAPSHOT_INTERVAL: float = 10.0  # 周期快照推送间隔（秒）
+    TIMELINE_BUCKET_SECONDS: float = 10.0  # 时间分桶初始宽度（秒）
+    TIMELINE_MAX_BUCKETS: int = 720  # 分桶数量上限，超出后合并相邻桶
+    STEADY_STATE_WINDOW: int = 0  # 大于 0 时默认在每组前 N 个请求中用 MSER-5 检测预热段，0 表示只在请求显式开启时检测
     
     # 限流配置
     ENABLE_RATE_LIMIT: bool = False
@@ -67,6 +103,26 @@ class Settings(BaseSettings):
         """模型配置文件完整路径"""
         return self.base_dir / self.MODELS_CONFIG_FILE
     
+    @property
+    def history_db_path(self) -> Path:
+        """历史记录数据库完整路径"""
+        return self.base_dir / self.HISTORY_DB
+    
+    @property
+    def record_archive_path(self) -> Path:
+        """原始请求记录归档根目录"""
+        return self.base_dir / self.RECORD_ARCHIVE_DIR
+    
+    @property
+    def calibration_path(self) -> Path:
+        """校准结果文件完整路径"""
+        return self.base_dir / self.CALIBRATION_FILE
+    
+    @property
+    def corpus_dir_path(self) -> Path:
+        """提示词语料目录完整路径"""
+        return self.base_dir / self.CORPUS_DIR
+    
     @property
     def history_file_path(self) -> Path:
         """历史记录文件完整路径"""
@@ -1,52 +1,328 @@
 """历史记录管理器"""
 import json
 import os
+import shutil
+import sqlite3
+import threading
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable, Tuple
+
+from tester.sketch import QuantileSketch
+
+# 数据库结构版本（PRAGMA user_version）：1 = history 表，2 = 增加趋势汇总表，
+# 3 = run_rollup 保存每次运行的延迟分布草图
+SCHEMA_VERSION = 3
+
+# 每次运行汇总中进入趋势表的指标
+ROLLUP_METRICS = (
+    "avg_latency", "p50", "p95", "p99", "first_token_avg", "first_token_p50", "first_token_p95",
+)
+
+# 日汇总中由合并后的分布草图计算的分位数：指标 -> (草图, 分位点)
+SKETCH_QUANTILES = {
+    "p50": ("latency", 0.5),
+    "p95": ("latency", 0.95),
+    "p99": ("latency", 0.99),
+    "first_token_p50": ("first_token", 0.5),
+    "first_token_p95": ("first_token", 0.95),
+}
+
+# run_rollup 中保存草图 JSON 的列
+SKETCH_COLUMNS = {"latency": "latency_sketch", "first_token": "first_token_sketch"}
 
 
 class HistoryManager:
-    def __init__(self, history_file: str = "data/test_history.json"):
-        self.history_file = Path(history_file)
-        self.history_file.parent.mkdir(parents=True, exist_ok=True)
-        self._ensure_file_exists()
-    
-    def _ensure_file_exists(self):
-        """确保历史记录文件存在"""
-        if not self.history_file.exists():
-            self.history_file.write_text(json.dumps([], ensure_ascii=False, indent=2), encoding='utf-8')
-    
-    def _load_history(self) -> List[Dict[str, Any]]:
-        """加载历史记录"""
-        try:
-            with open(self.history_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"加载历史记录失败: {e}")
-            return []
+    """基于 SQLite 的历史记录存储
+    
+    每条记录一行：列表所需的字段（时间、问题、模型）单独成列，完整记录体
+    （summary、timeline 等）以 JSON 存在 body 列，只有查看详情时才读取。
+    追加为单行 INSERT，与已有记录数量无关；按 id（主键）和 timestamp
+    （索引）查询。首次启动时自动把旧版 test_history.json 导入数据库。
+    所有方法都是阻塞调用，内部以锁串行化，可在线程池中调用（见 asyncio.to_thread）。
+    
+    每次运行的原始请求记录以列式归档保存在 archive_root 下的独立目录中，
+    记录体里只保存其相对路径，删除记录时一并删除。
+    
+    趋势查询不扫描记录体：写入时把每个模型（及阶段）的汇总行展开到
+    run_rollup，再增量重算受影响的 (日期, 模型, 问题, 阶段) 日汇总
+    daily_rollup，两张表都按模型、问题和日期建索引。run_rollup 同时保存
+    每次运行的延迟与首 token 分布草图，日汇总的分位数由合并后的草图计算。
+    """
     
-    def _save_history(self, history: List[Dict[str, Any]]):
-        """保存历史记录"""
+    def __init__(
+        self,
+        db_file: str = "data/history.db",
+        legacy_file: Optional[str] = "data/test_history.json",
+        max_records: int = 0,
+        archive_root: Optional[str] = None,
+    ):
+        self.db_file = Path(db_file)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self.archive_root = Path(archive_root) if archive_root else self.db_file.parent / "records"
+        # 0 表示不限制保留数量
+        self.max_records = max_records
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._init_schema()
+        if legacy_file:
+            self._migrate_legacy(Path(legacy_file))
+    
+    def _init_schema(self):
+        """建表与索引"""
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < 3:
+                # 汇总表只是派生数据：旧结构直接重建，下面从记录体补齐
+                self._conn.execute("DROP TABLE IF EXISTS run_rollup")
+                self._conn.execute("DROP TABLE IF EXISTS daily_rollup")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS history (
+                    id TEXT PRIMARY KEY,
+                    timestamp TEXT NOT NULL,
+                    question TEXT NOT NULL DEFAULT '',
+                    models TEXT NOT NULL DEFAULT '[]',
+                    model_count INTEGER NOT NULL DEFAULT 0,
+                    body TEXT NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history (timestamp)"
+            )
+            metric_columns = "".join(f"{name} REAL, " for name in ROLLUP_METRICS)
+            self._conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS run_rollup (
+                    history_id TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    stage TEXT NOT NULL DEFAULT '',
+                    question TEXT NOT NULL DEFAULT '',
+                    {metric_columns}
+                    error_rate REAL,
+                    total_requests INTEGER NOT NULL DEFAULT 0,
+                    success_count INTEGER NOT NULL DEFAULT 0,
+                    error_count INTEGER NOT NULL DEFAULT 0,
+                    latency_sketch TEXT,
+                    first_token_sketch TEXT
+                )
+                """
+            )
+            self._conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS daily_rollup (
+                    day TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    stage TEXT NOT NULL DEFAULT '',
+                    question TEXT NOT NULL DEFAULT '',
+                    runs INTEGER NOT NULL,
+                    {metric_columns}
+                    error_rate REAL,
+                    total_requests INTEGER NOT NULL,
+                    success_count INTEGER NOT NULL,
+                    error_count INTEGER NOT NULL,
+                    PRIMARY KEY (day, model, question, stage)
+                )
+                """
+            )
+            for table in ("run_rollup", "daily_rollup"):
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{table}_model_day ON {table} (model, day)"
+                )
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{table}_question_day ON {table} (question, day)"
+                )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_run_rollup_history ON run_rollup (history_id)"
+            )
+            
+            if version < 3:
+                # 已有记录补建趋势汇总
+                for row in self._conn.execute("SELECT body FROM history").fetchall():
+                    self._add_rollups(json.loads(row["body"]))
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    
+    def _migrate_legacy(self, legacy_file: Path):
+        """一次性导入旧版 JSON 历史文件，完成后重命名为 .migrated"""
+        if not legacy_file.exists():
+            return
         try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(history, f, ensure_ascii=False, indent=2)
+            with open(legacy_file, 'r', encoding='utf-8') as f:
+                history = json.load(f)
         except Exception as e:
-            print(f"保存历史记录失败: {e}")
+            print(f"读取旧版历史记录失败: {e}")
+            return
+        
+        with self._lock, self._conn:
+            # 旧文件最新的在前，按时间从旧到新导入
+            for record in reversed(history):
+                self._insert(record, replace=False)
+        os.replace(legacy_file, legacy_file.with_name(legacy_file.name + ".migrated"))
+        print(f"已迁移 {len(history)} 条历史记录到 {self.db_file}")
+    
+    def _insert(self, record: Dict[str, Any], replace: bool = True):
+        """写入一行并更新趋势汇总（调用方负责加锁和事务）"""
+        question = record.get("test_config", {}).get("question", "") or ""
+        # 分阶段运行中同一模型有多行汇总，去重并保持顺序
+        models = list(dict.fromkeys(item.get("model", "") for item in record.get("summary", [])))
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+        if replace:
+            self._remove_rollups(record["id"])
+        cursor = self._conn.execute(
+            f"{verb} INTO history (id, timestamp, question, models, model_count, body) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                record["id"],
+                record["timestamp"],
+                question,
+                json.dumps(models, ensure_ascii=False),
+                record.get("model_count", len(models)),
+                json.dumps(record, ensure_ascii=False),
+            ),
+        )
+        if cursor.rowcount > 0:
+            self._add_rollups(record)
+    
+    def _add_rollups(self, record: Dict[str, Any]):
+        """把一条记录的汇总行写入 run_rollup，并重算对应的日汇总"""
+        question = record.get("test_config", {}).get("question", "") or ""
+        timestamp = record["timestamp"]
+        day = timestamp[:10]
+        sketches = {
+            (item["model"], item.get("stage") or ""): item
+            for item in record.get("sketches", [])
+        }
+        keys = set()
+        for item in record.get("summary", []):
+            model = item.get("model")
+            if not model:
+                continue
+            stage = item.get("stage") or ""
+            values = [item.get(name) for name in ROLLUP_METRICS]
+            # 旧记录没有草图，对应列为 NULL
+            sketch = sketches.get((model, stage), {})
+            sketch_values = [
+                json.dumps(sketch[name]) if sketch.get(name) else None for name in SKETCH_COLUMNS
+            ]
+            self._conn.execute(
+                "INSERT INTO run_rollup (history_id, timestamp, day, model, stage, question, "
+                + "".join(f"{name}, " for name in ROLLUP_METRICS)
+                + "error_rate, total_requests, success_count, error_count, "
+                + ", ".join(SKETCH_COLUMNS.values()) + ") VALUES ("
+                + ", ".join("?" * (10 + len(ROLLUP_METRICS) + len(SKETCH_COLUMNS))) + ")",
+                (
+                    record["id"], timestamp, day, model, stage, question,
+                    *values,
+                    item.get("error_rate"),
+                    item.get("total_requests") or 0,
+                    item.get("success_count") or 0,
+                    item.get("error_count") or 0,
+                    *sketch_values,
+                ),
+            )
+            keys.add((day, model, question, stage))
+        self._refresh_daily(keys)
+    
+    def _remove_rollups(self, record_id: str):
+        """删除一条记录的 run_rollup 行，并重算受影响的日汇总"""
+        keys = {
+            tuple(row)
+            for row in self._conn.execute(
+                "SELECT day, model, question, stage FROM run_rollup WHERE history_id = ?",
+                (record_id,),
+            ).fetchall()
+        }
+        self._conn.execute("DELETE FROM run_rollup WHERE history_id = ?", (record_id,))
+        self._refresh_daily(keys)
+    
+    def _refresh_daily(self, keys: Iterable[Tuple[str, str, str, str]]):
+        """按索引重算给定 (day, model, question, stage) 的日汇总
+        
+        平均值为各次运行按成功请求数加权的平均值；分位数由当天各次运行的
+        分布草图合并后计算（分位数本身不能取平均）。有运行缺少草图（旧记录）
+        时无法合并，当天只有一次运行则沿用其分位数，否则为 NULL。
+        错误率按请求总数重新计算。
+        """
+        weighted = "".join(
+            f"SUM(CASE WHEN {name} IS NOT NULL THEN {name} * success_count END) "
+            f"/ NULLIF(SUM(CASE WHEN {name} IS NOT NULL THEN success_count END), 0), "
+            for name in ROLLUP_METRICS
+        )
+        for day, model, question, stage in keys:
+            self._conn.execute(
+                "DELETE FROM daily_rollup WHERE day = ? AND model = ? AND question = ? AND stage = ?",
+                (day, model, question, stage),
+            )
+            self._conn.execute(
+                "INSERT INTO daily_rollup (day, model, stage, question, runs, "
+                + "".join(f"{name}, " for name in ROLLUP_METRICS)
+                + "error_rate, total_requests, success_count, error_count) "
+                "SELECT day, model, stage, question, COUNT(*), "
+                + weighted
+                + "CAST(SUM(error_count) AS REAL) / NULLIF(SUM(total_requests), 0), "
+                "SUM(total_requests), SUM(success_count), SUM(error_count) "
+                "FROM run_rollup WHERE day = ? AND model = ? AND question = ? AND stage = ? "
+                "GROUP BY day, model, question, stage",
+                (day, model, question, stage),
+            )
+            self._merge_daily_quantiles(day, model, question, stage)
+    
+    def _merge_daily_quantiles(self, day: str, model: str, question: str, stage: str):
+        """用合并后的草图覆盖一个日汇总行的分位数"""
+        rows = self._conn.execute(
+            f"SELECT {', '.join(SKETCH_COLUMNS.values())} FROM run_rollup "
+            "WHERE day = ? AND model = ? AND question = ? AND stage = ?",
+            (day, model, question, stage),
+        ).fetchall()
+        if len(rows) <= 1:
+            # 单次运行（或已无运行）时日汇总即该次运行的值
+            return
+        values = {}
+        for name, column in SKETCH_COLUMNS.items():
+            merged: Optional[QuantileSketch] = None
+            if all(row[column] for row in rows):
+                for row in rows:
+                    sketch = QuantileSketch.from_dict(json.loads(row[column]))
+                    if merged is None:
+                        merged = sketch
+                    else:
+                        merged.merge(sketch)
+            for metric, (source, q) in SKETCH_QUANTILES.items():
+                if source == name:
+                    values[metric] = merged.quantile(q) if merged is not None else None
+        self._conn.execute(
+            "UPDATE daily_rollup SET "
+            + ", ".join(f"{metric} = ?" for metric in values)
+            + " WHERE day = ? AND model = ? AND question = ? AND stage = ?",
+            (*values.values(), day, model, question, stage),
+        )
     
-    def add_record(self, summary_data: List[Dict[str, Any]], test_config: Dict[str, Any]) -> str:
+    def add_record(
+        self,
+        summary_data: List[Dict[str, Any]],
+        test_config: Dict[str, Any],
+        timeline: Optional[List[Dict[str, Any]]] = None,
+        archive: Optional[Path] = None,
+        sketches: Optional[List[Dict[str, Any]]] = None,
+    ) -> str:
         """
         添加测试记录
         
         Args:
             summary_data: 统计摘要数据
             test_config: 测试配置（问题、参数等）
+            timeline: 按时间分桶的统计序列（定时/长稳测试）
+            archive: 原始请求记录归档目录（见 new_archive_dir）
+            sketches: 各模型（及阶段）的延迟分布草图，用于合并日汇总分位数
         
         Returns:
             记录ID
         """
-        history = self._load_history()
-        
         # 生成唯一ID（使用时间戳）
         record_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
         
@@ -57,41 +333,67 @@ class HistoryManager:
             "summary": summary_data,
             "model_count": len(summary_data),
         }
+        if timeline is not None:
+            record["timeline"] = timeline
+        if archive is not None:
+            # 相对数据库目录保存，便于整体迁移 data 目录
+            record["archive"] = os.path.relpath(archive, self.db_file.parent)
+        if sketches is not None:
+            record["sketches"] = sketches
         
-        # 插入到列表开头（最新的在前面）
-        history.insert(0, record)
-        
-        # 限制历史记录数量（保留最近100条）
-        if len(history) > 100:
-            history = history[:100]
-        
-        self._save_history(history)
+        expired = []
+        with self._lock, self._conn:
+            self._insert(record)
+            if self.max_records > 0:
+                # 按配置只保留最近 max_records 条
+                expired = self._conn.execute(
+                    "SELECT id, json_extract(body, '$.archive') FROM history "
+                    "ORDER BY timestamp DESC LIMIT -1 OFFSET ?",
+                    (self.max_records,),
+                ).fetchall()
+                for row in expired:
+                    self._remove_rollups(row[0])
+                self._conn.executemany(
+                    "DELETE FROM history WHERE id = ?", [(row[0],) for row in expired]
+                )
+        self._remove_archives(row[1] for row in expired)
         return record_id
     
-    def get_all_records(self, limit: int = 50) -> List[Dict[str, Any]]:
+    def get_all_records(self, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
         """
         获取所有历史记录（摘要信息）
         
         Args:
             limit: 返回的最大记录数
+            offset: 跳过最新的若干条（分页）
         
         Returns:
             历史记录列表
         """
-        history = self._load_history()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, timestamp, question, models, model_count FROM history "
+                "ORDER BY timestamp DESC LIMIT ? OFFSET ?",
+                (limit, offset),
+            ).fetchall()
         
-        # 返回简化的记录列表（不包含完整的summary数据）
+        # 返回简化的记录列表（不读取完整的记录体）
         return [
             {
-                "id": record["id"],
-                "timestamp": record["timestamp"],
-                "model_count": record.get("model_count", 0),
-                "question": record.get("test_config", {}).get("question", "")[:50] + "..." if len(record.get("test_config", {}).get("question", "")) > 50 else record.get("test_config", {}).get("question", ""),
-                "models": [item.get("model", "") for item in record.get("summary", [])][:5],  # 只返回前5个模型名
+                "id": row["id"],
+                "timestamp": row["timestamp"],
+                "model_count": row["model_count"],
+                "question": row["question"][:50] + "..." if len(row["question"]) > 50 else row["question"],
+                "models": json.loads(row["models"])[:5],  # 只返回前5个模型名
             }
-            for record in history[:limit]
+            for row in rows
         ]
     
+    def count(self) -> int:
+        """历史记录总数"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+    
     def get_record(self, record_id: str) -> Optional[Dict[str, Any]]:
         """
         获取指定的历史记录（完整数据）
@@ -102,17 +404,34 @@ class HistoryManager:
         Returns:
             历史记录详情
         """
-        history = self._load_history()
-        
-        for record in history:
-            if record["id"] == record_id:
-                return record
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body FROM history WHERE id = ?", (record_id,)
+            ).fetchone()
         
-        return None
+        if row is None:
+            return None
+        return json.loads(row["body"])
+    
+    def new_archive_dir(self, name: str) -> Path:
+        """为一次运行分配原始记录归档目录"""
+        return self.archive_root / name
+    
+    def archive_path(self, record: Dict[str, Any]) -> Optional[Path]:
+        """记录对应的原始记录归档目录（没有归档时返回 None）"""
+        archive = record.get("archive")
+        if not archive:
+            return None
+        return self.db_file.parent / archive
+    
+    def _remove_archives(self, archives):
+        for archive in archives:
+            if archive:
+                shutil.rmtree(self.db_file.parent / archive, ignore_errors=True)
     
     def delete_record(self, record_id: str) -> bool:
         """
-        删除指定的历史记录
+        删除指定的历史记录（连同原始记录归档）
         
         Args:
             record_id: 记录ID
@@ -120,16 +439,82 @@ class HistoryManager:
         Returns:
             是否删除成功
         """
-        history = self._load_history()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT json_extract(body, '$.archive') FROM history WHERE id = ?", (record_id,)
+            ).fetchone()
+            self._remove_rollups(record_id)
+            self._conn.execute("DELETE FROM history WHERE id = ?", (record_id,))
+        if row is None:
+            return False
+        self._remove_archives([row[0]])
+        return True
+    
+    def clear_all(self):
+        """清空所有历史记录（连同原始记录归档）"""
+        with self._lock, self._conn:
+            archives = self._conn.execute(
+                "SELECT json_extract(body, '$.archive') FROM history"
+            ).fetchall()
+            self._conn.execute("DELETE FROM history")
+            self._conn.execute("DELETE FROM run_rollup")
+            self._conn.execute("DELETE FROM daily_rollup")
+        self._remove_archives(row[0] for row in archives)
+    
+    def get_trends(
+        self,
+        model: Optional[str] = None,
+        question: Optional[str] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        granularity: str = "run",
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        按模型返回跨历史记录的趋势序列（来自汇总表，不读取记录体）
+        
+        Args:
+            model: 只返回该模型
+            question: 只返回该问题的运行
+            start_date: 起始日期（含），YYYY-MM-DD
+            end_date: 结束日期（含），YYYY-MM-DD
+            granularity: run（每次运行一个点）或 day（每天一个点）
         
-        for i, record in enumerate(history):
-            if record["id"] == record_id:
-                history.pop(i)
-                self._save_history(history)
-                return True
+        Returns:
+            {模型名: [按时间排序的数据点]}
+        """
+        if granularity not in ("run", "day"):
+            raise ValueError(f"未知的粒度: {granularity}")
+        table = "run_rollup" if granularity == "run" else "daily_rollup"
+        order = "timestamp" if granularity == "run" else "day"
+        conditions, params = [], []
+        for column, value in (("model", model), ("question", question)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if start_date:
+            conditions.append("day >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("day <= ?")
+            params.append(end_date)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
         
-        return False
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM {table} {where} ORDER BY model, {order}, stage", params
+            ).fetchall()
+        
+        series: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            point = dict(row)
+            # 草图只用于合并，不随趋势点返回
+            for column in SKETCH_COLUMNS.values():
+                point.pop(column, None)
+            point["stage"] = point["stage"] or None
+            series.setdefault(point.pop("model"), []).append(point)
+        return series
     
-    def clear_all(self):
-        """清空所有历史记录"""
-        self._save_history([])
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
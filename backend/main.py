@@ -1,12 +1,15 @@
 """FastAPI 主入口"""
 import asyncio
 import json
+import shutil
 import sys
-import threading
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
@@ -16,17 +19,83 @@ from sse_starlette.sse import EventSourceResponse
 BASE_DIR = Path(__file__).parent.parent
 sys.path.insert(0, str(BASE_DIR))
 
-from backend.models import ModelConfigRequest, TestRequest, TestResponse, StreamChunk
+from backend.config import settings
+from backend.models import (
+    AgentDoneRequest, AgentRegisterRequest, ModelConfigRequest, SloSpec, TestRequest, TestResponse, StreamChunk,
+)
 from backend.task_manager import task_manager
 from backend.history_manager import HistoryManager
+from backend.chunk_coalescer import ChunkCoalescer
+from backend.model_registry import ModelRegistry
+from backend.agent_coordinator import AgentCoordinator, AgentInfo, DistributedTester
+from tester.http_pool import HttpClientPool
 from tester.latency_tester import LatencyTester, ModelConfig, RequestRecord, MODEL_PARAM_SUPPORT
-from tester.metrics import records_to_dataframe, summarize_latency
-import yaml
+from tester.aggregator import RunAggregator
+from tester.load_profile import LoadProfile, LoadStage, iter_profile
+from tester.record_archive import RecordArchive, RecordArchiveWriter
+from tester.process_runner import ProcessShardedTester
+from tester.calibration import CalibrationResult, calibrate, load_calibration, save_calibration
+from tester.capacity import SLO, CapacitySearch
+from tester.corpus import PromptCorpus
+from tester.steady_state import DEFAULT_WINDOW
+
+# 进程级共享 HTTP 连接池，所有测试任务复用 keep-alive 连接
+http_pool = HttpClientPool(
+    limit=settings.HTTP_POOL_LIMIT,
+    limit_per_host=settings.HTTP_POOL_LIMIT_PER_HOST,
+    dns_cache_ttl=settings.HTTP_DNS_CACHE_TTL,
+    keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT,
+    trace_phases=settings.HTTP_TRACE_PHASES,
+)
+
 
-app = FastAPI(title="LLM Latency Tester API", version="1.0.0")
+async def sweep_tasks():
+    """定期清理已结束超时与被遗弃的任务"""
+    while True:
+        await asyncio.sleep(settings.TASK_SWEEP_INTERVAL)
+        task_manager.cleanup_old_tasks()
 
-# 初始化历史记录管理器
-history_manager = HistoryManager()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：持有共享连接池与任务清理协程"""
+    await http_pool.start()
+    sweeper = asyncio.create_task(sweep_tasks())
+    yield
+    sweeper.cancel()
+    await http_pool.close()
+
+
+app = FastAPI(title="LLM Latency Tester API", version="1.0.0", lifespan=lifespan)
+
+# 初始化历史记录管理器（首次启动时迁移旧版 JSON 历史）
+history_manager = HistoryManager(
+    str(settings.history_db_path),
+    legacy_file=str(settings.history_file_path),
+    max_records=settings.MAX_HISTORY_RECORDS,
+    archive_root=str(settings.record_archive_path),
+)
+
+# 分布式压测 agent 注册表
+agent_coordinator = AgentCoordinator(
+    timeout_s=settings.AGENT_TIMEOUT,
+    poll_timeout_s=settings.AGENT_POLL_TIMEOUT,
+)
+
+# 最近一次的压测工具开销校准结果（没有时为 None）
+calibration: Optional[CalibrationResult] = load_calibration(settings.calibration_path)
+calibration_lock = asyncio.Lock()
+
+
+def calibration_report(requests: int, elapsed_s: float) -> Optional[Dict]:
+    """附加到运行报告的校准信息：本次吞吐是否超出了可信上限"""
+    if calibration is None:
+        return None
+    report = calibration.brief()
+    observed = requests / elapsed_s if elapsed_s > 0 else 0.0
+    report["observed_requests_per_s"] = observed
+    report["exceeds_calibrated_capacity"] = observed > calibration.max_requests_per_s
+    return report
 
 # CORS 配置
 app.add_middleware(
@@ -43,49 +112,8 @@ if FRONTEND_DIR.exists():
     app.mount("/static", StaticFiles(directory=str(FRONTEND_DIR)), name="static")
 
 CONFIG_PATH = BASE_DIR / "config" / "models.yaml"
-CONFIG_LOCK = threading.Lock()
-
-
-def read_model_config_items() -> List[Dict]:
-    """从配置文件读取原始模型列表"""
-    with CONFIG_LOCK:
-        if not CONFIG_PATH.exists():
-            return []
-        with CONFIG_PATH.open("r", encoding="utf-8") as f:
-            raw = yaml.safe_load(f) or {}
-        return raw.get("models", [])
-
-
-def save_model_config_items(items: List[Dict]):
-    """将模型配置写回文件"""
-    with CONFIG_LOCK:
-        CONFIG_PATH.parent.mkdir(parents=True, exist_ok=True)
-        with CONFIG_PATH.open("w", encoding="utf-8") as f:
-            yaml.safe_dump({"models": items}, f, sort_keys=False)
-
-
-def load_model_configs() -> Dict[str, ModelConfig]:
-    """从配置文件加载模型配置"""
-    configs = {}
-    for item in read_model_config_items():
-        name = str(item.get("name", "")).strip()
-        if not name:
-            continue
-        cfg = ModelConfig(
-            name=name,
-            endpoint=item["endpoint"],
-            api_key=item["api_key"],
-            api_version=item["api_version"],
-            prompt="Hello, test",  # 默认提示词
-            max_tokens=item.get("max_tokens", 1000),
-            temperature=item.get("temperature", 0.7),
-            concurrency=item.get("concurrency", 1),
-            iterations=item.get("iterations", 1),
-            stream=item.get("stream", False),
-        )
-        configs[cfg.name] = cfg
-    
-    return configs
+# 模型配置缓存：文件未变化时不重复解析 YAML
+model_registry = ModelRegistry(CONFIG_PATH)
 
 
 @app.get("/")
@@ -101,7 +129,7 @@ async def root():
 async def get_models():
     """获取可用模型列表及其参数支持信息"""
     try:
-        configs = load_model_configs()
+        configs = model_registry.snapshot().configs
         models = [
             {
                 "name": cfg.name,
@@ -120,7 +148,7 @@ async def get_models():
 async def get_model_info(model_name: str):
     """获取单个模型的详细信息"""
     try:
-        configs = load_model_configs()
+        configs = model_registry.snapshot().configs
         if model_name not in configs:
             raise HTTPException(status_code=404, detail=f"模型 '{model_name}' 不存在")
         
@@ -129,6 +157,8 @@ async def get_model_info(model_name: str):
             "name": cfg.name,
             "endpoint": cfg.endpoint,
             "api_version": cfg.api_version,
+            "rpm": cfg.rpm_limit,
+            "tpm": cfg.tpm_limit,
             "supported_params": MODEL_PARAM_SUPPORT.get(cfg.name, MODEL_PARAM_SUPPORT["default"]),
         }
     except HTTPException:
@@ -148,22 +178,27 @@ async def add_model_config(request: ModelConfigRequest):
     if not name or not endpoint or not api_key or not api_version:
         raise HTTPException(status_code=400, detail="名称、地址、API Key 和版本均为必填项")
 
-    try:
-        existing_items = read_model_config_items()
+    # 只保存必要的 4 个字段（及可选的配额），其他参数在测试时由用户动态指定
+    new_item = {
+        "name": name,
+        "endpoint": endpoint,
+        "api_key": api_key,
+        "api_version": api_version,
+    }
+    if request.rpm:
+        new_item["rpm"] = request.rpm
+    if request.tpm:
+        new_item["tpm"] = request.tpm
+
+    def append_item(existing_items: List[Dict]):
         if any(str(item.get("name", "")).strip().lower() == name.lower()
                for item in existing_items):
             raise HTTPException(status_code=400, detail=f"模型 '{name}' 已存在")
-
-        # 只保存必要的 4 个字段，其他参数在测试时由用户动态指定
-        new_item = {
-            "name": name,
-            "endpoint": endpoint,
-            "api_key": api_key,
-            "api_version": api_version,
-        }
-
         existing_items.append(new_item)
-        save_model_config_items(existing_items)
+
+    try:
+        # 检查与写入在同一把锁内完成，写临时文件后原子替换
+        model_registry.update(append_item)
 
         return {"detail": f"模型 '{name}' 已保存"}
 
@@ -176,9 +211,18 @@ async def add_model_config(request: ModelConfigRequest):
 @app.post("/api/test", response_model=TestResponse)
 async def start_test(request: TestRequest):
     """启动测试任务"""
+    if calibration_lock.locked():
+        raise HTTPException(status_code=409, detail="正在校准压测工具开销，请稍后再试")
     try:
-        # 加载模型配置
-        all_configs = load_model_configs()
+        # 取一份配置快照，测试期间配置文件的修改不影响本次运行
+        registry_snapshot = model_registry.snapshot()
+        all_configs = registry_snapshot.configs
+        
+        corpus_path = resolve_corpus(request)
+        if corpus_path is None and not request.question:
+            raise HTTPException(status_code=400, detail="请填写测试问题或指定语料文件")
+        if request.prompt_bands and request.prompt_bands != sorted(set(request.prompt_bands)):
+            raise HTTPException(status_code=400, detail="prompt_bands 必须是严格升序的正整数")
         
         # 验证请求的模型是否存在
         selected_configs = []
@@ -197,20 +241,68 @@ async def start_test(request: TestRequest):
                 concurrency=request.concurrency or cfg.concurrency,
                 iterations=request.iterations or cfg.iterations,
                 stream=request.stream if request.stream is not None else cfg.stream,
+                duration_s=request.duration_s,
+                rps=request.rps,
+                arrival=request.arrival,
+                seed=request.seed,
+                max_retries=request.max_retries if request.max_retries is not None else settings.REQUEST_MAX_RETRIES,
+                retry_backoff_ms=settings.RETRY_BACKOFF_MS,
+                retry_max_backoff_ms=settings.RETRY_MAX_BACKOFF_MS,
+                # 按配额的一定比例限流，留出余量，测的是配额内的真实服务耗时
+                rpm_limit=cfg.rpm_limit * settings.RATE_LIMIT_UTILIZATION if cfg.rpm_limit else None,
+                tpm_limit=cfg.tpm_limit * settings.RATE_LIMIT_UTILIZATION if cfg.tpm_limit else None,
+                corpus_path=corpus_path,
+                prompt_band_edges=request.prompt_bands,
+                warmup_requests=request.warmup_requests,
+                warmup_s=request.warmup_seconds,
             )
             selected_configs.append(cfg)
         
         if not selected_configs:
             raise HTTPException(status_code=400, detail="至少选择一个模型")
         
+        profile = build_load_profile(request)
+        slo = None
+        if request.slo:
+            if profile is not None:
+                raise HTTPException(status_code=400, detail="slo 不能与 stages/ramp 同时使用")
+            if request.warmup_requests or request.warmup_seconds or request.steady_state:
+                # 探测点的判定使用全部请求，预热排除只会让统计行与判定不一致
+                raise HTTPException(status_code=400, detail="slo 不能与预热或稳态检测同时使用")
+            try:
+                slo = SLO(request.slo.limits, request.slo.max_error_rate)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        
+        steady_state_window = resolve_steady_state_window(request)
+        
+        # 分布式运行：选定在线 agent
+        agents = None
+        if request.agents:
+            try:
+                agents = agent_coordinator.resolve(request.agents)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            if not agents:
+                raise HTTPException(status_code=400, detail="没有在线且空闲的 agent")
+        
         # 创建任务
-        task_id = task_manager.create_task()
+        task_id = task_manager.create_task(queue_policy=request.queue_policy)
         task_manager.update_status(task_id, "running")
         
-        # 后台启动测试
-        asyncio.create_task(
-            run_test_background(task_id, selected_configs, request.question)
+        # 后台启动测试，保存句柄以便取消
+        handle = asyncio.create_task(
+            run_test_background(
+                task_id, selected_configs, request.question, profile,
+                config_version=registry_snapshot.version,
+                processes=request.processes or settings.LOAD_PROCESSES,
+                agents=agents,
+                slo=slo,
+                search=request.slo,
+                steady_state_window=steady_state_window,
+            )
         )
+        task_manager.attach_handle(task_id, handle)
         
         return TestResponse(
             task_id=task_id,
@@ -224,71 +316,211 @@ async def start_test(request: TestRequest):
         raise HTTPException(status_code=500, detail=f"启动测试失败: {str(e)}")
 
 
+def resolve_corpus(request: TestRequest) -> Optional[str]:
+    """校验语料文件（必须位于 CORPUS_DIR 内）并返回绝对路径，未指定时返回 None"""
+    if not request.corpus:
+        return None
+    corpus_dir = settings.corpus_dir_path.resolve()
+    path = (corpus_dir / request.corpus).resolve()
+    if not path.is_relative_to(corpus_dir):
+        raise HTTPException(status_code=400, detail="语料文件必须位于语料目录内")
+    try:
+        # 只读开头一条，尽早发现格式错误；运行时再流式读取
+        PromptCorpus(path, buffer_size=1).next()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"语料文件不存在: {request.corpus}")
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"语料文件无效: {e}")
+    return str(path)
+
+
+def resolve_steady_state_window(request: TestRequest) -> int:
+    """稳态检测窗口（0 表示不检测）：未指定时只有配置了 STEADY_STATE_WINDOW 才检测；
+    显式指定了预热时默认不检测，容量搜索时始终不检测
+    """
+    if request.slo is not None:
+        return 0
+    enabled = request.steady_state
+    if enabled is None:
+        enabled = settings.STEADY_STATE_WINDOW > 0 and not (request.warmup_requests or request.warmup_seconds)
+    return (settings.STEADY_STATE_WINDOW or DEFAULT_WINDOW) if enabled else 0
+
+
+def build_load_profile(request: TestRequest) -> Optional[LoadProfile]:
+    """根据请求构造负载曲线（未指定时返回 None）"""
+    if request.stages and request.ramp:
+        raise HTTPException(status_code=400, detail="stages 与 ramp 只能指定一个")
+    if request.ramp:
+        ramp = request.ramp
+        return LoadProfile.linear_rps_ramp(ramp.start_rps, ramp.end_rps, ramp.duration_s, ramp.steps)
+    if request.stages:
+        stages = []
+        for i, spec in enumerate(request.stages):
+            label = spec.label
+            if not label:
+                label = f"rps={spec.rps:g}" if spec.rps else f"c={spec.concurrency or request.concurrency}"
+            stages.append(LoadStage(
+                label=f"{i + 1}:{label}",
+                concurrency=spec.concurrency,
+                iterations=spec.iterations,
+                rps=spec.rps,
+                duration_s=spec.duration_s,
+            ))
+        return LoadProfile(stages=stages)
+    return None
+
+
 async def run_test_background(
     task_id: str, 
     configs: List[ModelConfig], 
-    question: str
+    question: str,
+    profile: Optional[LoadProfile] = None,
+    config_version: Optional[int] = None,
+    processes: int = 1,
+    agents: Optional[List[AgentInfo]] = None,
+    slo: Optional[SLO] = None,
+    search: Optional[SloSpec] = None,
+    steady_state_window: int = 0,
 ):
     """后台运行测试任务"""
+    archive: Optional[RecordArchiveWriter] = None
+    coalescer: Optional[ChunkCoalescer] = None
+    snapshot_task: Optional[asyncio.Task] = None
     try:
-        tester = LatencyTester()
+        def make_tester():
+            if agents:
+                # 负载拆到远程 agent，记录按各自的时钟偏移换算到本机时间轴后汇总
+                return DistributedTester(agent_coordinator, agents, request_timeout=settings.REQUEST_TIMEOUT)
+            if processes > 1:
+                # 每个子进程有独立的事件循环和连接池，记录经管道发回后在此汇总
+                return ProcessShardedTester(processes, request_timeout=settings.REQUEST_TIMEOUT)
+            return LatencyTester(request_timeout=settings.REQUEST_TIMEOUT, pool=http_pool)
         
-        # 用于存储所有记录
-        all_records: List[RequestRecord] = []
-        records_lock = asyncio.Lock()
+        if slo is not None:
+            # 容量搜索：每个探测点用新的 tester，超出预算时可单独中止
+            tester = CapacitySearch(
+                make_tester,
+                slo,
+                mode=search.mode,
+                start=search.start,
+                max_load=search.max_load,
+                precision=search.precision,
+                probe_iterations=search.probe_iterations,
+                probe_duration_s=search.probe_duration_s,
+            )
+        else:
+            tester = make_tester()
+        # 取消时停止调度并中止在途请求，已完成的记录照常汇总
+        task_manager.set_cancel_callback(task_id, tester.cancel)
         
-        # 定义流式回调
-        def stream_callback(model_name: str, request_id: int, chunk: str):
-            """流式回调函数"""
-            data = {
-                "model": model_name,
-                "chunk": chunk,
-                "request_id": request_id,
-                "status": "streaming"
-            }
-            # 异步推送数据
-            asyncio.create_task(task_manager.push_data(task_id, data))
+        # 记录完成即滚入聚合器（分位数 sketch + 时间分桶），不保留原始记录，内存恒定；
+        # 预热请求单独统计，不计入主统计
+        aggregator = RunAggregator(
+            bucket_seconds=settings.TIMELINE_BUCKET_SECONDS,
+            max_buckets=settings.TIMELINE_MAX_BUCKETS,
+            steady_state_window=steady_state_window,
+        )
+        
+        # 流式增量按 (model, request_id) 合并后定时推送，避免每个 token 一个任务；
+        # 待推送缓冲有上限，达到后按任务的队列策略等待或丢弃
+        events = task_manager.get_task(task_id).events
+        coalescer = ChunkCoalescer(
+            task_id,
+            task_manager.push_data,
+            flush_interval_ms=settings.STREAM_FLUSH_INTERVAL_MS,
+            max_bytes=settings.STREAM_FLUSH_MAX_BYTES,
+            policy=events.policy,
+            max_buffer_bytes=settings.STREAM_BUFFER_MAX_BYTES,
+            max_buffer_events=events.ring_size,
+        )
+        coalescer.start()
+        
+        # 原始请求记录按列流式写入归档，供事后重算分位数、分析离群值
+        if settings.RECORD_ARCHIVE_ENABLED:
+            archive = RecordArchiveWriter(
+                history_manager.new_archive_dir(task_id),
+                origin=aggregator.origin,
+            )
+        
+        def on_record(record: RequestRecord):
+            """请求完成回调：更新统计、归档原始记录并推送最终响应文本"""
+            aggregator.add(record)
+            if archive is not None:
+                archive.append(record)
+            if record.response_text:
+                coalescer.add_event({
+                    "type": "chunk",
+                    "model": record.model,
+                    "chunk": record.response_text,
+                    "request_id": record.request_id,
+                    "status": "completed",
+                    "duration": record.latency_ms,
+                })
+        
+        # 流式回调：只做缓冲，由 coalescer 统一推送（block 策略下缓冲满时等待）
+        stream_callback = coalescer.stream_callback
+        
+        async def publish_summary(config: ModelConfig):
+            """推送该模型（分阶段时为已完成阶段）的统计数据"""
+            summary_data = aggregator.summary_rows(config.name)
+            if summary_data:
+                # 先推送已缓冲的增量，保证统计排在该模型的输出之后
+                await coalescer.flush()
+                event = {
+                    "type": "summary",
+                    "data": summary_data,
+                    "model_name": config.name,
+                    "is_partial": True
+                }
+                band_rows = aggregator.band_rows(config.name)
+                if band_rows:
+                    event["prompt_bands"] = band_rows
+                warmup_rows = aggregator.warmup_rows(config.name)
+                if warmup_rows:
+                    event["warmup"] = warmup_rows
+                await task_manager.push_data(task_id, event)
+                print(f"模型 {config.name} 统计已推送")
         
         # 为每个模型创建独立任务，实现真正的并发
         async def run_single_model(config: ModelConfig):
             """运行单个模型并在完成后立即推送统计"""
             try:
-                # 运行该模型的测试
-                records: List[RequestRecord] = await tester.run_models(
-                    [config], 
-                    question=question, 
-                    stream_callback=stream_callback
-                )
-                
-                # 线程安全地保存记录
-                async with records_lock:
-                    all_records.extend(records)
-                
-                # 将最终响应文本推送给前端
-                for r in records:
-                    if r.response_text:
+                if slo is not None:
+                    # 逐个探测点运行，每个点结束即推送该点的统计行和判定结果
+                    async for probe in tester.iter_search(
+                        config, question,
+                        stream_callback=stream_callback,
+                        record_callback=on_record,
+                    ):
+                        await publish_summary(config)
                         await task_manager.push_data(task_id, {
-                            "model": r.model,
-                            "chunk": r.response_text,
-                            "request_id": r.request_id,
-                            "status": "completed",
-                            "duration": r.latency_ms,
+                            "type": "capacity_probe",
+                            "model_name": config.name,
+                            "load": probe.load,
+                            "label": probe.label,
+                            "passed": probe.passed,
+                            "aborted": probe.aborted,
+                            "violations": probe.violations,
                         })
-                
-                # 立即计算并推送该模型的统计数据
-                df = records_to_dataframe(records)
-                if len(df) > 0:
-                    summary = summarize_latency(df)
-                    summary_data = summary.to_dict(orient="records")
-                    
-                    # 推送该模型的统计数据
-                    await task_manager.push_data(task_id, {
-                        "type": "summary",
-                        "data": summary_data,
-                        "model_name": config.name,
-                        "is_partial": True
-                    })
-                    print(f"模型 {config.name} 统计已推送")
+                elif profile is None:
+                    # 运行该模型的测试
+                    await tester.run_models(
+                        [config], 
+                        question=question, 
+                        stream_callback=stream_callback,
+                        record_callback=on_record,
+                        keep_records=False,
+                    )
+                    await publish_summary(config)
+                else:
+                    # 分阶段运行，每个阶段结束即推送该阶段的统计行
+                    async for _ in iter_profile(
+                        tester, [config], profile, question=question,
+                        stream_callback=stream_callback,
+                        record_callback=on_record,
+                        keep_records=False,
+                    ):
+                        await publish_summary(config)
                     
             except Exception as e:
                 print(f"模型 {config.name} 测试失败: {e}")
@@ -313,31 +545,96 @@ async def run_test_background(
                     "error": str(e)
                 })
         
-        # 并发启动所有模型的测试
-        tasks = [asyncio.create_task(run_single_model(config)) for config in configs]
-        await asyncio.gather(*tasks, return_exceptions=True)
+        async def push_snapshots():
+            """长时间运行时周期推送累计统计快照"""
+            while True:
+                await asyncio.sleep(settings.SOAK_SNAPSHOT_INTERVAL)
+                snapshot = aggregator.snapshot()
+                await task_manager.push_data(task_id, {
+                    "type": "summary",
+                    "data": snapshot["summary"],
+                    "is_partial": True,
+                    "elapsed_s": snapshot["elapsed_s"],
+                })
+        
+        snapshot_task = asyncio.create_task(push_snapshots())
+        
+        if slo is not None:
+            # 容量搜索逐个模型进行，避免模型之间争用客户端资源影响判定
+            for config in configs:
+                await run_single_model(config)
+                if tester.cancelled:
+                    break
+        else:
+            # 并发启动所有模型的测试
+            tasks = [asyncio.create_task(run_single_model(config)) for config in configs]
+            await asyncio.gather(*tasks, return_exceptions=True)
+        # 统计推送前先停止快照并推送剩余增量，保证顺序；异常路径由 finally 兜底
+        snapshot_task.cancel()
+        await coalescer.stop()
+        cancelled = tester.cancelled
+        if cancelled:
+            print(f"任务 {task_id} 已取消，汇总已完成的请求")
+        archive_dir = archive.close() if archive is not None else None
         
         # 计算完整的统计数据（用于保存历史记录）
-        df = records_to_dataframe(all_records)
-        print(f"所有模型测试完成，总记录数: {len(df)}")
+        summary_data = aggregator.summary_rows()
+        total_records = aggregator.total_requests
+        calibration_info = calibration_report(total_records, time.perf_counter() - aggregator.origin)
+        capacity = (
+            {name: result.to_dict() for name, result in tester.results.items()}
+            if slo is not None else None
+        )
+        print(f"所有模型测试完成，总记录数: {total_records}")
         
-        if len(df) > 0:
-            summary = summarize_latency(df)
-            summary_data = summary.to_dict(orient="records")
+        if total_records > 0:
             print("完整统计数据:", summary_data)
             
             # 保存到历史记录
             try:
+                corpus_path = configs[0].corpus_path if configs else None
                 test_config = {
-                    "question": question or "未指定问题",
+                    # 语料模式下以语料文件名代替问题，便于按语料查看趋势
+                    "question": question or (f"语料 {Path(corpus_path).name}" if corpus_path else "未指定问题"),
                     "models": [config.name for config in configs],
                     "concurrency": configs[0].concurrency if configs else 1,
                     "iterations": configs[0].iterations if configs else 1,
+                    "duration_s": configs[0].duration_s if configs else None,
                     "max_tokens": configs[0].max_tokens if configs else 1000,
                     "temperature": configs[0].temperature if configs else 0.7,
                     "stream": configs[0].stream if configs else False,
+                    "rps": configs[0].rps if configs else None,
+                    "arrival": configs[0].arrival if configs else "constant",
+                    "max_retries": configs[0].max_retries if configs else 0,
+                    "rate_limits": {
+                        config.name: {"rpm": config.rpm_limit, "tpm": config.tpm_limit}
+                        for config in configs if config.rpm_limit or config.tpm_limit
+                    } or None,
+                    "stages": profile.to_dict() if profile else None,
+                    "cancelled": cancelled,
+                    "config_version": config_version,
+                    "processes": processes,
+                    "agents": tester.agent_report() if isinstance(tester, DistributedTester) else None,
+                    "calibration": calibration_info,
+                    "slo": {**slo.to_dict(), **search.model_dump(exclude={"limits", "max_error_rate"})} if slo else None,
+                    "capacity": capacity,
+                    "corpus": Path(corpus_path).name if corpus_path else None,
+                    "prompt_bands": aggregator.band_rows() or None,
+                    "warmup": {
+                        "requests": configs[0].warmup_requests if configs else 0,
+                        "seconds": configs[0].warmup_s if configs else 0.0,
+                        "steady_state_window": steady_state_window,
+                        "rows": aggregator.warmup_rows(),
+                    },
                 }
-                record_id = history_manager.add_record(summary_data, test_config)
+                record_id = await asyncio.to_thread(
+                    history_manager.add_record,
+                    summary_data,
+                    test_config,
+                    timeline=aggregator.timeline(),
+                    archive=archive_dir,
+                    sketches=aggregator.sketches(),
+                )
                 print(f"历史记录已保存，ID: {record_id}")
             except Exception as e:
                 print(f"保存历史记录失败: {e}")
@@ -346,65 +643,123 @@ async def run_test_background(
             await task_manager.push_data(task_id, {
                 "type": "summary_complete",
                 "data": summary_data,
-                "is_partial": False
+                "is_partial": False,
+                "status": "cancelled" if cancelled else "completed",
+                "calibration": calibration_info,
+                "capacity": capacity,
+                "prompt_bands": aggregator.band_rows() or None,
+                "warmup": aggregator.warmup_rows() or None,
             })
         else:
             print("没有数据需要统计")
+            if archive_dir is not None:
+                shutil.rmtree(archive_dir, ignore_errors=True)
         
-        await task_manager.push_complete(task_id)
+        await task_manager.push_complete(task_id, "cancelled" if cancelled else "completed")
     
+    except asyncio.CancelledError:
+        # 还未登记取消回调时直接取消了后台任务
+        await task_manager.push_complete(task_id, "cancelled")
+        raise
     except Exception as e:
         await task_manager.push_error(task_id, str(e))
+    finally:
+        # 运行出错或被取消时也要停掉快照与合并推送协程，否则会对已结束的任务一直运行
+        if snapshot_task is not None:
+            snapshot_task.cancel()
+        if coalescer is not None:
+            await coalescer.stop()
+        if archive is not None:
+            archive.close()
+
+
+@app.post("/api/test/{task_id}/cancel", response_model=TestResponse)
+async def cancel_test(task_id: str):
+    """取消运行中的测试：停止发请求、中止在途请求，并推送已完成部分的统计"""
+    task = task_manager.get_task(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if not task_manager.cancel_task(task_id):
+        return TestResponse(task_id=task_id, status=task.status, message="任务未在运行，无需取消")
+    return TestResponse(task_id=task_id, status=task.status, message="已发起取消，正在汇总已完成的请求")
+
+
+# 以独立 SSE 事件推送的统计类事件（前端按事件名分别监听）
+STATS_EVENT_TYPES = ("summary", "summary_complete", "capacity_probe")
 
 
 @app.get("/api/stream/{task_id}")
-async def stream_results(task_id: str):
-    """SSE 流式推送测试结果"""
+async def stream_results(
+    task_id: str,
+    last_event_id: Optional[str] = Header(None),
+    since: Optional[int] = None,
+):
+    """SSE 流式推送测试结果
+    
+    每个订阅者独立读取任务事件日志，可多人同时观看同一任务。事件带有 id，
+    浏览器断线重连时会自动携带 Last-Event-ID 从断点续传；也可通过 since
+    参数指定起点，默认从头回放。
+    """
     task = task_manager.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
     
+    start_after = since or 0
+    if last_event_id:
+        try:
+            start_after = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Last-Event-ID 格式错误")
+    
     async def event_generator():
         """事件生成器"""
+        subscriber = await task.events.subscribe(start_after)
+        task.last_consumer_seen = datetime.now()
         try:
             while True:
-                # 从队列中获取数据
-                data = await task.queue.get()
+                # 从事件日志读取下一条
+                seq, data = await subscriber.get()
                 
                 # None 表示完成信号
                 if data is None:
                     yield {
+                        "id": seq,
                         "event": "complete",
-                        "data": json.dumps({"status": "completed"})
+                        "data": json.dumps({"status": task.status})
                     }
                     break
                 
                 # 检查是否为错误
                 if "error" in data:
                     yield {
+                        "id": seq,
                         "event": "error",
                         "data": json.dumps({"error": data["error"]})
                     }
                     break
                 
-                # 检查是否为统计摘要
-                if data.get("type") == "summary":
+                # 合并后的流式增量（一个事件包含多个请求的增量）
+                if data.get("type") == "chunks":
                     yield {
-                        "event": "summary",
-                        "data": json.dumps(data["data"])
+                        "id": seq,
+                        "event": "chunks",
+                        "data": json.dumps(data["frames"], ensure_ascii=False, separators=(",", ":"))
                     }
                     continue
                 
-                # 检查是否为完整统计摘要
-                if data.get("type") == "summary_complete":
+                # 统计摘要、完整统计摘要与容量搜索探测点：整条事件原样推送，
+                # 统计行在 data 字段，校准、容量、提示词区间、预热等附加信息一并送达
+                if data.get("type") in STATS_EVENT_TYPES:
                     yield {
-                        "event": "summary_complete",
-                        "data": json.dumps(data["data"])
+                        "id": seq,
+                        "event": data["type"],
+                        "data": json.dumps(data, ensure_ascii=False)
                     }
                     continue
                 
                 # 正常的流式数据块
                 yield {
+                    "id": seq,
                     "event": "chunk",
                     "data": json.dumps(data)
                 }
@@ -417,8 +772,13 @@ async def stream_results(task_id: str):
                 "event": "error",
                 "data": json.dumps({"error": str(e)})
             }
+        finally:
+            # 心跳写入失败或客户端关闭都会走到这里
+            await task.events.unsubscribe(subscriber)
+            task.last_consumer_seen = datetime.now()
     
-    return EventSourceResponse(event_generator())
+    # 定期发送心跳：写入失败即可发现已断开的消费者
+    return EventSourceResponse(event_generator(), ping=settings.SSE_PING_INTERVAL)
 
 
 @app.get("/api/health")
@@ -429,29 +789,170 @@ async def health_check():
         "active_tasks": len([
             t for t in task_manager._tasks.values() 
             if t.status == "running"
-        ])
+        ]),
+        "stored_events": sum(t.events.qsize() for t in task_manager._tasks.values()),
+        "dropped_events": sum(t.events.dropped for t in task_manager._tasks.values()),
+        "subscribers": sum(t.events.consumers for t in task_manager._tasks.values()),
     }
 
 
+def check_agent_token(token: Optional[str]):
+    if settings.AGENT_TOKEN and token != settings.AGENT_TOKEN:
+        raise HTTPException(status_code=401, detail="agent 令牌无效")
+
+
+def get_agent_or_404(agent_id: str) -> AgentInfo:
+    agent = agent_coordinator.get(agent_id)
+    if agent is None:
+        raise HTTPException(status_code=404, detail="agent 未注册")
+    return agent
+
+
+@app.get("/api/agents")
+async def list_agents():
+    """列出已注册的分布式压测 agent"""
+    return {"status": "success", "agents": agent_coordinator.list_agents()}
+
+
+@app.get("/api/agents/clock")
+async def agent_clock():
+    """agent 估计时钟偏移用：返回本进程的 perf_counter"""
+    return {"perf_counter": time.perf_counter()}
+
+
+@app.post("/api/agents/register")
+async def register_agent(request: AgentRegisterRequest, x_agent_token: Optional[str] = Header(None)):
+    """注册 agent"""
+    check_agent_token(x_agent_token)
+    agent = agent_coordinator.register(request.name, request.processes)
+    print(f"agent {agent.name} 已注册（{agent.processes} 个进程）")
+    return {"agent_id": agent.agent_id, "poll_timeout_s": agent_coordinator.poll_timeout_s}
+
+
+@app.get("/api/agents/{agent_id}/work")
+async def poll_agent_work(agent_id: str, x_agent_token: Optional[str] = Header(None)):
+    """长轮询领取负载分片，超时返回空"""
+    check_agent_token(x_agent_token)
+    agent = get_agent_or_404(agent_id)
+    agent_coordinator.fail_abandoned(agent)
+    assignment = await agent_coordinator.next_assignment(agent)
+    if assignment is None:
+        return {"assignment": None}
+    return {"assignment": {"assignment_id": assignment.assignment_id, "payload": assignment.payload}}
+
+
+@app.post("/api/agents/{agent_id}/assignments/{assignment_id}/records")
+async def upload_agent_records(
+    agent_id: str,
+    assignment_id: str,
+    request: Request,
+    clock_offset_s: float,
+    rtt_ms: Optional[float] = None,
+    x_agent_token: Optional[str] = Header(None),
+):
+    """接收 agent 上传的记录批次（record_codec 编码），返回取消标志"""
+    check_agent_token(x_agent_token)
+    agent = get_agent_or_404(agent_id)
+    try:
+        cancel = agent_coordinator.ingest(agent, assignment_id, await request.body(), clock_offset_s, rtt_ms)
+    except KeyError:
+        # 分片已结束（例如任务被放弃），让 agent 停止
+        return {"cancel": True}
+    return {"cancel": cancel}
+
+
+@app.post("/api/agents/{agent_id}/assignments/{assignment_id}/done")
+async def finish_agent_assignment(
+    agent_id: str,
+    assignment_id: str,
+    request: AgentDoneRequest,
+    x_agent_token: Optional[str] = Header(None),
+):
+    """agent 分片完成或出错"""
+    check_agent_token(x_agent_token)
+    agent = get_agent_or_404(agent_id)
+    try:
+        agent_coordinator.finish(agent, assignment_id, request.error)
+    except KeyError:
+        pass
+    return {"status": "success"}
+
+
+@app.get("/api/calibration")
+async def get_calibration():
+    """获取最近一次压测工具开销校准结果"""
+    if calibration is None:
+        raise HTTPException(status_code=404, detail="尚未校准，请先 POST /api/calibration")
+    return {"status": "success", "calibration": calibration.to_dict()}
+
+
+@app.post("/api/calibration")
+async def run_calibration(tokens: int = 50, requests: int = 200, max_concurrency: int = 1024):
+    """对本地零延迟模拟服务运行校准（会占满事件循环，运行中的测试会拒绝校准）"""
+    global calibration
+    if any(t.status in ("running", "cancelling") for t in task_manager._tasks.values()):
+        raise HTTPException(status_code=409, detail="有测试正在运行，校准结果会被干扰")
+    if calibration_lock.locked():
+        raise HTTPException(status_code=409, detail="校准正在进行中")
+    async with calibration_lock:
+        levels = [c for c in (1, 4, 16, 64, 256, 1024) if c <= max_concurrency] or [1]
+        result = await calibrate(levels=levels, tokens=tokens, requests_per_level=requests, log=False)
+        save_calibration(result, settings.calibration_path)
+        calibration = result
+    return {"status": "success", "calibration": result.to_dict()}
+
+
 @app.get("/api/history")
-async def get_history(limit: int = 50):
-    """获取历史记录列表"""
+async def get_history(limit: int = 50, offset: int = 0):
+    """获取历史记录列表（按时间倒序分页）"""
     try:
-        records = history_manager.get_all_records(limit=limit)
+        # SQLite 调用是阻塞的，放到线程池执行，不占用事件循环（HistoryManager 内部加锁）
+        records = await asyncio.to_thread(history_manager.get_all_records, limit=limit, offset=offset)
+        total = await asyncio.to_thread(history_manager.count)
         return {
             "status": "success",
             "count": len(records),
+            "total": total,
             "records": records
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取历史记录失败: {str(e)}")
 
 
+@app.get("/api/trends")
+async def get_trends(
+    model: Optional[str] = None,
+    question: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    granularity: str = "run",
+):
+    """按模型返回 p50/p95/首 token/错误率 等指标随时间的变化（每次运行或每天一个点）"""
+    if granularity not in ("run", "day"):
+        raise HTTPException(status_code=400, detail="granularity 只能是 run 或 day")
+    try:
+        series = await asyncio.to_thread(
+            history_manager.get_trends,
+            model=model,
+            question=question,
+            start_date=start_date,
+            end_date=end_date,
+            granularity=granularity,
+        )
+        return {
+            "status": "success",
+            "granularity": granularity,
+            "series": series
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取趋势数据失败: {str(e)}")
+
+
 @app.get("/api/history/{record_id}")
 async def get_history_detail(record_id: str):
     """获取历史记录详情"""
     try:
-        record = history_manager.get_record(record_id)
+        record = await asyncio.to_thread(history_manager.get_record, record_id)
         if not record:
             raise HTTPException(status_code=404, detail="记录不存在")
         return {
@@ -464,11 +965,36 @@ async def get_history_detail(record_id: str):
         raise HTTPException(status_code=500, detail=f"获取记录详情失败: {str(e)}")
 
 
+@app.get("/api/history/{record_id}/records")
+async def get_history_records(
+    record_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, gt=0, le=1000),
+):
+    """分页读取该次运行的原始请求记录（列式归档按 memmap 加载，只拷贝请求的行）"""
+    record = await asyncio.to_thread(history_manager.get_record, record_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="记录不存在")
+    archive_dir = history_manager.archive_path(record)
+    if archive_dir is None or not archive_dir.exists():
+        raise HTTPException(status_code=404, detail="该记录没有原始请求归档")
+    
+    archive = RecordArchive(archive_dir)
+    df = archive.to_dataframe(start=offset, stop=offset + limit)
+    rows = json.loads(df.to_json(orient="records"))
+    return {
+        "status": "success",
+        "total": len(archive),
+        "offset": offset,
+        "records": rows,
+    }
+
+
 @app.delete("/api/history/{record_id}")
 async def delete_history(record_id: str):
     """删除历史记录"""
     try:
-        success = history_manager.delete_record(record_id)
+        success = await asyncio.to_thread(history_manager.delete_record, record_id)
         if not success:
             raise HTTPException(status_code=404, detail="记录不存在")
         return {
@@ -485,7 +1011,7 @@ async def delete_history(record_id: str):
 async def clear_history():
     """清空所有历史记录"""
     try:
-        history_manager.clear_all()
+        await asyncio.to_thread(history_manager.clear_all)
         return {
             "status": "success",
             "message": "所有历史记录已清空"
@@ -0,0 +1,145 @@
+"""模型配置注册表（内存缓存 + 文件变更自动重载）"""
+import os
+import tempfile
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+import yaml
+
+from tester.latency_tester import ModelConfig
+
+
+@dataclass(frozen=True)
+class RegistrySnapshot:
+    """某一版本的模型配置（只读）
+
+    测试开始时取一份快照，之后配置文件被修改也不会影响正在运行的测试。
+    """
+    version: int
+    items: Tuple[Mapping[str, Any], ...]
+    configs: Mapping[str, ModelConfig]
+
+    def get(self, name: str) -> Optional[ModelConfig]:
+        return self.configs.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.configs
+
+
+def _freeze_items(items: List[Dict[str, Any]]) -> Tuple[Mapping[str, Any], ...]:
+    return tuple(MappingProxyType(dict(item)) for item in items)
+
+
+def _item_to_config(item: Mapping[str, Any]) -> Optional[ModelConfig]:
+    name = str(item.get("name", "")).strip()
+    if not name:
+        return None
+    return ModelConfig(
+        name=name,
+        endpoint=item["endpoint"],
+        api_key=item["api_key"],
+        api_version=item["api_version"],
+        prompt="Hello, test",  # 默认提示词
+        max_tokens=item.get("max_tokens", 1000),
+        temperature=item.get("temperature", 0.7),
+        concurrency=item.get("concurrency", 1),
+        iterations=item.get("iterations", 1),
+        stream=item.get("stream", False),
+        # 部署配额（每分钟请求数 / token 数），配置后在客户端限流
+        rpm_limit=item.get("rpm"),
+        tpm_limit=item.get("tpm"),
+    )
+
+
+class ModelRegistry:
+    """models.yaml 的内存缓存
+
+    读取时只 stat 一次文件，(mtime, size) 未变化就直接返回缓存的快照，
+    文件被外部修改后下一次读取自动重新解析。写入先写同目录临时文件再
+    os.replace 原子替换，并直接用写入的内容更新缓存。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._signature: Optional[Tuple[int, int]] = None
+        self._snapshot = RegistrySnapshot(version=0, items=(), configs=MappingProxyType({}))
+
+    def _stat_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _publish(self, items: List[Dict[str, Any]], signature: Optional[Tuple[int, int]]):
+        """生成新版本快照（调用方持有锁）"""
+        configs = {}
+        for item in items:
+            cfg = _item_to_config(item)
+            if cfg is not None:
+                configs[cfg.name] = cfg
+        self._snapshot = RegistrySnapshot(
+            version=self._snapshot.version + 1,
+            items=_freeze_items(items),
+            configs=MappingProxyType(configs),
+        )
+        self._signature = signature
+
+    def _read_file(self) -> List[Dict[str, Any]]:
+        if not self.path.exists():
+            return []
+        with self.path.open("r", encoding="utf-8") as f:
+            raw = yaml.safe_load(f) or {}
+        return raw.get("models", [])
+
+    def snapshot(self) -> RegistrySnapshot:
+        """返回当前配置快照，文件有变化时先重新加载"""
+        signature = self._stat_signature()
+        if signature == self._signature and self._snapshot.version:
+            return self._snapshot
+        with self._lock:
+            signature = self._stat_signature()
+            if signature != self._signature or not self._snapshot.version:
+                self._publish(self._read_file(), signature)
+            return self._snapshot
+
+    def update(self, mutate: Callable[[List[Dict[str, Any]]], None]) -> RegistrySnapshot:
+        """基于最新配置修改并原子写回
+
+        Args:
+            mutate: 接收可修改的模型列表（原始字典），原地修改
+
+        Returns:
+            写入后的新快照
+        """
+        with self._lock:
+            # 以磁盘上的最新内容为准，避免覆盖外部修改
+            if self._stat_signature() != self._signature:
+                self._publish(self._read_file(), self._stat_signature())
+            items = [dict(item) for item in self._snapshot.items]
+            mutate(items)
+            self._write_file(items)
+            self._publish(items, self._stat_signature())
+            return self._snapshot
+
+    def _write_file(self, items: List[Dict[str, Any]]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            prefix=f".{self.path.name}.", suffix=".tmp", dir=str(self.path.parent)
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                yaml.safe_dump({"models": items}, f, sort_keys=False, allow_unicode=True)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
@@ -1,5 +1,5 @@
 """数据模型定义（Pydantic）"""
-from typing import List, Optional, Literal
+from typing import Dict, List, Optional, Literal
 from pydantic import BaseModel, Field
 
 
@@ -9,23 +9,96 @@ class ModelConfigRequest(BaseModel):
     endpoint: str
     api_key: str
     api_version: str = "2024-02-01"
+    # 部署配额：配置后压测在客户端按配额限流，不触发服务端 429
+    rpm: Optional[int] = Field(None, gt=0, description="每分钟请求数配额")
+    tpm: Optional[int] = Field(None, gt=0, description="每分钟 token 数配额")
+
+
+class LoadStageSpec(BaseModel):
+    """负载曲线中的单个阶段（未填字段沿用测试参数）"""
+    label: Optional[str] = None
+    concurrency: Optional[int] = Field(None, ge=1)
+    iterations: Optional[int] = Field(None, ge=1)
+    rps: Optional[float] = Field(None, gt=0)
+    duration_s: Optional[float] = Field(None, gt=0)
+
+
+class RpsRampSpec(BaseModel):
+    """线性 RPS 爬坡"""
+    start_rps: float = Field(..., gt=0)
+    end_rps: float = Field(..., gt=0)
+    duration_s: float = Field(..., gt=0, description="爬坡总时长（秒）")
+    steps: int = Field(5, ge=1, description="离散阶段数")
+
+
+class SloSpec(BaseModel):
+    """容量搜索：在 SLO 约束下寻找最高负载"""
+    # 键为 pNN（总延迟）或 first_token_pNN（首 token 延迟），值为上限毫秒数
+    limits: Dict[str, float] = Field(..., min_length=1, description="如 {\"p95\": 8000, \"first_token_p95\": 1500}")
+    max_error_rate: float = Field(0.01, ge=0, le=1, description="允许的错误率")
+    mode: Literal["concurrency", "rps"] = Field("concurrency", description="搜索并发数或开环 RPS")
+    start: float = Field(1, gt=0, description="起始负载")
+    max_load: float = Field(1024, gt=0, description="负载上限")
+    precision: float = Field(0.1, gt=0, lt=1, description="二分停止的相对精度")
+    probe_iterations: int = Field(5, ge=1, description="并发模式下每个探测点的迭代次数")
+    probe_duration_s: float = Field(30, gt=0, description="RPS 模式下每个探测点的时长（秒）")
 
 
 class TestRequest(BaseModel):
     """测试请求"""
     models: List[str] = Field(..., description="要测试的模型名称列表")
-    question: str = Field(..., description="测试问题")
+    question: str = Field("", description="测试问题（指定 corpus 时可为空）")
     max_tokens: Optional[int] = 1000
     temperature: Optional[float] = 0.7
     concurrency: Optional[int] = 1
     iterations: Optional[int] = 1
+    # 定时模式：运行指定秒数（设置后忽略 iterations，统计按时间分桶滚动，内存恒定）
+    duration_s: Optional[float] = Field(None, gt=0, le=7 * 24 * 3600, description="运行时长（秒）")
     stream: Optional[bool] = True
+    # 开环模式：指定 rps 后按到达率发请求，总请求数仍为 concurrency * iterations
+    rps: Optional[float] = Field(None, gt=0, description="目标每秒请求数（开环模式）")
+    arrival: Literal["constant", "poisson"] = Field("constant", description="到达间隔分布")
+    seed: Optional[int] = Field(None, description="泊松到达与语料抽样的随机种子")
+    # 负载曲线：stages 与 ramp 二选一，按顺序运行并分阶段统计
+    stages: Optional[List[LoadStageSpec]] = Field(None, description="阶梯负载，如并发 1→5→10→20")
+    ramp: Optional[RpsRampSpec] = Field(None, description="线性 RPS 爬坡")
+    # 订阅者落后于流式输出缓冲时的策略（默认取 TASK_QUEUE_POLICY 配置）
+    queue_policy: Optional[Literal["block", "drop_chunks", "latest"]] = None
+    # 压测进程数：大于 1 时把每个模型的并发拆到多个子进程（默认取 LOAD_PROCESSES 配置）
+    processes: Optional[int] = Field(None, ge=1, le=256, description="压测子进程数，1 表示在服务进程内运行")
+    # 分布式运行：负载按 agent 数拆分到远程 agent 上执行（设置后忽略 processes）
+    agents: Optional[List[str]] = Field(None, description="agent 名称列表，[\"*\"] 表示所有在线空闲的 agent")
+    # 429 / 5xx 重试次数（默认取 REQUEST_MAX_RETRIES 配置），退避期间仍占用并发槽位
+    max_retries: Optional[int] = Field(None, ge=0, le=20, description="失败请求的最大重试次数")
+    # 语料模式：每个请求从 CORPUS_DIR 下的文件按 seed 抽取提示词，代替固定的 question
+    corpus: Optional[str] = Field(None, description="语料文件名（.jsonl / .ndjson / .csv）")
+    prompt_bands: Optional[List[int]] = Field(
+        None, min_length=1, description="提示词长度区间边界（估计 token 数，升序），默认 256/1024/4096/16384"
+    )
+    # 容量搜索：设置后忽略 concurrency/iterations/rps/stages/ramp，逐个模型搜索满足 SLO 的最高负载
+    slo: Optional[SloSpec] = Field(None, description="延迟 SLO 与搜索参数")
+    # 预热：开头的请求单独统计，不计入主统计；分阶段运行时只作用于第一个阶段
+    warmup_requests: Optional[int] = Field(None, ge=0, description="前 N 个请求作为预热")
+    warmup_seconds: Optional[float] = Field(None, ge=0, description="开始后 N 秒内发出的请求作为预热")
+    # 稳态检测：用 MSER-5 自动截掉开头的预热段（默认不检测，除非配置了 STEADY_STATE_WINDOW；指定预热时不检测）
+    steady_state: Optional[bool] = Field(None, description="是否自动检测并排除预热段")
+
+
+class AgentRegisterRequest(BaseModel):
+    """agent 注册请求"""
+    name: str = Field(..., min_length=1, description="agent 名称，同名重新注册会替换旧登记")
+    processes: int = Field(1, ge=1, le=256, description="agent 本机压测进程数")
+
+
+class AgentDoneRequest(BaseModel):
+    """agent 分片完成通知"""
+    error: Optional[str] = None
 
 
 class TestResponse(BaseModel):
     """测试响应"""
     task_id: str
-    status: Literal["started", "running", "completed", "error"]
+    status: Literal["started", "created", "running", "cancelling", "completed", "cancelled", "error"]
     message: str
 
 
@@ -40,11 +113,24 @@ class StreamChunk(BaseModel):
 
 
 class ModelSummary(BaseModel):
-    """模型统计摘要"""
+    """模型统计摘要（分位数由流式 sketch 计算，相对误差约 1%）"""
     name: str
-    avg_latency: float
-    p50: float
-    p90: float
-    p99: float
+    avg_latency: Optional[float] = None
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+    p95: Optional[float] = None
+    p99: Optional[float] = None
+    p999: Optional[float] = None
+    first_token_p50: Optional[float] = None
+    first_token_p90: Optional[float] = None
+    first_token_p95: Optional[float] = None
+    first_token_p99: Optional[float] = None
+    first_token_p999: Optional[float] = None
+    # 流式 token 间隔：相邻两次带有输出的网络读取之间的间隔（一次读取可含多个增量块）
+    itl_p50: Optional[float] = None
+    itl_p95: Optional[float] = None
+    itl_p99: Optional[float] = None
+    tpot_avg: Optional[float] = None
+    decode_tps_avg: Optional[float] = None
     error_rate: float
     total_requests: int
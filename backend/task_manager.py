@@ -1,56 +1,293 @@
 """异步任务管理器"""
 import asyncio
 import uuid
-from typing import Dict, Optional, Callable
+from bisect import bisect_right, insort
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Callable, Set, Tuple
 from dataclasses import dataclass, field
 from datetime import datetime
 
+from backend.config import settings
+
+# 订阅者落后于流式输出环形缓冲时的处理策略
+QUEUE_POLICIES = ("block", "drop_chunks", "latest")
+
+
+# 流式输出类事件的 type：合并后的增量批次与单个请求的最终响应文本
+CHUNK_EVENT_TYPES = ("chunk", "chunks")
+
+
+def is_chunk_event(data: Any) -> bool:
+    """流式输出类事件（可丢弃/合并）；统计与控制事件（完成、错误）必须送达
+
+    只按 type 判断：统计事件也可能带 status 字段（如 summary_complete）。
+    """
+    return isinstance(data, dict) and data.get("type") in CHUNK_EVENT_TYPES
+
+
+def retain_key(data: Any) -> Optional[str]:
+    """可被新事件替换的保留事件（周期快照只需保留最新一条）"""
+    if isinstance(data, dict) and data.get("type") == "summary" and "elapsed_s" in data:
+        return "snapshot"
+    return None
+
+
+class EventSubscriber:
+    """任务事件日志的一个订阅者，各自维护读取位置"""
+    
+    def __init__(self, log: "TaskEventLog", cursor: int = 0):
+        self._log = log
+        # 已读取到的最大序号，即 SSE 的 Last-Event-ID
+        self.cursor = cursor
+        # latest 策略下收到快照后，跳过快照已包含的流式输出
+        self.skip_chunks_until = 0
+        self.missed = 0  # 因淘汰而跳过的事件数
+    
+    async def get(self) -> Tuple[int, Any]:
+        """等待并返回下一个事件 (seq, data)"""
+        return await self._log._next(self)
+
+
+class TaskEventLog:
+    """任务事件日志（多订阅者）
+    
+    每个事件分配递增序号 seq。统计与控制事件（摘要、完成、错误）全部保留，
+    周期快照只保留最新一条；流式输出事件放在容量为 ring_size 的环形缓冲中，
+    超出后淘汰最旧的。订阅者各自维护读取位置，互不争抢事件，断线后可凭 seq
+    （即 SSE 的 Last-Event-ID）续传。订阅者落后到环形缓冲之外时按策略处理：
+    - block: 生产者等待最慢的在线订阅者读走即将被淘汰的事件；
+      没有订阅者时直接淘汰，避免无人观看的任务永久卡住
+    - drop_chunks: 跳过已被淘汰的流式输出，只保证统计与控制事件送达
+    - latest: 跳过已被淘汰的流式输出，改为先收到一次进行中请求的完整文本快照
+    """
+    
+    def __init__(self, ring_size: int = 2000, policy: str = "drop_chunks"):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"未知的队列策略: {policy}")
+        self.ring_size = max(1, ring_size)
+        self.policy = policy
+        self.last_seq = 0
+        self.dropped = 0  # 在线订阅者尚未读到就被淘汰的流式输出事件数
+        self._events: Dict[int, Any] = {}
+        self._chunk_seqs: Deque[int] = deque()
+        self._retained_seqs: List[int] = []
+        self._replaceable: Dict[str, int] = {}
+        self._subscribers: Set[EventSubscriber] = set()
+        # latest 策略：进行中请求已输出的文本，(model, request_id) -> 片段列表
+        self._inflight: Dict[Tuple[str, int], List[str]] = {}
+        self._cond = asyncio.Condition()
+    
+    @property
+    def consumers(self) -> int:
+        return len(self._subscribers)
+    
+    def qsize(self) -> int:
+        """当前保存的事件数"""
+        return len(self._events)
+    
+    async def put(self, data: Any) -> int:
+        """追加事件，返回其序号"""
+        async with self._cond:
+            if is_chunk_event(data):
+                while len(self._chunk_seqs) >= self.ring_size:
+                    if self.policy == "block" and self._oldest_unread():
+                        await self._cond.wait_for(lambda: not self._oldest_unread())
+                        continue
+                    self._evict_oldest_chunk()
+                if self.policy == "latest":
+                    self._track_inflight(data)
+            seq = self._append(data)
+            self._cond.notify_all()
+            return seq
+    
+    def _append(self, data: Any) -> int:
+        self.last_seq += 1
+        seq = self.last_seq
+        self._events[seq] = data
+        if is_chunk_event(data):
+            self._chunk_seqs.append(seq)
+            return seq
+        key = retain_key(data)
+        if key is not None:
+            previous = self._replaceable.pop(key, None)
+            if previous is not None:
+                del self._events[previous]
+                self._retained_seqs.pop(bisect_right(self._retained_seqs, previous) - 1)
+            self._replaceable[key] = seq
+        insort(self._retained_seqs, seq)
+        return seq
+    
+    def _oldest_unread(self) -> bool:
+        """是否有在线订阅者尚未读到最旧的流式输出"""
+        oldest = self._chunk_seqs[0]
+        return any(sub.cursor < oldest for sub in self._subscribers)
+    
+    def _evict_oldest_chunk(self):
+        if self._oldest_unread():
+            self.dropped += 1
+        del self._events[self._chunk_seqs.popleft()]
+    
+    def _track_inflight(self, data: dict):
+        if data.get("type") == "chunks":
+            for frame in data["frames"]:
+                key = (frame.get("model"), frame.get("request_id"))
+                self._inflight.setdefault(key, []).append(frame.get("chunk", ""))
+        elif data.get("type") == "chunk":
+            # 完成事件携带完整文本，请求不再处于进行中
+            self._inflight.pop((data.get("model"), data.get("request_id")), None)
+    
+    def _snapshot_event(self) -> dict:
+        return {
+            "type": "chunks",
+            "frames": [
+                {"model": model, "request_id": request_id, "chunk": "".join(parts), "snapshot": True}
+                for (model, request_id), parts in self._inflight.items()
+            ],
+        }
+    
+    def _first_after(self, cursor: int) -> int:
+        """cursor 之后仍保存着的第一个事件序号（跳过已淘汰/替换的区间）"""
+        candidates = []
+        if self._chunk_seqs and self._chunk_seqs[-1] > cursor:
+            # 环形缓冲只淘汰最旧的：cursor 落在淘汰区间时下一个流式事件就是最旧的；
+            # 否则之后的流式事件都还在，只需跳过个别被替换掉的快照
+            seq = self._chunk_seqs[0]
+            if seq <= cursor:
+                seq = cursor + 1
+                while seq not in self._events:
+                    seq += 1
+            candidates.append(seq)
+        i = bisect_right(self._retained_seqs, cursor)
+        if i < len(self._retained_seqs):
+            candidates.append(self._retained_seqs[i])
+        return min(candidates)
+    
+    async def _next(self, sub: EventSubscriber) -> Tuple[int, Any]:
+        async with self._cond:
+            while True:
+                await self._cond.wait_for(lambda: self.last_seq > sub.cursor)
+                seq = sub.cursor + 1
+                if seq not in self._events:
+                    seq = self._first_after(sub.cursor)
+                    sub.missed += seq - sub.cursor - 1
+                    if self.policy == "latest" and self._inflight:
+                        # 先给出最新状态，再跳过快照已包含的流式输出
+                        sub.cursor = seq - 1
+                        sub.skip_chunks_until = self.last_seq
+                        self._cond.notify_all()
+                        return sub.cursor, self._snapshot_event()
+                data = self._events[seq]
+                sub.cursor = seq
+                # 唤醒被 block 策略阻塞的生产者
+                self._cond.notify_all()
+                if seq <= sub.skip_chunks_until and isinstance(data, dict) and data.get("type") == "chunks":
+                    continue
+                return seq, data
+    
+    async def subscribe(self, last_event_id: int = 0) -> EventSubscriber:
+        """新增订阅者，从 last_event_id 之后开始读取（0 表示从头回放）"""
+        async with self._cond:
+            sub = EventSubscriber(self, min(max(0, last_event_id), self.last_seq))
+            self._subscribers.add(sub)
+            self._cond.notify_all()
+            return sub
+    
+    async def unsubscribe(self, sub: EventSubscriber):
+        async with self._cond:
+            self._subscribers.discard(sub)
+            # 唤醒被 block 策略阻塞的生产者
+            self._cond.notify_all()
+
 
 @dataclass
 class TaskState:
     """任务状态"""
     task_id: str
     status: str = "pending"
-    queue: asyncio.Queue = field(default_factory=asyncio.Queue)
+    events: TaskEventLog = field(default_factory=TaskEventLog)
     created_at: datetime = field(default_factory=datetime.now)
     completed_at: Optional[datetime] = None
     error: Optional[str] = None
+    # 最近一次有订阅者连接或断开的时间，用于识别被遗弃的任务
+    last_consumer_seen: Optional[datetime] = None
+    # 后台运行任务的句柄，以及取消时调用的回调（停止调度、中止在途请求）
+    handle: Optional[asyncio.Task] = None
+    on_cancel: Optional[Callable[[], None]] = None
 
 
 class TaskManager:
     """全局任务管理器（内存存储）"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        queue_maxsize: int = 2000,
+        queue_policy: str = "drop_chunks",
+        cleanup_interval: float = 3600,
+        abandon_timeout: float = 0,
+    ):
         self._tasks: Dict[str, TaskState] = {}
-        self._cleanup_interval = 3600  # 1小时后清理已完成任务
+        self._cleanup_interval = cleanup_interval  # 已结束的任务保留的秒数
+        # 没有订阅者超过该秒数视为被遗弃（0 表示不检测）
+        self.abandon_timeout = abandon_timeout
+        self.queue_maxsize = queue_maxsize
+        self.queue_policy = queue_policy
     
-    def create_task(self) -> str:
+    def create_task(self, queue_policy: Optional[str] = None) -> str:
         """创建新任务并返回 task_id"""
         task_id = str(uuid.uuid4())
-        self._tasks[task_id] = TaskState(task_id=task_id, status="created")
+        events = TaskEventLog(self.queue_maxsize, queue_policy or self.queue_policy)
+        self._tasks[task_id] = TaskState(task_id=task_id, status="created", events=events)
         return task_id
     
     def get_task(self, task_id: str) -> Optional[TaskState]:
         """获取任务状态"""
         return self._tasks.get(task_id)
     
+    def attach_handle(self, task_id: str, handle: asyncio.Task):
+        """保存后台运行任务的句柄"""
+        task = self.get_task(task_id)
+        if task:
+            task.handle = handle
+    
+    def set_cancel_callback(self, task_id: str, callback: Callable[[], None]):
+        """登记取消回调（由后台任务在开始发请求前设置）"""
+        task = self.get_task(task_id)
+        if task:
+            task.on_cancel = callback
+    
+    def cancel_task(self, task_id: str) -> bool:
+        """取消运行中的任务，返回是否发起了取消
+        
+        优先调用任务登记的 on_cancel（停止调度并中止在途请求，后台任务随后
+        推送部分统计）；没有登记时直接取消后台任务句柄。
+        """
+        task = self.get_task(task_id)
+        if not task or task.status != "running":
+            return False
+        task.status = "cancelling"
+        if task.on_cancel is not None:
+            task.on_cancel()
+        elif task.handle is not None:
+            task.handle.cancel()
+        return True
+    
     def update_status(self, task_id: str, status: str):
         """更新任务状态"""
         if task_id in self._tasks:
             self._tasks[task_id].status = status
-            if status in ("completed", "error"):
+            if status in ("completed", "cancelled", "error"):
                 self._tasks[task_id].completed_at = datetime.now()
     
     async def push_data(self, task_id: str, data: dict):
-        """推送数据到任务队列"""
+        """追加事件到任务事件日志"""
         task = self.get_task(task_id)
         if task:
-            await task.queue.put(data)
+            await task.events.put(data)
     
-    async def push_complete(self, task_id: str):
-        """发送完成信号"""
+    async def push_complete(self, task_id: str, status: str = "completed"):
+        """发送完成信号（status 为 completed 或 cancelled）"""
+        self.update_status(task_id, status)
         await self.push_data(task_id, None)
-        self.update_status(task_id, "completed")
     
     async def push_error(self, task_id: str, error: str):
         """发送错误信号"""
@@ -60,19 +297,40 @@ class TaskManager:
             task.error = error
         self.update_status(task_id, "error")
     
-    def cleanup_old_tasks(self):
-        """清理过期任务（可定期调用）"""
+    def is_abandoned(self, task: TaskState, now: Optional[datetime] = None) -> bool:
+        """任务当前没有订阅者，且最近一次有订阅者（从未连接时为创建时间）已超过 abandon_timeout"""
+        if self.abandon_timeout <= 0 or task.events.consumers > 0:
+            return False
+        seen = task.last_consumer_seen or task.created_at
+        return ((now or datetime.now()) - seen).total_seconds() > self.abandon_timeout
+    
+    def cleanup_old_tasks(self) -> int:
+        """清理过期任务（由应用生命周期定期调用），返回移除的任务数
+        
+        - 已结束的任务：结束超过 cleanup_interval 秒后移除
+        - 被遗弃的任务：运行中的先取消（后台任务随后推送部分统计并保存历史），
+          已结束的直接移除
+        """
         now = datetime.now()
         to_remove = []
         for task_id, task in self._tasks.items():
+            abandoned = self.is_abandoned(task, now)
             if task.completed_at:
                 elapsed = (now - task.completed_at).total_seconds()
-                if elapsed > self._cleanup_interval:
+                if elapsed > self._cleanup_interval or abandoned:
                     to_remove.append(task_id)
+            elif abandoned:
+                self.cancel_task(task_id)
         
         for task_id in to_remove:
             del self._tasks[task_id]
+        return len(to_remove)
 
 
 # 全局单例
-task_manager = TaskManager()
+task_manager = TaskManager(
+    queue_maxsize=settings.TASK_QUEUE_MAXSIZE,
+    queue_policy=settings.TASK_QUEUE_POLICY,
+    cleanup_interval=settings.TASK_CLEANUP_INTERVAL,
+    abandon_timeout=settings.TASK_ABANDON_TIMEOUT,
+)
@@ -8,6 +8,7 @@ let modelOutputs = {}; // 存储每个模型的输出内容
 let modelStatus = {}; // 存储每个模型的状态
 let modelParamSupport = {}; // 存储模型参数支持信息
 let summaryData = null; // 存储统计摘要数据
+let runDetails = null; // 存储运行附加信息（校准、容量搜索、提示词区间、预热）
 
 // ==================== DOM 元素 ====================
 const elements = {
@@ -349,6 +350,7 @@ async function startTest() {
     elements.summarySection.classList.add('hidden');
     displayedSummaryModels.clear();  // 清空已显示的模型统计
     summaryData = null;  // 清空统计数据
+    runDetails = null;
 
     // 清空之前的输出
     clearAllOutputs();
@@ -432,15 +434,27 @@ function connectSSE(taskId) {
         handleStreamChunk(data);
     });
 
+    // 接收合并后的流式数据块（后端按间隔批量推送）
+    eventSource.addEventListener('chunks', (event) => {
+        const frames = JSON.parse(event.data);
+        frames.forEach(frame => {
+            // 落后太多时后端改发进行中请求的完整文本快照，覆盖而非追加
+            if (frame.snapshot) {
+                modelOutputs[frame.model] = '';
+            }
+            handleStreamChunk({ ...frame, status: 'streaming' });
+        });
+    });
+
     // 接收统计摘要
     eventSource.addEventListener('summary', (event) => {
         console.log('=== 收到 summary 事件 ===');
         console.log('event.data:', event.data);
         try {
-            const summaryData = JSON.parse(event.data);
-            console.log('解析后的 summary:', summaryData);
-            // 增量显示统计数据
-            displaySummaryIncremental(summaryData);
+            const payload = JSON.parse(event.data);
+            console.log('解析后的 summary:', payload);
+            // 增量显示统计数据（统计行在 data 字段）
+            displaySummaryIncremental(payload.data);
         } catch (e) {
             console.error('解析 summary 数据失败:', e);
         }
@@ -450,19 +464,45 @@ function connectSSE(taskId) {
     eventSource.addEventListener('summary_complete', (event) => {
         console.log('=== 收到 summary_complete 事件 ===');
         try {
-            const completeData = JSON.parse(event.data);
-            console.log('完整统计数据:', completeData);
+            const payload = JSON.parse(event.data);
+            console.log('完整统计数据:', payload);
             // 保存完整的统计数据供下载使用
-            summaryData = completeData;
+            summaryData = payload.data;
+            runDetails = {
+                status: payload.status,
+                calibration: payload.calibration,
+                capacity: payload.capacity,
+                promptBands: payload.prompt_bands,
+                warmup: payload.warmup,
+            };
         } catch (e) {
             console.error('解析完整统计数据失败:', e);
         }
     });
 
+    // 容量搜索：每个探测点结束时的判定结果
+    eventSource.addEventListener('capacity_probe', (event) => {
+        try {
+            const probe = JSON.parse(event.data);
+            console.log('容量搜索探测点:', probe);
+            const verdict = probe.passed ? '满足 SLO' : (probe.aborted ? '超出 SLO，已提前终止' : '超出 SLO');
+            elements.testStatus.textContent = `容量搜索 ${probe.model_name}：${probe.label} ${verdict}`;
+        } catch (e) {
+            console.error('解析容量搜索数据失败:', e);
+        }
+    });
+
     // 测试完成
     eventSource.addEventListener('complete', (event) => {
-        console.log('测试完成');
+        const data = JSON.parse(event.data);
+        console.log('测试完成:', data.status);
         handleTestComplete();
+        if (data.status === 'cancelled') {
+            elements.testStatus.textContent = '已停止（已汇总完成的请求）';
+        }
+        if (runDetails?.calibration?.exceeds_calibrated_capacity) {
+            elements.testStatus.textContent += '（吞吐超出本机校准上限，延迟可能包含客户端排队）';
+        }
     });
 
     // 错误处理
@@ -471,6 +511,10 @@ function connectSSE(taskId) {
             const errorData = JSON.parse(event.data);
             console.error('测试错误:', errorData.error);
             alert(`测试错误: ${errorData.error}`);
+        } else if (eventSource && eventSource.readyState === EventSource.CONNECTING) {
+            // 连接中断，浏览器会携带 Last-Event-ID 自动重连并从断点续传
+            console.log('SSE 连接中断，正在重连...');
+            return;
         }
         handleTestComplete();
     });
@@ -618,9 +662,11 @@ function displaySummaryIncremental(summaryDataList) {
                         <th>平均延迟 (ms)</th>
                         <th>最低延迟 (ms)</th>
                         <th>最高延迟 (ms)</th>
+                        <th>P50 / P95 / P99 (ms)</th>
                         <th>流式首Token平均 (ms)</th>
                         <th>流式首Token最低 (ms)</th>
                         <th>流式首Token最高 (ms)</th>
+                        <th>TPOT (ms) / 解码 tok/s</th>
                         <th>错误率</th>
                         <th>成功/总数</th>
                     </tr>
@@ -644,7 +690,8 @@ function displaySummaryIncremental(summaryDataList) {
     
     // 为每个模型添加或更新行
     summaryDataList.forEach(row => {
-        const modelName = row.model;
+        // 分阶段负载测试时每个阶段单独一行
+        const modelName = row.stage ? `${row.model} [${row.stage}]` : row.model;
         
         // 检查是否已经显示过这个模型
         if (displayedSummaryModels.has(modelName)) {
@@ -656,9 +703,11 @@ function displaySummaryIncremental(summaryDataList) {
                     <td>${formatLatency(row.avg_latency)}</td>
                     <td>${formatLatency(row.min_latency)}</td>
                     <td>${formatLatency(row.max_latency)}</td>
+                    <td>${formatLatency(row.p50)} / ${formatLatency(row.p95)} / ${formatLatency(row.p99)}</td>
                     <td>${formatLatency(row.first_token_avg)}</td>
                     <td>${formatLatency(row.first_token_min)}</td>
                     <td>${formatLatency(row.first_token_max)}</td>
+                    <td>${formatLatency(row.tpot_avg)} / ${formatLatency(row.decode_tps_avg)}</td>
                     <td>${row.error_rate != null ? (row.error_rate * 100).toFixed(2) + '%' : '0%'}</td>
                     <td>${row.success_count || 0}/${row.total_requests || 0}</td>
                 `;
@@ -672,9 +721,11 @@ function displaySummaryIncremental(summaryDataList) {
                 <td>${formatLatency(row.avg_latency)}</td>
                 <td>${formatLatency(row.min_latency)}</td>
                 <td>${formatLatency(row.max_latency)}</td>
+                <td>${formatLatency(row.p50)} / ${formatLatency(row.p95)} / ${formatLatency(row.p99)}</td>
                 <td>${formatLatency(row.first_token_avg)}</td>
                 <td>${formatLatency(row.first_token_min)}</td>
                 <td>${formatLatency(row.first_token_max)}</td>
+                <td>${formatLatency(row.tpot_avg)} / ${formatLatency(row.decode_tps_avg)}</td>
                 <td>${row.error_rate != null ? (row.error_rate * 100).toFixed(2) + '%' : '0%'}</td>
                 <td>${row.success_count || 0}/${row.total_requests || 0}</td>
             `;
@@ -733,9 +784,11 @@ function displaySummary(summaryDataList) {
                     <th>平均延迟 (ms)</th>
                     <th>最低延迟 (ms)</th>
                     <th>最高延迟 (ms)</th>
+                    <th>P50 / P95 / P99 (ms)</th>
                     <th>流式首Token平均 (ms)</th>
                     <th>流式首Token最低 (ms)</th>
                     <th>流式首Token最高 (ms)</th>
+                    <th>TPOT (ms) / 解码 tok/s</th>
                     <th>错误率</th>
                     <th>成功/总数</th>
                 </tr>
@@ -749,13 +802,15 @@ function displaySummary(summaryDataList) {
                     
                     return `
                         <tr>
-                            <td><strong>${row.model || '-'}</strong></td>
+                            <td><strong>${(row.stage ? `${row.model} [${row.stage}]` : row.model) || '-'}</strong></td>
                             <td>${formatLatency(row.avg_latency)}</td>
                             <td>${formatLatency(row.min_latency)}</td>
                             <td>${formatLatency(row.max_latency)}</td>
+                            <td>${formatLatency(row.p50)} / ${formatLatency(row.p95)} / ${formatLatency(row.p99)}</td>
                             <td>${formatLatency(row.first_token_avg)}</td>
                             <td>${formatLatency(row.first_token_min)}</td>
                             <td>${formatLatency(row.first_token_max)}</td>
+                            <td>${formatLatency(row.tpot_avg)} / ${formatLatency(row.decode_tps_avg)}</td>
                             <td>${row.error_rate != null ? (row.error_rate * 100).toFixed(2) + '%' : '0%'}</td>
                             <td>${row.success_count || 0}/${row.total_requests || 0}</td>
                         </tr>
@@ -819,7 +874,21 @@ function handleTestComplete() {
 }
 
 // ==================== 停止测试 ====================
-function stopTest() {
+async function stopTest() {
+    // 通知后端取消：停止发请求并中止在途请求；保持 SSE 连接以接收部分统计
+    if (currentTaskId) {
+        elements.stopTestBtn.disabled = true;
+        elements.testStatus.textContent = '正在停止...';
+        try {
+            const response = await fetch(`/api/test/${currentTaskId}/cancel`, { method: 'POST' });
+            if (response.ok && eventSource) {
+                return;
+            }
+        } catch (error) {
+            console.error('取消测试失败:', error);
+        }
+    }
+
     if (eventSource) {
         eventSource.close();
         eventSource = null;
@@ -840,6 +909,7 @@ function clearAllOutputs() {
     modelOutputs = {};
     modelStatus = {};
     summaryData = null;
+    runDetails = null;
     elements.modelsContainer.innerHTML = '';
     elements.emptyState.classList.remove('hidden');
     elements.summarySection.classList.add('hidden');
@@ -855,7 +925,7 @@ function downloadResults() {
     }
 
     // 构建 CSV 内容（只包含统计摘要表数据）
-    const headers = ['模型', '平均延迟(ms)', '最低延迟(ms)', '最高延迟(ms)', '流式首Token平均(ms)', '流式首Token最低(ms)', '流式首Token最高(ms)', '错误率', '成功/总数'];
+    const headers = ['模型', '平均延迟(ms)', '最低延迟(ms)', '最高延迟(ms)', 'P50(ms)', 'P95(ms)', 'P99(ms)', '流式首Token平均(ms)', '流式首Token最低(ms)', '流式首Token最高(ms)', 'TPOT(ms)', '解码速度(tok/s)', '错误率', '成功/总数'];
     
     // 使用 BOM 以便 Excel 正常软件正常软件转换中文
     let csvContent = '\ufeff'; // UTF-8 BOM
@@ -878,13 +948,18 @@ function downloadResults() {
         const avgLatency = formatValue(row.avg_latency);
         const minLatency = formatValue(row.min_latency);
         const maxLatency = formatValue(row.max_latency);
+        const p50 = formatValue(row.p50);
+        const p95 = formatValue(row.p95);
+        const p99 = formatValue(row.p99);
         const firstTokenAvg = formatValue(row.first_token_avg);
         const firstTokenMin = formatValue(row.first_token_min);
         const firstTokenMax = formatValue(row.first_token_max);
+        const tpot = formatValue(row.tpot_avg);
+        const decodeTps = formatValue(row.decode_tps_avg);
         const errorRate = row.error_rate != null ? (row.error_rate * 100).toFixed(2) + '%' : '0%';
         const successCount = `${row.success_count || 0}/${row.total_requests || 0}`;
         
-        csvContent += `${modelName},${avgLatency},${minLatency},${maxLatency},${firstTokenAvg},${firstTokenMin},${firstTokenMax},${errorRate},${successCount}\n`;
+        csvContent += `${modelName},${avgLatency},${minLatency},${maxLatency},${p50},${p95},${p99},${firstTokenAvg},${firstTokenMin},${firstTokenMax},${tpot},${decodeTps},${errorRate},${successCount}\n`;
     });
 
     // 创建下载链接
@@ -1158,9 +1233,11 @@ function renderHistoryDetail(record) {
                     <th>平均延迟 (ms)</th>
                     <th>最低延迟 (ms)</th>
                     <th>最高延迟 (ms)</th>
+                    <th>P50 / P95 / P99 (ms)</th>
                     <th>流式首Token平均 (ms)</th>
                     <th>流式首Token最低 (ms)</th>
                     <th>流式首Token最高 (ms)</th>
+                    <th>TPOT (ms) / 解码 tok/s</th>
                     <th>错误率</th>
                     <th>成功/总数</th>
                 </tr>
@@ -1180,9 +1257,11 @@ function renderHistoryDetail(record) {
                 <td>${formatLatency(row.avg_latency)}</td>
                 <td>${formatLatency(row.min_latency)}</td>
                 <td>${formatLatency(row.max_latency)}</td>
+                <td>${formatLatency(row.p50)} / ${formatLatency(row.p95)} / ${formatLatency(row.p99)}</td>
                 <td>${formatLatency(row.first_token_avg)}</td>
                 <td>${formatLatency(row.first_token_min)}</td>
                 <td>${formatLatency(row.first_token_max)}</td>
+                <td>${formatLatency(row.tpot_avg)} / ${formatLatency(row.decode_tps_avg)}</td>
                 <td>${row.error_rate != null ? (row.error_rate * 100).toFixed(2) + '%' : '0%'}</td>
                 <td>${row.success_count || 0}/${row.total_requests || 0}</td>
             </tr>
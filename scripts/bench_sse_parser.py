@@ -0,0 +1,115 @@
+"""SSE 解析微基准：单核每秒可处理的流式增量块数
+
+用法: python scripts/bench_sse_parser.py [--chunks 200000] [--read-size 1024]
+
+对比两种实现在同一份合成流上的吞吐：
+  - legacy: 旧实现，逐行 decode -> strip -> 前缀判断 -> json.loads
+  - parser: tester.sse_parser.SSEStreamParser，在原始字节缓冲上增量解析
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from tester import sse_parser
+from tester.sse_parser import SSEStreamParser
+
+
+def build_stream(chunks: int) -> bytes:
+    """构造与 Azure OpenAI chat 流格式一致的合成 SSE 数据"""
+    frames = []
+    for i in range(chunks):
+        frame = {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion.chunk",
+            "created": 1700000000,
+            "model": "gpt-4o",
+            "choices": [{"index": 0, "delta": {"content": f"tok{i % 97} "}, "finish_reason": None}],
+        }
+        frames.append(b"data: " + json.dumps(frame).encode() + b"\n\n")
+    usage = {"choices": [], "usage": {"prompt_tokens": 12, "completion_tokens": chunks, "total_tokens": chunks + 12}}
+    frames.append(b"data: " + json.dumps(usage).encode() + b"\n\n")
+    frames.append(b"data: [DONE]\n\n")
+    return b"".join(frames)
+
+
+def split_reads(stream: bytes, read_size: int):
+    """模拟网络读取：按固定大小切分（会切断帧边界）"""
+    return [stream[i:i + read_size] for i in range(0, len(stream), read_size)]
+
+
+def iter_lines(reads):
+    """模拟 aiohttp StreamReader 的逐行迭代（旧实现的输入）"""
+    pending = b""
+    for data in reads:
+        pending += data
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line + b"\n"
+
+
+def run_legacy(reads) -> int:
+    count = 0
+    for raw_line in iter_lines(reads):
+        line = raw_line.decode(errors="ignore").strip()
+        if not line or not line.startswith("data:"):
+            continue
+        data_str = line[len("data:"):].strip()
+        if data_str == "[DONE]":
+            break
+        try:
+            data = json.loads(data_str)
+        except json.JSONDecodeError:
+            continue
+        choices = data.get("choices") or []
+        if choices and choices[0].get("delta", {}).get("content"):
+            count += 1
+    return count
+
+
+def run_parser(reads) -> int:
+    count = 0
+    parser = SSEStreamParser()
+    for data in reads:
+        for delta in parser.feed(data):
+            if delta.content:
+                count += 1
+        if parser.done:
+            break
+    return count
+
+
+def bench(name: str, fn, reads, expected: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        got = fn(reads)
+        best = min(best, time.perf_counter() - start)
+        assert got == expected, f"{name}: expected {expected} chunks, got {got}"
+    rate = expected / best
+    print(f"  {name:<8} {rate:>12,.0f} chunks/s/core   ({best * 1000:.1f} ms)")
+    return rate
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--chunks", type=int, default=200_000)
+    ap.add_argument("--read-size", type=int, default=1024, help="每次网络读取的字节数")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    stream = build_stream(args.chunks)
+    reads = split_reads(stream, args.read_size)
+    decoder = "orjson" if sse_parser._loads is not json.loads else "json (stdlib)"
+    print(f"🧪 SSE 解析基准: {args.chunks:,} 个块, {len(stream) / 1e6:.1f} MB, 读取粒度 {args.read_size} B, 解码器 {decoder}")
+
+    legacy = bench("legacy", run_legacy, reads, args.chunks, args.repeat)
+    parser = bench("parser", run_parser, reads, args.chunks, args.repeat)
+    print(f"  加速比: {parser / legacy:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
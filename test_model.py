@@ -10,14 +10,14 @@ from pathlib import Path
 # 添加项目路径
 sys.path.insert(0, str(Path(__file__).parent))
 
-from backend.main import load_model_configs
+from backend.main import model_registry
 from tester.latency_tester import LatencyTester
 
 
 async def main():
     model_name = sys.argv[1] if len(sys.argv) > 1 else "gpt-5-mini"
     
-    configs = load_model_configs()
+    configs = model_registry.snapshot().configs
     if model_name not in configs:
         print(f"❌ 模型 '{model_name}' 不存在")
         print(f"可用模型: {list(configs.keys())}")
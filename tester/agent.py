@@ -0,0 +1,239 @@
+"""分布式压测 agent
+
+用法: python -m tester.agent --server http://api-host:8000 [--name node-1] [--processes 4] [--token ...]
+
+向 API 服务注册后长轮询领取负载分片，用 ``LatencyTester``（``--processes``
+大于 1 时用 ``ProcessShardedTester``）运行，并把记录按批紧凑编码上传。
+每次上传都附带本机 ``perf_counter`` 到服务端 ``perf_counter`` 的偏移估计：
+多次往返取 RTT 最小的一次，偏移 = 服务端时间 - 往返中点，误差不超过 RTT/2。
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import socket
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from tester.http_pool import HttpClientPool
+from tester.latency_tester import LatencyTester, ModelConfig, RequestRecord
+from tester.process_runner import ProcessShardedTester
+from tester.record_codec import encode_records
+
+logger = logging.getLogger(__name__)
+
+AGENT_TOKEN_HEADER = "X-Agent-Token"
+
+
+class LoadAgent:
+    """Polls the API server for work and streams compact record batches back."""
+
+    def __init__(
+        self,
+        server: str,
+        name: str,
+        processes: int = 1,
+        token: Optional[str] = None,
+        upload_interval: float = 0.5,
+        clock_samples: int = 8,
+        clock_refresh_s: float = 30.0,
+    ):
+        self.server = server.rstrip("/")
+        self.name = name
+        self.processes = max(1, processes)
+        self.headers = {AGENT_TOKEN_HEADER: token} if token else {}
+        self.upload_interval = upload_interval
+        self.clock_samples = clock_samples
+        self.clock_refresh_s = clock_refresh_s
+        self.agent_id: Optional[str] = None
+        self.clock_offset_s = 0.0
+        self.rtt_ms: Optional[float] = None
+        self._clock_measured_at = 0.0
+
+    def _url(self, path: str) -> str:
+        return f"{self.server}/api/agents{path}"
+
+    async def register(self, session: aiohttp.ClientSession) -> None:
+        async with session.post(
+            self._url("/register"),
+            json={"name": self.name, "processes": self.processes},
+            headers=self.headers,
+        ) as resp:
+            resp.raise_for_status()
+            self.agent_id = (await resp.json())["agent_id"]
+        logger.info("Registered as %s (%s)", self.name, self.agent_id)
+
+    async def measure_clock(self, session: aiohttp.ClientSession) -> Tuple[float, float]:
+        """Estimate ``server_perf_counter - local_perf_counter`` from the fastest round trip."""
+        best: Optional[Tuple[float, float]] = None
+        for _ in range(self.clock_samples):
+            t0 = time.perf_counter()
+            async with session.get(self._url("/clock"), headers=self.headers) as resp:
+                resp.raise_for_status()
+                server_time = (await resp.json())["perf_counter"]
+            t1 = time.perf_counter()
+            rtt = t1 - t0
+            if best is None or rtt < best[1]:
+                best = (server_time - (t0 + t1) / 2, rtt)
+        self.clock_offset_s, rtt = best
+        self.rtt_ms = rtt * 1000
+        self._clock_measured_at = time.perf_counter()
+        return self.clock_offset_s, self.rtt_ms
+
+    async def _upload(
+        self,
+        session: aiohttp.ClientSession,
+        assignment_id: str,
+        records: List[RequestRecord],
+    ) -> bool:
+        """Send one batch (possibly empty, doubling as a heartbeat); returns the cancel flag."""
+        if time.perf_counter() - self._clock_measured_at > self.clock_refresh_s:
+            await self.measure_clock(session)
+        params = {"clock_offset_s": repr(self.clock_offset_s), "rtt_ms": repr(self.rtt_ms)}
+        async with session.post(
+            self._url(f"/{self.agent_id}/assignments/{assignment_id}/records"),
+            params=params,
+            data=encode_records(records),
+            headers={**self.headers, "Content-Type": "application/octet-stream"},
+        ) as resp:
+            resp.raise_for_status()
+            return (await resp.json()).get("cancel", False)
+
+    async def run_assignment(self, session: aiohttp.ClientSession, assignment: Dict[str, Any]) -> None:
+        """Run one shard and always report it finished, with the error if anything failed."""
+        assignment_id = assignment["assignment_id"]
+        try:
+            error = await self._run_shard(session, assignment_id, assignment["payload"])
+        except Exception as e:  # noqa: BLE001 - 报告给服务端
+            error = f"{type(e).__name__}: {e}"
+        await self._report_done(session, assignment_id, error)
+        logger.info("Assignment %s finished%s", assignment_id, f" with error: {error}" if error else "")
+
+    async def _run_shard(
+        self,
+        session: aiohttp.ClientSession,
+        assignment_id: str,
+        payload: Dict[str, Any],
+    ) -> Optional[str]:
+        """Run the load and upload its records; returns the error to report (None on success)."""
+        configs = [ModelConfig(**cfg) for cfg in payload["configs"]]
+        total = sum(cfg.concurrency for cfg in configs) or 1
+        logger.info("Assignment %s: %s", assignment_id, ", ".join(
+            f"{cfg.name} x{cfg.concurrency}" for cfg in configs))
+
+        pool: Optional[HttpClientPool] = None
+        if self.processes > 1:
+            tester = ProcessShardedTester(self.processes, request_timeout=payload["request_timeout"])
+        else:
+            pool = HttpClientPool(limit=total * 2, limit_per_host=total * 2)
+            tester = LatencyTester(request_timeout=payload["request_timeout"], pool=pool)
+
+        pending: List[RequestRecord] = []
+        stop = asyncio.Event()
+
+        async def uploader():
+            # 周期上传（空批次兼作心跳）；stop 后再上传最后一批
+            while True:
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=self.upload_interval)
+                except asyncio.TimeoutError:
+                    pass
+                batch, pending[:] = list(pending), []
+                if await self._upload(session, assignment_id, batch):
+                    tester.cancel()
+                if stop.is_set():
+                    return
+
+        upload_task: Optional[asyncio.Task] = None
+        error: Optional[str] = None
+        try:
+            await self.measure_clock(session)
+            upload_task = asyncio.create_task(uploader())
+            await tester.run_models(
+                configs,
+                question=payload.get("question"),
+                record_callback=pending.append,
+                keep_records=False,
+            )
+        except Exception as e:  # noqa: BLE001 - 报告给服务端
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            stop.set()
+            if pool is not None:
+                await pool.close()
+        if upload_task is not None:
+            try:
+                await upload_task
+            except Exception as e:  # noqa: BLE001 - 报告给服务端
+                error = error or f"upload failed: {type(e).__name__}: {e}"
+        return error
+
+    async def _report_done(
+        self,
+        session: aiohttp.ClientSession,
+        assignment_id: str,
+        error: Optional[str],
+        attempts: int = 3,
+    ) -> None:
+        """Post the shard result, retrying briefly.
+
+        If every attempt fails the agent goes back to polling; the server
+        fails a shard whose agent polls again without reporting it.
+        """
+        for attempt in range(attempts):
+            try:
+                async with session.post(
+                    self._url(f"/{self.agent_id}/assignments/{assignment_id}/done"),
+                    json={"error": error},
+                    headers=self.headers,
+                ) as resp:
+                    resp.raise_for_status()
+                return
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning("Reporting assignment %s failed (%s)", assignment_id, e)
+                if attempt + 1 < attempts:
+                    await asyncio.sleep(2 ** attempt)
+
+    async def serve_forever(self) -> None:
+        backoff = 1.0
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=120)) as session:
+            while True:
+                try:
+                    if self.agent_id is None:
+                        await self.register(session)
+                    async with session.get(self._url(f"/{self.agent_id}/work"), headers=self.headers) as resp:
+                        if resp.status == 404:
+                            # 服务端重启后登记丢失，重新注册
+                            self.agent_id = None
+                            continue
+                        resp.raise_for_status()
+                        assignment = (await resp.json()).get("assignment")
+                    if assignment:
+                        await self.run_assignment(session, assignment)
+                    backoff = 1.0
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.warning("Server unreachable (%s), retrying in %.0fs", e, backoff)
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 30.0)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--server", required=True, help="API 服务地址，如 http://127.0.0.1:8000")
+    ap.add_argument("--name", default=socket.gethostname(), help="agent 名称（默认主机名）")
+    ap.add_argument("--processes", type=int, default=1, help="本机压测进程数")
+    ap.add_argument("--token", default=None, help="与服务端 AGENT_TOKEN 一致的令牌")
+    args = ap.parse_args()
+    logging.getLogger("tester.latency_tester").setLevel(logging.WARNING)
+    print(f"🛰️  压测 agent {args.name} 连接 {args.server}（{args.processes} 个进程）")
+    try:
+        asyncio.run(LoadAgent(args.server, args.name, args.processes, args.token).serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
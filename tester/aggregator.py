@@ -0,0 +1,446 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from tester.latency_tester import RequestRecord
+from tester.sketch import QuantileSketch
+from tester.steady_state import detect_warmup
+
+GroupKey = Tuple[str, Optional[str]]  # (model, stage)
+
+
+@dataclass
+class LatencyStats:
+    """Per-group counters plus quantile sketches; memory does not grow with request count."""
+
+    total: int = 0
+    errors: int = 0
+    latency: QuantileSketch = field(default_factory=QuantileSketch)
+    first_token: QuantileSketch = field(default_factory=QuantileSketch)
+    # 流式解码指标：相邻两次网络读取的间隔（ITL 按读取计）、每输出 token 耗时、解码吞吐
+    inter_token: QuantileSketch = field(default_factory=QuantileSketch)
+    tpot: QuantileSketch = field(default_factory=QuantileSketch)
+    decode_tps: QuantileSketch = field(default_factory=QuantileSketch)
+    schedule_lag_max: Optional[float] = None
+    # 重试：需要重试的请求数、总尝试次数、429 响应数与退避等待
+    retried: int = 0
+    attempts: int = 0
+    throttled: int = 0
+    backoff_total_ms: float = 0.0
+    backoff_max_ms: Optional[float] = None
+    # 客户端限流：发送前等待过的请求数与等待时长
+    rate_limited: int = 0
+    rate_limit_wait_total_ms: float = 0.0
+    rate_limit_wait_max_ms: Optional[float] = None
+    # 连接阶段耗时（成功请求）；dns/connect 只统计新建连接的请求
+    pool_wait: QuantileSketch = field(default_factory=QuantileSketch)
+    dns: QuantileSketch = field(default_factory=QuantileSketch)
+    connect: QuantileSketch = field(default_factory=QuantileSketch)
+    send: QuantileSketch = field(default_factory=QuantileSketch)
+    ttfb: QuantileSketch = field(default_factory=QuantileSketch)
+    transfer: QuantileSketch = field(default_factory=QuantileSketch)
+    bytes_received: int = 0
+    bytes_count: int = 0
+
+    def add(self, record: RequestRecord) -> None:
+        self.total += 1
+        if record.schedule_lag_ms is not None:
+            self.schedule_lag_max = _max(self.schedule_lag_max, record.schedule_lag_ms)
+        self.attempts += record.attempts
+        self.throttled += record.throttled
+        if record.attempts > 1:
+            self.retried += 1
+            self.backoff_total_ms += record.backoff_ms
+            self.backoff_max_ms = _max(self.backoff_max_ms, record.backoff_ms)
+        if record.rate_limit_wait_ms > 0:
+            self.rate_limited += 1
+            self.rate_limit_wait_total_ms += record.rate_limit_wait_ms
+            self.rate_limit_wait_max_ms = _max(self.rate_limit_wait_max_ms, record.rate_limit_wait_ms)
+        if record.error is not None:
+            self.errors += 1
+            return
+        self.latency.add(record.latency_ms)
+        if record.first_token_latency_ms is not None:
+            self.first_token.add(record.first_token_latency_ms)
+        chunk_times = record.chunk_times_ms
+        if chunk_times is not None:
+            for i in range(1, len(chunk_times)):
+                self.inter_token.add(chunk_times[i] - chunk_times[i - 1])
+        if record.tpot_ms is not None:
+            self.tpot.add(record.tpot_ms)
+        if record.decode_tokens_per_s is not None:
+            self.decode_tps.add(record.decode_tokens_per_s)
+        for sketch, value in (
+            (self.pool_wait, record.pool_wait_ms),
+            (self.dns, record.dns_ms),
+            (self.connect, record.connect_ms),
+            (self.send, record.send_ms),
+            (self.ttfb, record.ttfb_ms),
+            (self.transfer, record.transfer_ms),
+        ):
+            if value is not None:
+                sketch.add(value)
+        if record.bytes_received is not None:
+            self.bytes_received += record.bytes_received
+            self.bytes_count += 1
+
+    def merge(self, other: "LatencyStats") -> None:
+        self.total += other.total
+        self.errors += other.errors
+        self.latency.merge(other.latency)
+        self.first_token.merge(other.first_token)
+        self.inter_token.merge(other.inter_token)
+        self.tpot.merge(other.tpot)
+        self.decode_tps.merge(other.decode_tps)
+        self.schedule_lag_max = _max(self.schedule_lag_max, other.schedule_lag_max)
+        self.retried += other.retried
+        self.attempts += other.attempts
+        self.throttled += other.throttled
+        self.backoff_total_ms += other.backoff_total_ms
+        self.backoff_max_ms = _max(self.backoff_max_ms, other.backoff_max_ms)
+        self.rate_limited += other.rate_limited
+        self.rate_limit_wait_total_ms += other.rate_limit_wait_total_ms
+        self.rate_limit_wait_max_ms = _max(self.rate_limit_wait_max_ms, other.rate_limit_wait_max_ms)
+        self.pool_wait.merge(other.pool_wait)
+        self.dns.merge(other.dns)
+        self.connect.merge(other.connect)
+        self.send.merge(other.send)
+        self.ttfb.merge(other.ttfb)
+        self.transfer.merge(other.transfer)
+        self.bytes_received += other.bytes_received
+        self.bytes_count += other.bytes_count
+
+    @property
+    def success(self) -> int:
+        return self.total - self.errors
+
+    def to_row(self, model: str, stage: Optional[str]) -> Dict[str, Any]:
+        """Same columns as ``metrics.summarize_latency`` rows."""
+        success = self.success
+        # 只有多于一个样本时才给出最低/最高
+        many = self.latency.count > 1
+        many_ft = self.first_token.count > 1
+        return {
+            "model": model,
+            "stage": stage,
+            "avg_latency": self.latency.mean,
+            "min_latency": self.latency.min if many else None,
+            "max_latency": self.latency.max if many else None,
+            **self.latency.quantiles(),
+            "first_token_avg": self.first_token.mean,
+            "first_token_min": self.first_token.min if many_ft else None,
+            "first_token_max": self.first_token.max if many_ft else None,
+            **self.first_token.quantiles("first_token_"),
+            "itl_avg": self.inter_token.mean,
+            "itl_p50": self.inter_token.quantile(0.50),
+            "itl_p95": self.inter_token.quantile(0.95),
+            "itl_p99": self.inter_token.quantile(0.99),
+            "tpot_avg": self.tpot.mean,
+            "tpot_p50": self.tpot.quantile(0.50),
+            "tpot_p95": self.tpot.quantile(0.95),
+            "decode_tps_avg": self.decode_tps.mean,
+            "decode_tps_p50": self.decode_tps.quantile(0.50),
+            "error_rate": self.errors / self.total if self.total else 0,
+            "total_requests": self.total,
+            "success_count": success,
+            "error_count": self.errors,
+            "schedule_lag_max": self.schedule_lag_max,
+            "retried_count": self.retried,
+            "attempts_avg": self.attempts / self.total if self.total else None,
+            "throttled_count": self.throttled,
+            "backoff_avg": self.backoff_total_ms / self.retried if self.retried else None,
+            "backoff_max": self.backoff_max_ms,
+            "rate_limited_count": self.rate_limited,
+            "rate_limit_wait_avg": (
+                self.rate_limit_wait_total_ms / self.rate_limited if self.rate_limited else None
+            ),
+            "rate_limit_wait_max": self.rate_limit_wait_max_ms,
+            "pool_wait_avg": self.pool_wait.mean,
+            "pool_wait_p95": self.pool_wait.quantile(0.95),
+            "new_connections": self.connect.count,
+            "dns_avg": self.dns.mean,
+            "connect_avg": self.connect.mean,
+            "connect_p95": self.connect.quantile(0.95),
+            "send_avg": self.send.mean,
+            "ttfb_avg": self.ttfb.mean,
+            "ttfb_p50": self.ttfb.quantile(0.50),
+            "ttfb_p95": self.ttfb.quantile(0.95),
+            "transfer_avg": self.transfer.mean,
+            "transfer_p95": self.transfer.quantile(0.95),
+            "bytes_received_avg": self.bytes_received / self.bytes_count if self.bytes_count else None,
+        }
+
+
+@dataclass
+class TimeBucket:
+    count: int = 0
+    errors: int = 0
+    latency_sum: float = 0.0
+    latency_max: Optional[float] = None
+    first_token_count: int = 0
+    first_token_sum: float = 0.0
+    throttled: int = 0
+
+    def add(self, record: RequestRecord) -> None:
+        self.count += 1
+        self.throttled += record.throttled
+        if record.error is not None:
+            self.errors += 1
+            return
+        self.latency_sum += record.latency_ms
+        self.latency_max = _max(self.latency_max, record.latency_ms)
+        if record.first_token_latency_ms is not None:
+            self.first_token_count += 1
+            self.first_token_sum += record.first_token_latency_ms
+
+    def merge(self, other: "TimeBucket") -> None:
+        self.count += other.count
+        self.errors += other.errors
+        self.latency_sum += other.latency_sum
+        self.latency_max = _max(self.latency_max, other.latency_max)
+        self.first_token_count += other.first_token_count
+        self.first_token_sum += other.first_token_sum
+        self.throttled += other.throttled
+
+
+@dataclass
+class TimeBuckets:
+    """Fixed-width time series of completions with a hard cap on bucket count.
+
+    When a run outlives ``max_buckets * width_s`` the width doubles and
+    neighbouring buckets are merged, so a 12-hour soak test uses the same
+    memory as a 2-minute one (just with coarser resolution).
+    """
+
+    width_s: float = 10.0
+    max_buckets: int = 720
+    buckets: List[TimeBucket] = field(default_factory=list)
+
+    def add(self, offset_s: float, record: RequestRecord) -> None:
+        index = max(0, int(offset_s // self.width_s))
+        while index >= self.max_buckets:
+            self._coarsen()
+            index = max(0, int(offset_s // self.width_s))
+        while len(self.buckets) <= index:
+            self.buckets.append(TimeBucket())
+        self.buckets[index].add(record)
+
+    def _coarsen(self) -> None:
+        merged: List[TimeBucket] = []
+        for i in range(0, len(self.buckets), 2):
+            bucket = self.buckets[i]
+            if i + 1 < len(self.buckets):
+                bucket.merge(self.buckets[i + 1])
+            merged.append(bucket)
+        self.buckets = merged
+        self.width_s *= 2
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        rows = []
+        for i, bucket in enumerate(self.buckets):
+            success = bucket.count - bucket.errors
+            rows.append({
+                "t": i * self.width_s,
+                "width_s": self.width_s,
+                "count": bucket.count,
+                "error_count": bucket.errors,
+                "throttled_count": bucket.throttled,
+                "avg_latency": bucket.latency_sum / success if success else None,
+                "max_latency": bucket.latency_max,
+                "first_token_avg": (
+                    bucket.first_token_sum / bucket.first_token_count
+                    if bucket.first_token_count else None
+                ),
+            })
+        return rows
+
+
+class RunAggregator:
+    """Rolls completed records into per-(model, stage) stats and a timeline.
+
+    Feed it from ``LatencyTester.run_models(record_callback=...)`` with
+    ``keep_records=False`` to summarise arbitrarily long runs in constant memory.
+
+    Warm-up records (``record.warmup``) are kept out of the headline rows and
+    summarised separately by ``warmup_rows``. With ``steady_state_window`` > 0
+    the first that many other records of each group are held back and MSER-5
+    truncation over their completion-order latencies decides which of them
+    are warm-up too; rows requested before the window fills use a
+    provisional cut of what has arrived so far. The timeline keeps every record.
+    """
+
+    def __init__(self, bucket_seconds: float = 10.0, max_buckets: int = 720, steady_state_window: int = 0):
+        self.bucket_seconds = bucket_seconds
+        self.max_buckets = max_buckets
+        self.steady_state_window = steady_state_window
+        self.origin = time.perf_counter()
+        self._stats: Dict[GroupKey, LatencyStats] = {}
+        self._timelines: Dict[GroupKey, TimeBuckets] = {}
+        # 语料模式：按 (model, 提示词长度区间) 另行统计
+        self._bands: Dict[GroupKey, LatencyStats] = {}
+        # 预热请求（显式标记或稳态检测截掉的）单独统计
+        self._warmup: Dict[GroupKey, LatencyStats] = {}
+        # 稳态检测窗口内暂存的记录，窗口满后截断一次并清空
+        self._pending: Dict[GroupKey, List[RequestRecord]] = {}
+
+    def add(self, record: RequestRecord) -> None:
+        key = (record.model, record.stage)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = LatencyStats()
+            self._timelines[key] = TimeBuckets(self.bucket_seconds, self.max_buckets)
+            if self.steady_state_window > 0:
+                self._pending[key] = []
+        self._timelines[key].add(record.end_time - self.origin, record)
+        if record.warmup:
+            _stats_for(self._warmup, key).add(record)
+            return
+        pending = self._pending.get(key)
+        if pending is None:
+            self._add_steady(stats, self._bands, record)
+            return
+        pending.append(record)
+        if len(pending) >= self.steady_state_window:
+            del self._pending[key]
+            warmup, steady = _split_warmup(pending)
+            for item in warmup:
+                _stats_for(self._warmup, key).add(item)
+            for item in steady:
+                self._add_steady(stats, self._bands, item)
+
+    @staticmethod
+    def _add_steady(stats: LatencyStats, bands: Dict[GroupKey, LatencyStats], record: RequestRecord) -> None:
+        stats.add(record)
+        if record.prompt_band is not None:
+            _stats_for(bands, (record.model, record.prompt_band)).add(record)
+
+    def _views(self) -> Tuple[
+        Dict[GroupKey, LatencyStats], Dict[GroupKey, LatencyStats], Dict[GroupKey, LatencyStats]
+    ]:
+        """(stats, bands, warmup) including a provisional cut of groups still in the window."""
+        if not any(self._pending.values()):
+            return self._stats, self._bands, self._warmup
+        stats = {key: _copy(value) for key, value in self._stats.items()}
+        bands = {key: _copy(value) for key, value in self._bands.items()}
+        warmup_stats = {key: _copy(value) for key, value in self._warmup.items()}
+        for key, pending in self._pending.items():
+            warmup, steady = _split_warmup(pending)
+            for item in warmup:
+                _stats_for(warmup_stats, key).add(item)
+            for item in steady:
+                self._add_steady(stats[key], bands, item)
+        return stats, bands, warmup_stats
+
+    @property
+    def total_requests(self) -> int:
+        """All records seen, warm-up included."""
+        return (
+            sum(stats.total for stats in self._stats.values())
+            + sum(stats.total for stats in self._warmup.values())
+            + sum(len(pending) for pending in self._pending.values())
+        )
+
+    def summary_rows(self, model: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Headline rows, warm-up excluded; ``warmup_count`` says how many were left out."""
+        stats, _, warmup = self._views()
+        rows = []
+        for key, group in stats.items():
+            if model is None or key[0] == model:
+                row = group.to_row(key[0], key[1])
+                row["warmup_count"] = warmup[key].total if key in warmup else 0
+                rows.append(row)
+        return rows
+
+    def warmup_rows(self, model: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Summary rows of the warm-up records alone; empty when nothing was excluded."""
+        _, _, warmup = self._views()
+        return [
+            stats.to_row(key[0], key[1])
+            for key, stats in warmup.items()
+            if model is None or key[0] == model
+        ]
+
+    def band_rows(self, model: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Summary rows per (model, prompt-length band); empty unless a corpus was used."""
+        _, bands, _ = self._views()
+        rows = []
+        for (name, band), stats in sorted(bands.items(), key=lambda item: _band_order(item[0])):
+            if model is None or name == model:
+                row = stats.to_row(name, None)
+                row["prompt_band"] = band
+                rows.append(row)
+        return rows
+
+    def sketches(self) -> List[Dict[str, Any]]:
+        """Serialised latency / first-token sketches per headline row, for merging across runs."""
+        stats, _, _ = self._views()
+        return [
+            {
+                "model": key[0],
+                "stage": key[1],
+                "latency": group.latency.to_dict(),
+                "first_token": group.first_token.to_dict(),
+            }
+            for key, group in stats.items()
+        ]
+
+    def timeline(self) -> List[Dict[str, Any]]:
+        return [
+            {"model": key[0], "stage": key[1], "buckets": timeline.to_list()}
+            for key, timeline in self._timelines.items()
+        ]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """周期快照：当前累计统计 + 已运行时长。"""
+        return {
+            "elapsed_s": time.perf_counter() - self.origin,
+            "total_requests": self.total_requests,
+            "summary": self.summary_rows(),
+        }
+
+
+def _split_warmup(records: List[RequestRecord]) -> Tuple[List[RequestRecord], List[RequestRecord]]:
+    """按 MSER 截断把窗口内的记录分成 (预热, 稳态)
+
+    检测只看成功请求按完成时间排列的延迟序列；截断点之前完成的请求
+    （包括失败的）都算预热。
+    """
+    succeeded = sorted((r for r in records if r.error is None), key=lambda r: r.end_time)
+    cut = detect_warmup([r.latency_ms for r in succeeded])
+    if cut == 0:
+        return [], records
+    cutoff = succeeded[cut - 1].end_time
+    warmup = [r for r in records if r.end_time <= cutoff]
+    steady = [r for r in records if r.end_time > cutoff]
+    return warmup, steady
+
+
+def _stats_for(groups: Dict[GroupKey, LatencyStats], key: GroupKey) -> LatencyStats:
+    stats = groups.get(key)
+    if stats is None:
+        stats = groups[key] = LatencyStats()
+    return stats
+
+
+def _copy(stats: LatencyStats) -> LatencyStats:
+    copied = LatencyStats()
+    copied.merge(stats)
+    return copied
+
+
+def _band_order(key: GroupKey) -> Tuple[str, float]:
+    """按区间下界排序：``0-256`` < ``256-1k`` < ``>=16k``"""
+    model, band = key
+    lower = band.lstrip(">=").split("-")[0]
+    value = float(lower[:-1]) * 1024 if lower.endswith("k") else float(lower)
+    return model, value
+
+
+def _max(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return a if a > b else b
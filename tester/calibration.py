@@ -0,0 +1,302 @@
+"""压测工具自身开销校准
+
+用法: python -m tester.calibration [--levels 1,4,16,64,256,1024] [--tokens 50] [--output data/calibration.json]
+
+对一个零延迟的本地模拟服务（独立进程，见 tester.mock_server）逐级提高并发，
+测量本进程发请求、解析流、回调所消耗的时间：
+  - 每请求 / 每增量块的客户端开销：分别用 1 个和 N 个 token 的响应在相同并发下
+    运行，对客户端进程 CPU 时间做两点线性拟合
+  - 各并发级别实际达到的 req/s 与 chunks/s，以及事件循环调度滞后
+  - 可信上限：事件循环滞后不超过阈值的级别中，最高的 req/s 与 chunks/s；
+    真实测试超过该吞吐时，测得的延迟会混入本进程的排队时间
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from tester.http_pool import HttpClientPool
+from tester.latency_tester import LatencyTester, ModelConfig, RequestRecord
+from tester.sketch import QuantileSketch
+
+DEFAULT_LEVELS = (1, 4, 16, 64, 256, 1024)
+# 模拟服务中的两个部署：单 token 响应与 N token 响应
+ONE_TOKEN_DEPLOYMENT = "calibration-1"
+MANY_TOKEN_DEPLOYMENT = "calibration-n"
+
+
+@dataclass
+class CalibrationLevel:
+    concurrency: int
+    requests: int
+    chunks: int
+    wall_s: float
+    requests_per_s: float
+    chunks_per_s: float
+    latency_p50_ms: Optional[float]
+    latency_p99_ms: Optional[float]
+    loop_lag_max_ms: float
+    cpu_ms_per_request: float
+    errors: int
+
+
+@dataclass
+class CalibrationResult:
+    tokens_per_request: int
+    per_request_overhead_ms: float
+    per_chunk_overhead_us: float
+    max_requests_per_s: float
+    max_chunks_per_s: float
+    lag_threshold_ms: float
+    levels: List[CalibrationLevel] = field(default_factory=list)
+    measured_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    python: str = field(default_factory=platform.python_version)
+    host: str = field(default_factory=platform.node)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CalibrationResult":
+        data = dict(data)
+        data["levels"] = [CalibrationLevel(**level) for level in data.get("levels", [])]
+        return cls(**data)
+
+    def brief(self) -> Dict[str, Any]:
+        """附加到测试报告的摘要（不含各级别明细）"""
+        return {
+            "per_request_overhead_ms": self.per_request_overhead_ms,
+            "per_chunk_overhead_us": self.per_chunk_overhead_us,
+            "max_requests_per_s": self.max_requests_per_s,
+            "max_chunks_per_s": self.max_chunks_per_s,
+            "measured_at": self.measured_at,
+        }
+
+
+class LoopLagMonitor:
+    """Samples how late ``asyncio.sleep`` wakes up; the max is the loop's worst stall."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.max_lag_ms = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = (time.perf_counter() - expected) * 1000
+            if lag > self.max_lag_ms:
+                self.max_lag_ms = lag
+
+    def __enter__(self) -> "LoopLagMonitor":
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+
+async def _serve_mock(tokens: int) -> None:
+    """子进程入口：运行零延迟模拟服务并把 URL 写到 stdout 第一行"""
+    from tester.mock_server import MockProfile, MockServer
+
+    server = MockServer(profiles={
+        ONE_TOKEN_DEPLOYMENT: MockProfile(tokens=(1, 1)),
+        MANY_TOKEN_DEPLOYMENT: MockProfile(tokens=(tokens, tokens)),
+    })
+    print(await server.start(), flush=True)
+    await asyncio.Event().wait()
+
+
+async def _start_mock(tokens: int) -> Tuple[asyncio.subprocess.Process, str]:
+    """在独立进程中启动模拟服务，避免服务端开销计入本进程"""
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "tester.calibration", "--serve-mock", str(tokens),
+        cwd=str(Path(__file__).resolve().parent.parent),
+        stdout=asyncio.subprocess.PIPE,
+    )
+    try:
+        line = await asyncio.wait_for(process.stdout.readline(), timeout=30)
+    except asyncio.TimeoutError:
+        line = b""
+    if not line.startswith(b"http"):
+        process.kill()
+        await process.wait()
+        raise RuntimeError("校准用模拟服务启动失败")
+    return process, line.decode().strip()
+
+
+async def _run_level(
+    tester: LatencyTester,
+    url: str,
+    deployment: str,
+    concurrency: int,
+    requests: int,
+    tokens: int,
+) -> CalibrationLevel:
+    latency = QuantileSketch()
+    counts = {"chunks": 0, "errors": 0}
+
+    def on_chunk(model: str, request_id: int, chunk: str):
+        counts["chunks"] += 1
+
+    def on_record(record: RequestRecord):
+        if record.error is not None:
+            counts["errors"] += 1
+        else:
+            latency.add(record.latency_ms)
+
+    config = ModelConfig(
+        name=deployment,
+        endpoint=url,
+        api_key="calibration",
+        api_version="calibration",
+        prompt="calibration",
+        max_tokens=tokens,
+        concurrency=concurrency,
+        iterations=max(1, requests // concurrency),
+        stream=True,
+    )
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    with LoopLagMonitor() as monitor:
+        await tester.run_models(
+            [config], stream_callback=on_chunk, record_callback=on_record, keep_records=False
+        )
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    done = config.concurrency * config.iterations
+    return CalibrationLevel(
+        concurrency=concurrency,
+        requests=done,
+        chunks=counts["chunks"],
+        wall_s=wall,
+        requests_per_s=done / wall,
+        chunks_per_s=counts["chunks"] / wall,
+        latency_p50_ms=latency.quantile(0.50),
+        latency_p99_ms=latency.quantile(0.99),
+        loop_lag_max_ms=monitor.max_lag_ms,
+        cpu_ms_per_request=cpu * 1000 / done,
+        errors=counts["errors"],
+    )
+
+
+async def calibrate(
+    levels: Sequence[int] = DEFAULT_LEVELS,
+    tokens: int = 50,
+    requests_per_level: int = 200,
+    lag_threshold_ms: float = 5.0,
+    log: bool = True,
+) -> CalibrationResult:
+    """Measure this process's client-side overhead against a zero-latency endpoint.
+
+    Should run while nothing else is using the event loop: any concurrent
+    work is counted as harness overhead.
+    """
+    server, url = await _start_mock(tokens)
+    pool = HttpClientPool(limit=max(levels) * 2, limit_per_host=max(levels) * 2)
+    try:
+        tester = LatencyTester(request_timeout=60.0, pool=pool)
+        # 预热：建立连接、触发导入与 JIT 式缓存
+        await _run_level(tester, url, MANY_TOKEN_DEPLOYMENT, 4, 20, tokens)
+
+        # 相同并发下 1 token 与 N token 的 CPU 差值 -> 每块开销，截距 -> 每请求开销
+        fit_concurrency = min(8, max(levels))
+        one = await _run_level(tester, url, ONE_TOKEN_DEPLOYMENT, fit_concurrency, requests_per_level, 1)
+        many = await _run_level(tester, url, MANY_TOKEN_DEPLOYMENT, fit_concurrency, requests_per_level, tokens)
+        chunks_one = one.chunks / one.requests
+        chunks_many = many.chunks / many.requests
+        per_chunk_ms = 0.0
+        if chunks_many > chunks_one:
+            per_chunk_ms = max(0.0, (many.cpu_ms_per_request - one.cpu_ms_per_request) / (chunks_many - chunks_one))
+        per_request_ms = max(0.0, one.cpu_ms_per_request - per_chunk_ms * chunks_one)
+
+        results: List[CalibrationLevel] = []
+        for concurrency in levels:
+            level = await _run_level(
+                tester, url, MANY_TOKEN_DEPLOYMENT, concurrency,
+                max(requests_per_level, concurrency * 4), tokens,
+            )
+            results.append(level)
+            if log:
+                print(f"  c={concurrency:<5} {level.requests_per_s:>9,.0f} req/s {level.chunks_per_s:>11,.0f} chunks/s"
+                      f"  p50={level.latency_p50_ms or 0:7.1f} ms  loop_lag_max={level.loop_lag_max_ms:6.1f} ms")
+
+        trusted = [level for level in results if level.loop_lag_max_ms <= lag_threshold_ms] or results[:1]
+        return CalibrationResult(
+            tokens_per_request=tokens,
+            per_request_overhead_ms=per_request_ms,
+            per_chunk_overhead_us=per_chunk_ms * 1000,
+            max_requests_per_s=max(level.requests_per_s for level in trusted),
+            max_chunks_per_s=max(level.chunks_per_s for level in trusted),
+            lag_threshold_ms=lag_threshold_ms,
+            levels=results,
+        )
+    finally:
+        await pool.close()
+        server.terminate()
+        await server.wait()
+
+
+def load_calibration(path: Path) -> Optional[CalibrationResult]:
+    """读取缓存的校准结果（不存在或格式不符时返回 None）"""
+    try:
+        return CalibrationResult.from_dict(json.loads(Path(path).read_text(encoding="utf-8")))
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def save_calibration(result: CalibrationResult, path: Path) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(result.to_dict(), ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp.replace(path)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--levels", default=",".join(str(c) for c in DEFAULT_LEVELS))
+    ap.add_argument("--tokens", type=int, default=50, help="每个响应的 token（增量块）数")
+    ap.add_argument("--requests", type=int, default=200, help="每个并发级别至少发出的请求数")
+    ap.add_argument("--lag-threshold", type=float, default=5.0, help="可信的事件循环最大滞后（毫秒）")
+    ap.add_argument("--output", default=None, help="保存结果的 JSON 路径")
+    ap.add_argument("--serve-mock", type=int, default=None, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.serve_mock is not None:
+        asyncio.run(_serve_mock(args.serve_mock))
+        return
+
+    # 日志输出本身是开销的一部分，但逐请求 INFO 日志会淹没结果
+    import logging
+    logging.getLogger("tester.latency_tester").setLevel(logging.WARNING)
+
+    print(f"🧪 校准压测工具开销（Python {platform.python_version()}）")
+    result = asyncio.run(calibrate(
+        levels=[int(c) for c in args.levels.split(",") if c.strip()],
+        tokens=args.tokens,
+        requests_per_level=args.requests,
+        lag_threshold_ms=args.lag_threshold,
+    ))
+    print(f"  每请求开销: {result.per_request_overhead_ms:.3f} ms CPU")
+    print(f"  每增量块开销: {result.per_chunk_overhead_us:.1f} µs CPU")
+    print(f"  可信上限: {result.max_requests_per_s:,.0f} req/s, {result.max_chunks_per_s:,.0f} chunks/s "
+          f"(事件循环滞后 ≤ {result.lag_threshold_ms:g} ms)")
+    if args.output:
+        save_calibration(result, Path(args.output))
+        print(f"  已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+"""容量搜索：在延迟 SLO 约束下寻找最高并发 / RPS
+
+先从起始负载倍增直到某个探测点不满足 SLO，再在最后一次通过与第一次失败
+之间二分。每个探测点边跑边计数，一旦超出错误或分位数预算（结果已确定
+不可能满足 SLO）就提前中止，失败点不必跑完。
+"""
+from __future__ import annotations
+
+import math
+import re
+from dataclasses import dataclass, field, replace
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from tester.aggregator import LatencyStats
+from tester.latency_tester import (
+    LatencyTester,
+    ModelConfig,
+    RecordCallback,
+    RequestRecord,
+    StreamCallback,
+)
+
+# 可作为 SLO 的统计列：总延迟或首 token 延迟的分位数
+_LIMIT_KEY = re.compile(r"^(first_token_)?p(\d+)$")
+
+TesterFactory = Callable[[], LatencyTester]
+
+
+def _quantile_of(key: str) -> float:
+    """``p95`` -> 0.95, ``p999`` -> 0.999"""
+    digits = _LIMIT_KEY.match(key).group(2)
+    return int(digits) / 10 ** len(digits)
+
+
+@dataclass
+class SLO:
+    """Latency limits (summary column -> ms) plus an error-rate budget.
+
+    Keys are ``pNN`` for total latency or ``first_token_pNN`` for TTFT,
+    e.g. ``{"p95": 8000, "first_token_p95": 1500}``.
+    """
+
+    limits: Dict[str, float]
+    max_error_rate: float = 0.01
+
+    def __post_init__(self):
+        for key in self.limits:
+            if not _LIMIT_KEY.match(key):
+                raise ValueError(f"Unsupported SLO metric: {key}")
+
+    def violations(self, row: Dict[str, Any]) -> List[str]:
+        """Human-readable list of broken conditions (empty when the SLO is met)."""
+        broken = []
+        if not row.get("success_count"):
+            return ["no successful requests"]
+        for key, limit in self.limits.items():
+            value = row.get(key)
+            if value is None or value > limit:
+                broken.append(f"{key}={value if value is None else round(value, 1)} > {limit:g}")
+        if row["error_rate"] > self.max_error_rate:
+            broken.append(f"error_rate={row['error_rate']:.3f} > {self.max_error_rate:g}")
+        return broken
+
+    def to_dict(self) -> dict:
+        return {"limits": dict(self.limits), "max_error_rate": self.max_error_rate}
+
+
+@dataclass
+class Probe:
+    """One load level tried during the search."""
+
+    load: float
+    label: str
+    passed: bool
+    # 提前判定失败（已超出错误或延迟预算）而中止
+    aborted: bool
+    violations: List[str]
+    row: Dict[str, Any]
+
+    def to_dict(self) -> dict:
+        return {
+            "load": self.load,
+            "label": self.label,
+            "passed": self.passed,
+            "aborted": self.aborted,
+            "violations": self.violations,
+            "row": self.row,
+        }
+
+
+@dataclass
+class CapacityResult:
+    model: str
+    mode: str
+    # 满足 SLO 的最高负载；起始负载就不满足时为 None
+    max_load: Optional[float]
+    best: Optional[Dict[str, Any]]
+    probes: List[Probe] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return {
+            "model": self.model,
+            "mode": self.mode,
+            "max_load": self.max_load,
+            "best": self.best,
+            "probes": [probe.to_dict() for probe in self.probes],
+        }
+
+
+def _allowance(fraction: float, planned: int) -> float:
+    # 去掉浮点误差：(1 - 0.9) * 20 得到 1.9999999999999996，会在恰好用完预算时误判失败
+    return round(fraction * planned, 9)
+
+
+class _ProbeBudget:
+    """Counts outcomes during a probe and says when the SLO can no longer be met.
+
+    With ``planned`` requests, a quantile limit is certainly broken once more
+    than ``(1 - q) * planned`` requests exceed it; likewise the error budget.
+    """
+
+    def __init__(self, slo: SLO, planned: int):
+        self.planned = planned
+        self.max_errors = _allowance(slo.max_error_rate, planned)
+        self.limits = [
+            (key.startswith("first_token_"), limit, _allowance(1 - _quantile_of(key), planned))
+            for key, limit in slo.limits.items()
+        ]
+        self.over = [0] * len(self.limits)
+        self.errors = 0
+
+    def add(self, record: RequestRecord) -> bool:
+        """Returns True when the probe is already a certain failure."""
+        if record.error is not None:
+            self.errors += 1
+            return self.errors > self.max_errors
+        for i, (first_token, limit, allowance) in enumerate(self.limits):
+            value = record.first_token_latency_ms if first_token else record.latency_ms
+            if value is not None and value > limit:
+                self.over[i] += 1
+                if self.over[i] > allowance:
+                    return True
+        return False
+
+
+class CapacitySearch:
+    """Find the highest concurrency (or RPS) per model that still meets an SLO.
+
+    Steps the load up geometrically from ``start`` until a probe fails (or
+    ``max_load`` passes), then bisects between the last pass and the first
+    failure until they are within ``precision`` (relative; concurrency also
+    stops at a gap of 1). Each probe gets a fresh tester from
+    ``tester_factory`` so it can be aborted early: as soon as the error or
+    latency budget is provably exceeded the probe stops and counts as a fail.
+
+    Exposes ``cancel()``/``cancelled`` like ``LatencyTester`` so callers can
+    treat it the same way.
+    """
+
+    def __init__(
+        self,
+        tester_factory: TesterFactory,
+        slo: SLO,
+        mode: str = "concurrency",
+        start: float = 1,
+        max_load: float = 1024,
+        precision: float = 0.1,
+        probe_iterations: int = 5,
+        min_requests: int = 20,
+        probe_duration_s: float = 30.0,
+    ):
+        if mode not in ("concurrency", "rps"):
+            raise ValueError(f"Unknown search mode: {mode}")
+        self.tester_factory = tester_factory
+        self.slo = slo
+        self.mode = mode
+        self.start = start
+        self.max_load = max_load
+        self.precision = precision
+        self.probe_iterations = probe_iterations
+        self.min_requests = min_requests
+        self.probe_duration_s = probe_duration_s
+        self.cancelled = False
+        self._current: Optional[LatencyTester] = None
+        self.results: Dict[str, CapacityResult] = {}
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        if self._current is not None:
+            self._current.cancel()
+
+    def _normalize(self, load: float) -> float:
+        return float(max(1, round(load))) if self.mode == "concurrency" else load
+
+    def _probe_config(self, config: ModelConfig, load: float) -> ModelConfig:
+        if self.mode == "concurrency":
+            concurrency = int(load)
+            iterations = max(self.probe_iterations, math.ceil(self.min_requests / concurrency))
+            # 闭环按请求数运行：清掉可能来自测试参数的 rps / duration_s
+            return replace(config, concurrency=concurrency, iterations=iterations, rps=None, duration_s=None)
+        # 开环按时长运行
+        return replace(config, rps=load, duration_s=self.probe_duration_s)
+
+    def _planned(self, probe_config: ModelConfig) -> int:
+        if self.mode == "concurrency":
+            return probe_config.concurrency * probe_config.iterations
+        return max(1, int(probe_config.rps * probe_config.duration_s))
+
+    def _label(self, load: float) -> str:
+        return f"c={load:g}" if self.mode == "concurrency" else f"rps={load:g}"
+
+    async def _probe(
+        self,
+        config: ModelConfig,
+        load: float,
+        question: Optional[str],
+        stream_callback: Optional[StreamCallback],
+        record_callback: Optional[RecordCallback],
+    ) -> Probe:
+        probe_config = self._probe_config(config, load)
+        label = self._label(load)
+        budget = _ProbeBudget(self.slo, self._planned(probe_config))
+        stats = LatencyStats()
+        tester = self.tester_factory()
+        self._current = tester
+        aborted = False
+
+        def on_record(record: RequestRecord):
+            nonlocal aborted
+            record.stage = label
+            stats.add(record)
+            if record_callback:
+                record_callback(record)
+            if not aborted and budget.add(record):
+                aborted = True
+                tester.cancel()
+
+        try:
+            await tester.run_models(
+                [probe_config],
+                question=question,
+                stream_callback=stream_callback,
+                record_callback=on_record,
+                keep_records=False,
+            )
+        finally:
+            self._current = None
+        row = stats.to_row(config.name, label)
+        violations = self.slo.violations(row)
+        if aborted and not violations:
+            violations = ["budget exceeded before the probe finished"]
+        return Probe(
+            load=load,
+            label=label,
+            passed=not violations,
+            aborted=aborted,
+            violations=violations,
+            row=row,
+        )
+
+    def _converged(self, passed: float, failed: float) -> bool:
+        if self.mode == "concurrency" and failed - passed <= 1:
+            return True
+        return (failed - passed) / failed <= self.precision
+
+    async def iter_search(
+        self,
+        config: ModelConfig,
+        question: Optional[str] = None,
+        stream_callback: Optional[StreamCallback] = None,
+        record_callback: Optional[RecordCallback] = None,
+    ) -> AsyncIterator[Probe]:
+        """Run the search for one model, yielding each probe as it finishes.
+
+        Records are tagged with the probe label as ``stage``, so a
+        ``RunAggregator`` fed by ``record_callback`` gets one row per probe.
+        The outcome is stored in ``self.results[config.name]``.
+        """
+        result = CapacityResult(model=config.name, mode=self.mode, max_load=None, best=None)
+        self.results[config.name] = result
+        passed: Optional[Probe] = None
+        failed: Optional[Probe] = None
+
+        async def run(load: float) -> Probe:
+            probe = await self._probe(config, load, question, stream_callback, record_callback)
+            result.probes.append(probe)
+            return probe
+
+        # 第一阶段：从 start 起倍增，直到失败或到达上限
+        load = self._normalize(self.start)
+        while not self.cancelled:
+            probe = await run(load)
+            yield probe
+            if self.cancelled:
+                break
+            if not probe.passed:
+                failed = probe
+                break
+            passed = probe
+            if load >= self.max_load:
+                break
+            load = self._normalize(min(self.max_load, load * 2))
+
+        # 第二阶段：在最后一次通过与第一次失败之间二分
+        while passed and failed and not self.cancelled and not self._converged(passed.load, failed.load):
+            mid = self._normalize((passed.load + failed.load) / 2)
+            if mid in (passed.load, failed.load):
+                break
+            probe = await run(mid)
+            yield probe
+            if self.cancelled:
+                break
+            if probe.passed:
+                passed = probe
+            else:
+                failed = probe
+
+        if passed is not None:
+            result.max_load = passed.load
+            result.best = passed.row
+
+    async def search(
+        self,
+        config: ModelConfig,
+        question: Optional[str] = None,
+        stream_callback: Optional[StreamCallback] = None,
+        record_callback: Optional[RecordCallback] = None,
+    ) -> CapacityResult:
+        async for _ in self.iter_search(config, question, stream_callback, record_callback):
+            pass
+        return self.results[config.name]
@@ -0,0 +1,162 @@
+"""提示词语料：从 JSONL / CSV 文件流式抽样，替代固定的 question
+
+所有请求都发同一个问题会让结果偏好看：服务端前缀缓存命中率高，输出长度
+也几乎一致。语料模式下每个请求从本地文件取一条提示词：
+
+  - JSONL 每行一个对象，CSV 第一行为表头；字段 ``prompt``（或 ``question``），
+    可选 ``system``（系统提示词）与 ``max_tokens``
+  - 文件从不整体载入：JSONL 按种子跳到随机字节偏移，每次连续读一小段行，
+    再经过固定大小的洗牌缓冲区随机取出，因此百万行的语料从第一个请求起就
+    覆盖全文件；CSV（字段内可能有换行，不能随机定位）从头顺序读、读完循环。
+    内存只与缓冲区大小有关
+  - 按估计的提示词 token 数（字符数 / 4）划分长度区间，统计可按区间拆分
+"""
+from __future__ import annotations
+
+import csv
+import json
+import random
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence
+
+from tester.rate_limiter import CHARS_PER_TOKEN
+
+SUPPORTED_SUFFIXES = (".jsonl", ".ndjson", ".csv")
+# 提示词长度区间边界（估计 token 数）
+DEFAULT_BAND_EDGES = (256, 1024, 4096, 16384)
+
+
+@dataclass
+class CorpusEntry:
+    prompt: str
+    system: Optional[str] = None
+    max_tokens: Optional[int] = None
+
+
+def _entry_from_mapping(item: dict, where: str) -> CorpusEntry:
+    prompt = item.get("prompt") or item.get("question")
+    if not prompt:
+        raise ValueError(f"{where}: missing 'prompt'")
+    max_tokens = item.get("max_tokens")
+    return CorpusEntry(
+        prompt=str(prompt),
+        system=item.get("system") or None,
+        max_tokens=int(max_tokens) if max_tokens not in (None, "") else None,
+    )
+
+
+def _parse_json_line(line: bytes, where: str) -> Optional[CorpusEntry]:
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        item = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"{where}: {e}") from e
+    return _entry_from_mapping(item, where)
+
+
+def iter_corpus_file(path: Path) -> Iterator[CorpusEntry]:
+    """Yield every entry of the file once, reading line by line."""
+    if path.suffix.lower() == ".csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            for line_no, row in enumerate(csv.DictReader(f), start=2):
+                yield _entry_from_mapping(row, f"{path.name}:{line_no}")
+        return
+    with open(path, "rb") as f:
+        for line_no, line in enumerate(f, start=1):
+            entry = _parse_json_line(line, f"{path.name}:{line_no}")
+            if entry is not None:
+                yield entry
+
+
+class PromptCorpus:
+    """Endless seeded sample of a JSONL/CSV corpus in constant memory.
+
+    Entries stream into a shuffle buffer of ``buffer_size``; each ``next()``
+    takes a random slot and refills it from the source. For JSONL the source
+    reads runs of ``run_length`` consecutive lines starting at random byte
+    offsets (wrapping at EOF); CSV is read sequentially and restarts at EOF.
+    With a seed the sequence is reproducible.
+    """
+
+    def __init__(
+        self,
+        path,
+        seed: Optional[int] = None,
+        buffer_size: int = 1024,
+        run_length: int = 64,
+    ):
+        self.path = Path(path)
+        if self.path.suffix.lower() not in SUPPORTED_SUFFIXES:
+            raise ValueError(f"Unsupported corpus format: {self.path.name}")
+        if not self.path.is_file():
+            raise FileNotFoundError(f"Corpus not found: {self.path}")
+        self.buffer_size = max(1, buffer_size)
+        self.run_length = max(1, run_length)
+        self._rng = random.Random(seed)
+        self._source = self._cycle() if self.path.suffix.lower() == ".csv" else self._random_runs()
+        self._buffer: List[CorpusEntry] = []
+
+    def _cycle(self) -> Iterator[CorpusEntry]:
+        while True:
+            empty = True
+            for entry in iter_corpus_file(self.path):
+                empty = False
+                yield entry
+            if empty:
+                raise ValueError(f"Corpus is empty: {self.path}")
+
+    def _random_runs(self) -> Iterator[CorpusEntry]:
+        size = self.path.stat().st_size
+        if not size:
+            raise ValueError(f"Corpus is empty: {self.path}")
+        with open(self.path, "rb") as f:
+            while True:
+                offset = self._rng.randrange(size)
+                f.seek(offset)
+                if offset:
+                    f.readline()  # 丢弃不完整的一行，对齐到下一行开头
+                produced = 0
+                # 读过超过整个文件仍没有条目，说明文件里只有空行
+                scanned = 0
+                while produced < self.run_length:
+                    position = f.tell()
+                    line = f.readline()
+                    if not line:
+                        f.seek(0)
+                        continue
+                    scanned += len(line)
+                    entry = _parse_json_line(line, f"{self.path.name}@{position}")
+                    if entry is None:
+                        if scanned > size:
+                            raise ValueError(f"Corpus is empty: {self.path}")
+                        continue
+                    produced += 1
+                    yield entry
+
+    def next(self) -> CorpusEntry:
+        if not self._buffer:
+            # 首次取用时填满缓冲区（小语料会在缓冲区内重复出现，不影响均匀性）
+            self._buffer = [next(self._source) for _ in range(self.buffer_size)]
+        index = self._rng.randrange(len(self._buffer))
+        entry = self._buffer[index]
+        self._buffer[index] = next(self._source)
+        return entry
+
+
+def prompt_band(prompt_chars: int, edges: Optional[Sequence[int]] = None) -> str:
+    """按估计 token 数返回区间标签，如 ``256-1k``、``>=16k``"""
+    edges = edges or DEFAULT_BAND_EDGES
+    tokens = prompt_chars / CHARS_PER_TOKEN
+    lower = 0
+    for edge in edges:
+        if tokens < edge:
+            return f"{_short(lower)}-{_short(edge)}"
+        lower = edge
+    return f">={_short(lower)}"
+
+
+def _short(n: int) -> str:
+    return f"{n // 1024}k" if n >= 1024 and n % 1024 == 0 else str(n)
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import List, Optional
+
+import aiohttp
+
+from tester.tracing import phase_trace_config
+
+logger = logging.getLogger(__name__)
+
+
+class HttpClientPool:
+    """Process-wide pooled aiohttp session shared by every test task.
+
+    The pool is owned by the application lifespan: ``start()`` on startup,
+    ``close()`` on shutdown. ``LatencyTester`` borrows ``session`` instead of
+    opening its own, so keep-alive connections survive across test runs.
+    With ``trace_phases`` the session also records per-request connection
+    phases (see ``tester.tracing``).
+    """
+
+    def __init__(
+        self,
+        limit: int = 1000,
+        limit_per_host: int = 200,
+        dns_cache_ttl: int = 300,
+        keepalive_timeout: float = 60.0,
+        trace_configs: Optional[List[aiohttp.TraceConfig]] = None,
+        trace_phases: bool = True,
+    ):
+        self.limit = limit
+        # 每个 endpoint (host:port) 的连接上限
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.trace_configs = list(trace_configs or [])
+        if trace_phases:
+            self.trace_configs.append(phase_trace_config())
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def closed(self) -> bool:
+        return self._session is None or self._session.closed
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_cache_ttl,
+            use_dns_cache=True,
+            keepalive_timeout=self.keepalive_timeout,
+            enable_cleanup_closed=True,
+        )
+        # 超时由每个请求单独传入，session 本身不设总超时
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=None),
+            trace_configs=self.trace_configs or None,
+        )
+
+    async def start(self) -> None:
+        async with self._lock:
+            if self.closed:
+                self._session = self._create_session()
+                logger.info(
+                    "HTTP client pool started (limit=%s, limit_per_host=%s, dns_ttl=%ss, keepalive=%ss)",
+                    self.limit,
+                    self.limit_per_host,
+                    self.dns_cache_ttl,
+                    self.keepalive_timeout,
+                )
+
+    async def close(self) -> None:
+        async with self._lock:
+            if self._session is not None and not self._session.closed:
+                await self._session.close()
+                logger.info("HTTP client pool closed")
+            self._session = None
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Return the shared session, starting the pool lazily if needed."""
+        if self.closed:
+            await self.start()
+        assert self._session is not None
+        return self._session
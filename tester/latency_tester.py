@@ -1,18 +1,30 @@
 from __future__ import annotations
 
 import asyncio
-import json
+import itertools
 import logging
+import random
 import time
+from array import array
 from dataclasses import dataclass, replace
-from typing import Any, Callable, Dict, Iterable, List, Optional
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
 
 import aiohttp
+from tenacity import AsyncRetrying, retry_if_result, stop_after_attempt
+
+from tester.corpus import PromptCorpus, prompt_band
+from tester.http_pool import HttpClientPool
+from tester.rate_limiter import RateLimiterRegistry, estimate_tokens, shared_rate_limiters
+from tester.retry import RETRYABLE_STATUSES, THROTTLED_STATUS, RetryWait, parse_retry_after
+from tester.sse_parser import SSEStreamParser
+from tester.tracing import RequestPhases, phase_trace_config
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-StreamCallback = Callable[[str, int, str], None]  # model_name, request_id, chunk
+# model_name, request_id, chunk；返回可等待对象时会先等待它完成再读取后续增量（背压）
+StreamCallback = Callable[[str, int, str], Optional[Awaitable[None]]]
+RecordCallback = Callable[["RequestRecord"], None]  # 每个请求完成时回调
 
 # 模型参数兼容性配置
 MODEL_PARAM_OVERRIDES = {
@@ -51,6 +63,29 @@ class ModelConfig:
     concurrency: int = 1
     iterations: int = 1
     stream: bool = False
+    # 开环模式：目标每秒请求数（为空则使用闭环并发模式）
+    rps: Optional[float] = None
+    # 开环到达间隔分布："constant" 或 "poisson"
+    arrival: str = "constant"
+    # 开环：第一个请求相对开始时刻的延迟（秒），多进程分片用来错开恒定间隔的到达
+    arrival_offset_s: float = 0.0
+    seed: Optional[int] = None
+    # 定时模式：运行 duration_s 秒（设置后忽略 iterations）
+    duration_s: Optional[float] = None
+    # 429 / 5xx 的重试次数（0 表示不重试）；退避期间仍占用并发槽位
+    max_retries: int = 0
+    retry_backoff_ms: float = 500.0
+    retry_max_backoff_ms: float = 30000.0
+    # 客户端限流预算（每分钟请求数 / token 数），为空表示不限；同一部署在进程内共享
+    rpm_limit: Optional[float] = None
+    tpm_limit: Optional[float] = None
+    # 语料模式：每个请求从该 JSONL/CSV 文件按 seed 抽取提示词（优先于 question/prompt）
+    corpus_path: Optional[str] = None
+    # 提示词长度区间边界（估计 token 数），为空使用默认区间
+    prompt_band_edges: Optional[List[int]] = None
+    # 预热：开头的若干个请求 / 若干秒内发出的请求单独统计，不计入主统计
+    warmup_requests: int = 0
+    warmup_s: float = 0.0
 
     def with_overrides(
         self,
@@ -60,6 +95,19 @@ class ModelConfig:
         concurrency: Optional[int] = None,
         iterations: Optional[int] = None,
         stream: Optional[bool] = None,
+        rps: Optional[float] = None,
+        arrival: Optional[str] = None,
+        seed: Optional[int] = None,
+        duration_s: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        retry_backoff_ms: Optional[float] = None,
+        retry_max_backoff_ms: Optional[float] = None,
+        rpm_limit: Optional[float] = None,
+        tpm_limit: Optional[float] = None,
+        corpus_path: Optional[str] = None,
+        prompt_band_edges: Optional[List[int]] = None,
+        warmup_requests: Optional[int] = None,
+        warmup_s: Optional[float] = None,
     ) -> "ModelConfig":
         return replace(
             self,
@@ -69,6 +117,21 @@ class ModelConfig:
             concurrency=concurrency if concurrency is not None else self.concurrency,
             iterations=iterations if iterations is not None else self.iterations,
             stream=stream if stream is not None else self.stream,
+            rps=rps if rps is not None else self.rps,
+            arrival=arrival if arrival is not None else self.arrival,
+            seed=seed if seed is not None else self.seed,
+            duration_s=duration_s if duration_s is not None else self.duration_s,
+            max_retries=max_retries if max_retries is not None else self.max_retries,
+            retry_backoff_ms=retry_backoff_ms if retry_backoff_ms is not None else self.retry_backoff_ms,
+            retry_max_backoff_ms=(
+                retry_max_backoff_ms if retry_max_backoff_ms is not None else self.retry_max_backoff_ms
+            ),
+            rpm_limit=rpm_limit if rpm_limit is not None else self.rpm_limit,
+            tpm_limit=tpm_limit if tpm_limit is not None else self.tpm_limit,
+            corpus_path=corpus_path if corpus_path is not None else self.corpus_path,
+            prompt_band_edges=prompt_band_edges if prompt_band_edges is not None else self.prompt_band_edges,
+            warmup_requests=warmup_requests if warmup_requests is not None else self.warmup_requests,
+            warmup_s=warmup_s if warmup_s is not None else self.warmup_s,
         )
 
 
@@ -86,35 +149,184 @@ class RequestRecord:
     total_tokens: Optional[int]
     response_text: Optional[str]
     first_token_latency_ms: Optional[float] = None  # 流式情况下第一个token的延迟
+    # 开环模式下请求实际调度发出时间相对计划时间的滞后（不含限流等待）
+    schedule_lag_ms: Optional[float] = None
+    # 负载曲线中的阶段标签（非分阶段运行时为空）
+    stage: Optional[str] = None
+    # 流式：每次带有输出的网络读取相对请求开始的到达时间（毫秒，float32 紧凑数组）。
+    # 一次读取可能包含多个增量块，因此 token 间隔（ITL）按读取计算
+    chunk_times_ms: Optional[array] = None
+    # 首 token 之后每个输出 token 的平均耗时（time per output token）
+    tpot_ms: Optional[float] = None
+    # 解码阶段吞吐（tokens/s）
+    decode_tokens_per_s: Optional[float] = None
+    # 重试：尝试次数、退避等待总时长、首次尝试的延迟与其中 429 响应的次数。
+    # 重试时 start_time 为首次尝试开始，latency_ms 及首 token 延迟取最后一次尝试
+    attempts: int = 1
+    backoff_ms: float = 0.0
+    first_attempt_latency_ms: Optional[float] = None
+    throttled: int = 0
+    # 发送前在客户端限流器中等待的总时长（含每次重试）
+    rate_limit_wait_ms: float = 0.0
+    # 语料模式下提示词所属的长度区间
+    prompt_band: Optional[str] = None
+    # 属于预热段（按 warmup_requests / warmup_s 标记），不计入主统计
+    warmup: bool = False
+    # 连接阶段耗时（见 tester.tracing，取最后一次尝试）：连接池排队、DNS、TCP+TLS 建连
+    # （复用连接时 dns/connect 为空）、发送请求、等待响应头、读取响应体，以及响应体字节数
+    pool_wait_ms: Optional[float] = None
+    dns_ms: Optional[float] = None
+    connect_ms: Optional[float] = None
+    send_ms: Optional[float] = None
+    ttfb_ms: Optional[float] = None
+    transfer_ms: Optional[float] = None
+    bytes_received: Optional[int] = None
+
+
+@dataclass
+class _Attempt:
+    """单次 HTTP 尝试的结果及是否值得重试"""
+    record: RequestRecord
+    retryable: bool
+    # 服务端通过 retry-after-ms / Retry-After 建议的等待秒数
+    retry_after_s: Optional[float] = None
+
+
+def next_interarrival(rate: float, arrival: str, rng: random.Random) -> float:
+    """返回下一次到达的间隔（秒）。"""
+    if arrival == "poisson":
+        return rng.expovariate(rate)
+    if arrival == "constant":
+        return 1.0 / rate
+    raise ValueError(f"Unknown arrival process: {arrival}")
+
+
+def tag_warmup(config: ModelConfig, emit: RecordCallback) -> RecordCallback:
+    """Wrap ``emit`` so records inside the configured warm-up window get ``warmup=True``.
+
+    Request ids are assigned in issue order in every run mode, so the first
+    ``warmup_requests`` ids and anything sent within ``warmup_s`` of now
+    count as warm-up.
+    """
+    warmup_until = time.perf_counter() + config.warmup_s
+
+    def tagged(record: RequestRecord):
+        record.warmup = record.request_id < config.warmup_requests or record.start_time < warmup_until
+        emit(record)
+
+    return tagged
 
 
 class LatencyTester:
-    def __init__(self, request_timeout: float = 60.0):
+    def __init__(
+        self,
+        request_timeout: float = 60.0,
+        pool: Optional[HttpClientPool] = None,
+        rate_limiters: Optional[RateLimiterRegistry] = None,
+    ):
         self.request_timeout = request_timeout
+        # 共享连接池（由应用生命周期持有）；为空时每次 run_models 自建临时 session
+        self.pool = pool
+        # RPM/TPM 限流器默认进程内共享，并发任务与同时运行的测试共用配额
+        self.rate_limiters = rate_limiters or shared_rate_limiters
+        # 正在运行的各模型任务，cancel() 时一并取消
+        self._runs: Set[asyncio.Task] = set()
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        """Stop all schedulers and abort in-flight requests.
+
+        Cancelled requests produce no record; ``run_models`` returns normally
+        with whatever completed before the cancel, so callers can still
+        summarise a partial run. Later ``run_models`` calls return immediately.
+        """
+        self.cancelled = True
+        for task in list(self._runs):
+            task.cancel()
 
     async def run_models(
         self,
         configs: Iterable[ModelConfig],
         question: Optional[str] = None,
         stream_callback: Optional[StreamCallback] = None,
+        record_callback: Optional[RecordCallback] = None,
+        keep_records: bool = True,
     ) -> List[RequestRecord]:
-        timeout = aiohttp.ClientTimeout(total=self.request_timeout)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            tasks = [
-                asyncio.create_task(self._run_model(config, question, session, stream_callback))
-                for config in configs
-            ]
-            results_nested = await asyncio.gather(*tasks)
-        return [r for sub in results_nested for r in sub]
+        """Run every config concurrently.
 
-    async def _run_model(
+        ``record_callback`` receives each record as soon as it completes. With
+        ``keep_records=False`` nothing is retained and an empty list is
+        returned, so long runs stay at constant memory.
+        """
+        if self.pool is not None:
+            session = await self.pool.get_session()
+            return await self._run_models_with_session(
+                configs, question, session, stream_callback, record_callback, keep_records
+            )
+
+        async with aiohttp.ClientSession(trace_configs=[phase_trace_config()]) as session:
+            return await self._run_models_with_session(
+                configs, question, session, stream_callback, record_callback, keep_records
+            )
+
+    async def _run_models_with_session(
         self,
-        config: ModelConfig,
+        configs: Iterable[ModelConfig],
         question: Optional[str],
         session: aiohttp.ClientSession,
         stream_callback: Optional[StreamCallback],
+        record_callback: Optional[RecordCallback],
+        keep_records: bool,
     ) -> List[RequestRecord]:
         records: List[RequestRecord] = []
+
+        def emit(record: RequestRecord):
+            if keep_records:
+                records.append(record)
+            if record_callback:
+                record_callback(record)
+
+        if self.cancelled:
+            return records
+
+        tasks = [
+            asyncio.create_task(self._run_model(config, question, session, stream_callback, emit))
+            for config in configs
+        ]
+        self._runs.update(tasks)
+        try:
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            # 由 cancel() 取消时返回已完成的部分；调用方自身被取消则继续向上抛出
+            if not self.cancelled:
+                raise
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            self._runs.difference_update(tasks)
+        return records
+
+    async def _run_model(
+        self,
+        config: ModelConfig,
+        question: Optional[str],
+        session: aiohttp.ClientSession,
+        stream_callback: Optional[StreamCallback],
+        emit: RecordCallback,
+    ) -> None:
+        # 每个模型一份语料读取器，按 seed 抽样（多进程时每个分片的 seed 不同）
+        corpus = PromptCorpus(config.corpus_path, seed=config.seed) if config.corpus_path else None
+
+        if config.warmup_requests or config.warmup_s:
+            emit = tag_warmup(config, emit)
+
+        if config.rps:
+            await self._run_model_open_loop(config, question, session, stream_callback, emit, corpus)
+            return
+
+        if config.duration_s:
+            await self._run_model_for_duration(config, question, session, stream_callback, emit, corpus)
+            return
+
         sem = asyncio.Semaphore(max(1, config.concurrency))
 
         async def worker(request_id: int):
@@ -125,14 +337,102 @@ class LatencyTester:
                     session=session,
                     request_id=request_id,
                     stream_callback=stream_callback,
+                    corpus=corpus,
                 )
-                records.append(record)
+                emit(record)
 
         # 总请求数 = 并发数 * 迭代次数
         total_requests = config.concurrency * config.iterations
         tasks = [asyncio.create_task(worker(i)) for i in range(total_requests)]
         await asyncio.gather(*tasks)
-        return records
+
+    async def _run_model_for_duration(
+        self,
+        config: ModelConfig,
+        question: Optional[str],
+        session: aiohttp.ClientSession,
+        stream_callback: Optional[StreamCallback],
+        emit: RecordCallback,
+        corpus: Optional[PromptCorpus] = None,
+    ) -> None:
+        """闭环定时模式：concurrency 个 worker 循环发请求，直到 duration_s 到期。"""
+        deadline = time.perf_counter() + config.duration_s
+        request_ids = itertools.count()
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                record = await self._single_request(
+                    config=config,
+                    question=question,
+                    session=session,
+                    request_id=next(request_ids),
+                    stream_callback=stream_callback,
+                    corpus=corpus,
+                )
+                emit(record)
+
+        await asyncio.gather(*(worker() for _ in range(max(1, config.concurrency))))
+
+    async def _run_model_open_loop(
+        self,
+        config: ModelConfig,
+        question: Optional[str],
+        session: aiohttp.ClientSession,
+        stream_callback: Optional[StreamCallback],
+        emit: RecordCallback,
+        corpus: Optional[PromptCorpus] = None,
+    ) -> None:
+        """开环模式：按目标 RPS 发请求，调度不等待响应返回。
+
+        发送时刻按绝对时间表计算（而不是累加 sleep），因此响应慢或事件循环
+        抖动都不会拖慢后续请求的发出；调度实际发出与计划的偏差记录在
+        ``schedule_lag_ms`` 中（客户端限流的等待另计于 ``rate_limit_wait_ms``）。设置 ``duration_s`` 时按时长而不是请求数停止。
+        """
+        rng = random.Random(config.seed)
+        rate = float(config.rps)
+        # 与闭环模式保持一致：总请求数 = 并发数 * 迭代次数
+        total_requests = config.concurrency * config.iterations
+
+        async def fire(request_id: int, scheduled: float):
+            # 滞后在调度发出时测量：之后的客户端限流等待单独记录在 rate_limit_wait_ms
+            dispatched = time.perf_counter()
+            record = await self._single_request(
+                config=config,
+                question=question,
+                session=session,
+                request_id=request_id,
+                stream_callback=stream_callback,
+                corpus=corpus,
+            )
+            record.schedule_lag_ms = (dispatched - scheduled) * 1000
+            emit(record)
+
+        # 只持有在途请求的句柄，长时间运行时内存不随请求数增长
+        in_flight: Set[asyncio.Task] = set()
+        started = time.perf_counter()
+        next_at = started + config.arrival_offset_s
+        deadline = started + config.duration_s if config.duration_s else None
+        try:
+            for request_id in itertools.count():
+                if deadline is not None:
+                    if next_at >= deadline:
+                        break
+                elif request_id >= total_requests:
+                    break
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                task = asyncio.create_task(fire(request_id, next_at))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+                next_at += next_interarrival(rate, config.arrival, rng)
+
+            if in_flight:
+                await asyncio.gather(*in_flight)
+        finally:
+            # 调度被取消时，已发出的请求不在 gather 中，需要单独中止
+            for task in list(in_flight):
+                task.cancel()
 
     async def _single_request(
         self,
@@ -141,8 +441,18 @@ class LatencyTester:
         session: aiohttp.ClientSession,
         request_id: int,
         stream_callback: Optional[StreamCallback],
+        corpus: Optional[PromptCorpus] = None,
     ) -> RequestRecord:
         is_codex = "codex" in config.name.lower()
+        prompt = question or config.prompt
+        system = "You are a helpful assistant."
+        max_tokens = config.max_tokens
+        band = None
+        if corpus is not None:
+            entry = corpus.next()
+            prompt = entry.prompt
+            system = entry.system or system
+            max_tokens = entry.max_tokens or max_tokens
 
         # 获取模型特定的参数覆盖
         param_overrides = MODEL_PARAM_OVERRIDES.get(config.name, {})
@@ -153,22 +463,25 @@ class LatencyTester:
         if is_codex:
             url = f"{config.endpoint.rstrip('/')}/openai/deployments/{config.name}/completions"
             payload: Dict[str, Any] = {
-                "prompt": [question or config.prompt],
-                "max_tokens": config.max_tokens,
+                "prompt": [prompt],
+                "max_tokens": max_tokens,
                 "temperature": temperature,
                 "stream": config.stream,
             }
         else:
             payload = {
                 "messages": [
-                    {"role": "system", "content": "You are a helpful assistant."},
-                    {"role": "user", "content": question or config.prompt},
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": prompt},
                 ],
                 # chat 模型用 max_completion_tokens，避免新版模型报 unsupported_parameter
-                "max_completion_tokens": config.max_tokens,
+                "max_completion_tokens": max_tokens,
                 "temperature": temperature,
                 "stream": config.stream,
             }
+            if config.stream:
+                # 让流的最后一个块带上 usage，才能得到 completion_tokens 计算 TPOT
+                payload["stream_options"] = {"include_usage": True}
 
         params = {"api-version": config.api_version}
         headers = {
@@ -178,19 +491,92 @@ class LatencyTester:
 
         logger.info(f"[{config.name}] Request #{request_id}: POST {url} with api-version={config.api_version}")
         
+        prompt_chars = len(prompt) if is_codex else len(prompt) + len(system)
+        if corpus is not None:
+            band = prompt_band(prompt_chars, config.prompt_band_edges)
+        limiter = self.rate_limiters.get(config.endpoint, config.name, config.rpm_limit, config.tpm_limit)
+        estimated_tokens = estimate_tokens(prompt_chars, max_tokens) if limiter is not None else 0
+        attempts: List[_Attempt] = []
+        rate_limit_wait_s = 0.0
+
+        async def attempt() -> _Attempt:
+            nonlocal rate_limit_wait_s
+            if limiter is not None:
+                # 每次尝试（包括重试）都计入部署配额
+                rate_limit_wait_s += await limiter.acquire(estimated_tokens)
+            result = await self._attempt(
+                config, is_codex, url, params, headers, payload, session, request_id, stream_callback
+            )
+            attempts.append(result)
+            result.record.rate_limit_wait_ms = rate_limit_wait_s * 1000
+            result.record.prompt_band = band
+            return result
+
+        if config.max_retries <= 0:
+            record = (await attempt()).record
+            record.first_attempt_latency_ms = record.latency_ms
+            record.throttled = int(record.status == THROTTLED_STATUS)
+            return record
+
+        backoff_s = 0.0
+
+        async def backoff(seconds: float):
+            nonlocal backoff_s
+            backoff_s += seconds
+            logger.info(f"[{config.name}] Request #{request_id}: retrying in {seconds:.2f}s")
+            await asyncio.sleep(seconds)
+
+        # 退避在当前协程内进行，闭环模式下并发槽位不会让给下一个请求
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(config.max_retries + 1),
+            wait=RetryWait(config.retry_backoff_ms / 1000, config.retry_max_backoff_ms / 1000),
+            retry=retry_if_result(lambda result: result.retryable),
+            sleep=backoff,
+            # 重试用尽时返回最后一次的结果（记为错误），而不是抛出 RetryError
+            retry_error_callback=lambda retry_state: retry_state.outcome.result(),
+        )
+        record = (await retrying(attempt)).record
+        first = attempts[0].record
+        record.start_time = first.start_time
+        record.attempts = len(attempts)
+        record.backoff_ms = backoff_s * 1000
+        record.first_attempt_latency_ms = first.latency_ms
+        record.throttled = sum(1 for a in attempts if a.record.status == THROTTLED_STATUS)
+        return record
+
+    async def _attempt(
+        self,
+        config: ModelConfig,
+        is_codex: bool,
+        url: str,
+        params: Dict[str, str],
+        headers: Dict[str, str],
+        payload: Dict[str, Any],
+        session: aiohttp.ClientSession,
+        request_id: int,
+        stream_callback: Optional[StreamCallback],
+    ) -> _Attempt:
         start = time.perf_counter()
         status: Optional[int] = None
         error: Optional[str] = None
         prompt_tokens = completion_tokens = total_tokens = None
         response_text_parts: List[str] = []
         first_token_time: Optional[float] = None  # 第一个token到达时间
+        chunk_times_ms = array("f")
+        retry_after_s: Optional[float] = None
+        connection_error = False
+        phases = RequestPhases()
 
         try:
-            async with session.post(url, headers=headers, params=params, json=payload) as resp:
+            timeout = aiohttp.ClientTimeout(total=self.request_timeout)
+            async with session.post(
+                url, headers=headers, params=params, json=payload, timeout=timeout, trace_request_ctx=phases
+            ) as resp:
                 status = resp.status
                 logger.info(f"[{config.name}] Request #{request_id}: Status {status}")
                 
                 if status >= 400:
+                    retry_after_s = parse_retry_after(resp.headers)
                     try:
                         err_json = await resp.json(content_type=None)
                         err_detail = err_json.get("error") or err_json
@@ -200,43 +586,41 @@ class LatencyTester:
                         error = f"HTTP {status}"
                         logger.error(f"[{config.name}] Request #{request_id}: {error}")
                 elif config.stream:
-                    async for raw_line in resp.content:
-                        line = raw_line.decode(errors="ignore").strip()
-                        if not line or not line.startswith("data:"):
-                            continue
-                        data_str = line[len("data:") :].strip()
-                        if data_str == "[DONE]":
-                            break
-                        try:
-                            data = json.loads(data_str)
-                        except json.JSONDecodeError:
-                            continue
-                        choices = data.get("choices") or []
-                        if not choices:
+                    parser = SSEStreamParser(completions=is_codex)
+                    async for raw in resp.content.iter_any():
+                        phases.bytes_received += len(raw)
+                        deltas = parser.feed(raw)
+                        if not deltas:
+                            if parser.done:
+                                break
                             continue
-                        if is_codex:
-                            delta = choices[0].get("text")
-                            if delta:
+                        # 同一次网络读取到的增量块共享到达时间，只记录一次：
+                        # 否则合并读取会产生一串 0 ms 的 token 间隔
+                        now = time.perf_counter()
+                        has_content = False
+                        for delta in deltas:
+                            # 开启 include_usage 后，最后一个块 choices 为空、只带 usage
+                            usage = delta.usage
+                            if usage:
+                                prompt_tokens = usage.get("prompt_tokens", prompt_tokens)
+                                completion_tokens = usage.get("completion_tokens", completion_tokens)
+                                total_tokens = usage.get("total_tokens", total_tokens)
+                            content = delta.content
+                            if content:
                                 # 记录第一个token的时间
                                 if first_token_time is None:
-                                    first_token_time = time.perf_counter()
-                                response_text_parts.append(delta)
+                                    first_token_time = now
+                                has_content = True
+                                response_text_parts.append(content)
                                 if stream_callback:
-                                    stream_callback(config.name, request_id, delta)
-                        else:
-                            delta = choices[0].get("delta", {}).get("content")
-                            if delta:
-                                # 记录第一个token的时间
-                                if first_token_time is None:
-                                    first_token_time = time.perf_counter()
-                                response_text_parts.append(delta)
-                                if stream_callback:
-                                    stream_callback(config.name, request_id, delta)
-                        usage = data.get("usage")
-                        if usage:
-                            prompt_tokens = usage.get("prompt_tokens", prompt_tokens)
-                            completion_tokens = usage.get("completion_tokens", completion_tokens)
-                            total_tokens = usage.get("total_tokens", total_tokens)
+                                    waiting = stream_callback(config.name, request_id, content)
+                                    if waiting is not None:
+                                        await waiting
+                        if has_content:
+                            # 每次带有输出的网络读取的到达时间（相对请求开始，毫秒）
+                            chunk_times_ms.append((now - start) * 1000)
+                        if parser.done:
+                            break
                 else:
                     data = await resp.json(content_type=None)
                     choices = data.get("choices") or []
@@ -262,6 +646,9 @@ class LatencyTester:
                             error = f"HTTP {status}: {err_detail}"
                         except Exception:
                             error = f"HTTP {status}"
+        except aiohttp.ClientConnectionError as exc:
+            error = str(exc) or type(exc).__name__
+            connection_error = True
         except Exception as exc:  # noqa: BLE001
             error = str(exc)
 
@@ -273,7 +660,17 @@ class LatencyTester:
         if config.stream and first_token_time is not None:
             first_token_latency_ms = (first_token_time - start) * 1000
         
-        return RequestRecord(
+        # 解码阶段指标：首 token 之后每个输出 token 的平均耗时与解码吞吐
+        tpot_ms = decode_tokens_per_s = None
+        if error is None and len(chunk_times_ms) > 1:
+            decode_ms = chunk_times_ms[-1] - chunk_times_ms[0]
+            # 优先使用 usage 中的 token 数，没有时以增量块数近似
+            output_tokens = completion_tokens or len(response_text_parts)
+            if decode_ms > 0 and output_tokens > 1:
+                tpot_ms = decode_ms / (output_tokens - 1)
+                decode_tokens_per_s = (output_tokens - 1) / (decode_ms / 1000)
+        
+        record = RequestRecord(
             model=config.name,
             request_id=request_id,
             start_time=start,
@@ -286,4 +683,13 @@ class LatencyTester:
             total_tokens=total_tokens,
             response_text="".join(response_text_parts) if response_text_parts else None,
             first_token_latency_ms=first_token_latency_ms,
+            chunk_times_ms=chunk_times_ms if chunk_times_ms else None,
+            tpot_ms=tpot_ms,
+            decode_tokens_per_s=decode_tokens_per_s,
+            **phases.to_fields(end),
+        )
+        # 限流 / 服务暂时不可用，或在收到任何输出前连接失败，才值得重试
+        retryable = error is not None and (
+            status in RETRYABLE_STATUSES or (connection_error and not response_text_parts)
         )
+        return _Attempt(record=record, retryable=retryable, retry_after_s=retry_after_s)
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field, replace
+from typing import AsyncIterator, Iterable, List, Optional, Sequence, Tuple
+
+from tester.latency_tester import (
+    LatencyTester,
+    ModelConfig,
+    RecordCallback,
+    RequestRecord,
+    StreamCallback,
+)
+
+
+@dataclass
+class LoadStage:
+    """One step of a load profile; unset fields fall back to the model config."""
+
+    label: str
+    concurrency: Optional[int] = None
+    iterations: Optional[int] = None
+    # 设置 rps 时该阶段以开环模式运行
+    rps: Optional[float] = None
+    # 设置后该阶段按时长而不是请求数结束
+    duration_s: Optional[float] = None
+
+    def apply(self, config: ModelConfig) -> ModelConfig:
+        return config.with_overrides(
+            concurrency=self.concurrency,
+            iterations=self.iterations,
+            rps=self.rps,
+            duration_s=self.duration_s,
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "label": self.label,
+            "concurrency": self.concurrency,
+            "iterations": self.iterations,
+            "rps": self.rps,
+            "duration_s": self.duration_s,
+        }
+
+
+@dataclass
+class LoadProfile:
+    """An ordered series of stages run back to back against the same models."""
+
+    stages: List[LoadStage] = field(default_factory=list)
+
+    @classmethod
+    def steps(cls, concurrency_levels: Sequence[int], iterations: int = 1) -> "LoadProfile":
+        """阶梯并发，例如 1→5→10→20。"""
+        return cls(
+            stages=[
+                LoadStage(label=f"c={level}", concurrency=level, iterations=iterations)
+                for level in concurrency_levels
+            ]
+        )
+
+    @classmethod
+    def linear_rps_ramp(
+        cls,
+        start_rps: float,
+        end_rps: float,
+        duration_s: float,
+        steps: int = 5,
+    ) -> "LoadProfile":
+        """把 duration_s 内的线性 RPS 爬坡离散为 steps 个等长开环阶段。"""
+        steps = max(1, steps)
+        stage_seconds = duration_s / steps
+        stages = []
+        for i in range(steps):
+            rps = start_rps if steps == 1 else start_rps + (end_rps - start_rps) * i / (steps - 1)
+            stages.append(LoadStage(label=f"rps={rps:g}", rps=rps, duration_s=stage_seconds))
+        return cls(stages=stages)
+
+    def to_dict(self) -> List[dict]:
+        return [stage.to_dict() for stage in self.stages]
+
+
+async def iter_profile(
+    tester: LatencyTester,
+    configs: Iterable[ModelConfig],
+    profile: LoadProfile,
+    question: Optional[str] = None,
+    stream_callback: Optional[StreamCallback] = None,
+    record_callback: Optional[RecordCallback] = None,
+    keep_records: bool = True,
+) -> AsyncIterator[Tuple[LoadStage, List[RequestRecord]]]:
+    """Run each stage in order and yield its records, tagged with the stage label.
+
+    Records are tagged before ``record_callback`` sees them, so streaming
+    aggregation (``keep_records=False``) also gets per-stage rows. Stops
+    after the current stage once ``tester.cancel()`` has been called. The
+    configured warm-up applies to the first stage only.
+    """
+    configs = list(configs)
+    for index, stage in enumerate(profile.stages):
+        if tester.cancelled:
+            break
+        stage_configs = [stage.apply(config) for config in configs]
+        if index:
+            # 后续阶段沿用已建立的连接，不再预热
+            stage_configs = [replace(config, warmup_requests=0, warmup_s=0.0) for config in stage_configs]
+
+        def tag(record: RequestRecord, label: str = stage.label):
+            record.stage = label
+            if record_callback:
+                record_callback(record)
+
+        records = await tester.run_models(
+            stage_configs,
+            question=question,
+            stream_callback=stream_callback,
+            record_callback=tag,
+            keep_records=keep_records,
+        )
+        yield stage, records
+
+
+async def run_profile(
+    tester: LatencyTester,
+    configs: Iterable[ModelConfig],
+    profile: LoadProfile,
+    question: Optional[str] = None,
+    stream_callback: Optional[StreamCallback] = None,
+) -> List[RequestRecord]:
+    all_records: List[RequestRecord] = []
+    async for _, records in iter_profile(tester, configs, profile, question, stream_callback):
+        all_records.extend(records)
+    return all_records
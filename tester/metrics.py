@@ -1,76 +1,83 @@
 from __future__ import annotations
 
+import math
 from dataclasses import asdict
-from typing import Iterable, List
+from typing import Iterable, Union
 
 import pandas as pd
 
+from tester.aggregator import RunAggregator
+
 
 def records_to_dataframe(records: Iterable) -> pd.DataFrame:
     """Convert a list of dataclass records to DataFrame."""
     return pd.DataFrame([asdict(r) for r in records])
 
 
-def summarize_latency(df: pd.DataFrame) -> pd.DataFrame:
-    """Return per-model latency summary."""
-    if df.empty:
+def summarize_latency(
+    data: Union[pd.DataFrame, Iterable],
+    steady_state_window: int = 0,
+) -> pd.DataFrame:
+    """Return per-model (and per-stage) latency summary.
+
+    Accepts either an iterable of ``RequestRecord`` or a DataFrame built by
+    ``records_to_dataframe``. Records are streamed into ``RunAggregator``
+    quantile sketches, so no intermediate DataFrame is materialised and the
+    summary includes p50/p90/p95/p99/p99.9 for total and first-token latency.
+
+    Records flagged ``warmup`` are left out. MSER-5 warm-up detection is off
+    by default; with ``steady_state_window`` > 0 the leading records it
+    detects within the first ``steady_state_window`` of each group are left
+    out as well, and rows must then be in completion order when they carry
+    no ``end_time``.
+    """
+    aggregator = RunAggregator(steady_state_window=steady_state_window)
+    rows = data.to_dict(orient="records") if isinstance(data, pd.DataFrame) else data
+    for row in rows:
+        aggregator.add(row if not isinstance(row, dict) else _RowRecord(row))
+    result_rows = aggregator.summary_rows()
+    if not result_rows:
         return pd.DataFrame()
-    
-    # 按模型分组统计
-    result_rows = []
-    
-    for model in df["model"].unique():
-        model_df = df[df["model"] == model]
-        success_df = model_df[model_df["error"].isna()]
-        
-        total_requests = len(model_df)
-        success_count = len(success_df)
-        error_count = total_requests - success_count
-        error_rate = error_count / total_requests if total_requests > 0 else 0
-        
-        # 计算延迟统计（仅成功的请求）
-        if len(success_df) > 0:
-            latencies = success_df["latency_ms"]
-            avg_latency = latencies.mean()
-            # 只有在成功请求数>1时才显示最低/最高延迟
-            if len(success_df) > 1:
-                min_latency = latencies.min()
-                max_latency = latencies.max()
-            else:
-                min_latency = max_latency = None
-        else:
-            avg_latency = min_latency = max_latency = None
-        
-        # 计算流式第一token延迟统计（仅有first_token_latency_ms数据的请求）
-        first_token_avg = first_token_min = first_token_max = None
-        if len(success_df) > 0 and "first_token_latency_ms" in success_df.columns:
-            first_token_df = success_df[success_df["first_token_latency_ms"].notna()]
-            if len(first_token_df) > 0:
-                first_token_latencies = first_token_df["first_token_latency_ms"]
-                first_token_avg = first_token_latencies.mean()
-                if len(first_token_df) > 1:
-                    first_token_min = first_token_latencies.min()
-                    first_token_max = first_token_latencies.max()
-                else:
-                    first_token_min = first_token_max = None
-        
-        result_rows.append({
-            "model": model,
-            "avg_latency": avg_latency,
-            "min_latency": min_latency,
-            "max_latency": max_latency,
-            "first_token_avg": first_token_avg,
-            "first_token_min": first_token_min,
-            "first_token_max": first_token_max,
-            "error_rate": error_rate,
-            "total_requests": total_requests,
-            "success_count": success_count,
-            "error_count": error_count,
-        })
-    
     return pd.DataFrame(result_rows)
 
 
+class _RowRecord:
+    """Attribute view over a DataFrame row dict (NaN treated as missing)."""
+
+    _DEFAULTS = {
+        "stage": None,
+        "error": None,
+        "first_token_latency_ms": None,
+        "schedule_lag_ms": None,
+        "chunk_times_ms": None,
+        "tpot_ms": None,
+        "decode_tokens_per_s": None,
+        "end_time": 0.0,
+        "attempts": 1,
+        "backoff_ms": 0.0,
+        "throttled": 0,
+        "rate_limit_wait_ms": 0.0,
+        "prompt_band": None,
+        "warmup": False,
+        "pool_wait_ms": None,
+        "dns_ms": None,
+        "connect_ms": None,
+        "send_ms": None,
+        "ttfb_ms": None,
+        "transfer_ms": None,
+        "bytes_received": None,
+    }
+
+    def __init__(self, row: dict):
+        self._row = row
+
+    def __getattr__(self, name: str):
+        value = self._row.get(name, self._DEFAULTS.get(name))
+        if isinstance(value, float) and math.isnan(value):
+            return None
+        return value
+
+
 def error_rate(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty:
         return pd.DataFrame()
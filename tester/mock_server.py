@@ -0,0 +1,385 @@
+"""本地 Azure OpenAI 模拟服务（可编程延迟与故障）
+
+用法:
+    python -m tester.mock_server --port 18080 --ttft lognormal:300,0.4 --itl normal:20,5 \\
+        --tokens 50-300 --rate-429 0.01 --rate-500 0.01 --stall-rate 0.001
+
+随后把 models.yaml 中某个模型的 endpoint 指向 http://127.0.0.1:18080 即可，
+无需真实部署、不消耗 token。
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import random
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from aiohttp import web
+
+# 生成内容使用的固定词表；编码好的 SSE 帧按文本缓存，流式发送时基本不做 JSON 序列化
+VOCAB = (
+    "the", "model", "latency", "token", "stream", "request", "response", "deployment",
+    "azure", "open", "ai", "test", "load", "quick", "brown", "fox", "jumps", "over",
+    "lazy", "dog", "and", "of", "to", "in", "is", "for", "with", "on", "as", "at",
+)
+
+
+@dataclass(frozen=True)
+class Distribution:
+    """Delay distribution in milliseconds, parsed from ``kind:a[,b]``.
+
+    - ``fixed:20``          always 20 ms
+    - ``uniform:10,30``     uniform between 10 and 30 ms
+    - ``normal:20,5``       mean 20, stddev 5 (clamped at 0)
+    - ``lognormal:300,0.4`` median 300 ms, sigma 0.4 (long right tail)
+    - ``exp:20``            exponential with mean 20 ms
+    """
+
+    kind: str = "fixed"
+    a: float = 0.0
+    b: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "Distribution":
+        kind, _, args = spec.partition(":")
+        values = [float(v) for v in args.split(",") if v.strip()] if args else [0.0]
+        kind = kind.strip().lower()
+        if kind not in ("fixed", "uniform", "normal", "lognormal", "exp"):
+            raise ValueError(f"Unknown distribution: {spec}")
+        return cls(kind, values[0], values[1] if len(values) > 1 else 0.0)
+
+    def sample_s(self, rng: random.Random) -> float:
+        """One sample, in seconds."""
+        if self.kind == "fixed":
+            ms = self.a
+        elif self.kind == "uniform":
+            ms = rng.uniform(self.a, self.b)
+        elif self.kind == "normal":
+            ms = rng.gauss(self.a, self.b)
+        elif self.kind == "lognormal":
+            ms = rng.lognormvariate(math.log(self.a), self.b) if self.a > 0 else 0.0
+        else:
+            ms = rng.expovariate(1.0 / self.a) if self.a > 0 else 0.0
+        return max(0.0, ms) / 1000
+
+
+@dataclass
+class MockProfile:
+    """How a mock deployment behaves."""
+
+    ttft: Distribution = field(default_factory=lambda: Distribution("fixed", 0))
+    inter_token: Distribution = field(default_factory=lambda: Distribution("fixed", 0))
+    # 输出 token 数在 [min, max] 内均匀取值，并受请求的 max_tokens 限制
+    tokens: Tuple[int, int] = (20, 20)
+    # 每个 SSE 块包含的 token 数
+    tokens_per_chunk: int = 1
+    rate_429: float = 0.0
+    rate_500: float = 0.0
+    # 流式请求在中途停止发送、连接挂起 stall_s 秒的概率
+    stall_rate: float = 0.0
+    stall_s: float = 3600.0
+    retry_after_s: float = 1.0
+
+
+@dataclass
+class MockStats:
+    requests: int = 0
+    active_streams: int = 0
+    max_active_streams: int = 0
+    throttled: int = 0
+    server_errors: int = 0
+    stalled: int = 0
+    chunks: int = 0
+    # 事件循环调度滞后（毫秒）：持续偏高说明模拟服务自身成为瓶颈，延迟不再可信
+    loop_lag_ms: float = 0.0
+    max_loop_lag_ms: float = 0.0
+
+
+def _parse_tokens(spec: str) -> Tuple[int, int]:
+    low, _, high = spec.partition("-")
+    return int(low), int(high or low)
+
+
+class MockServer:
+    """aiohttp app speaking the chat/completions and completions protocols.
+
+    ``profiles`` may override the default profile per deployment name. All
+    randomness comes from one seeded ``random.Random`` so a run is
+    reproducible for a fixed request order.
+    """
+
+    def __init__(
+        self,
+        profile: Optional[MockProfile] = None,
+        profiles: Optional[Dict[str, MockProfile]] = None,
+        seed: Optional[int] = None,
+    ):
+        self.profile = profile or MockProfile()
+        self.profiles = profiles or {}
+        self.rng = random.Random(seed)
+        self.stats = MockStats()
+        self._runner: Optional[web.AppRunner] = None
+        self._monitor: Optional[asyncio.Task] = None
+        self.url: Optional[str] = None
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/openai/deployments/{name}/chat/completions", self._chat)
+        app.router.add_post("/openai/deployments/{name}/completions", self._completions)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0, reuse_port: bool = False) -> str:
+        """Start listening and return the base URL (``port=0`` picks a free port).
+
+        ``reuse_port`` lets several worker processes share one port (Linux/BSD).
+        """
+        # 关闭访问日志：每请求一行日志在数千并发下本身就是瓶颈
+        self._runner = web.AppRunner(self.app(), access_log=None, handle_signals=False)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port, backlog=4096, reuse_port=reuse_port or None)
+        await site.start()
+        bound_port = self._runner.addresses[0][1]
+        self.url = f"http://{host}:{bound_port}"
+        self._monitor = asyncio.create_task(self._watch_loop_lag())
+        return self.url
+
+    async def _watch_loop_lag(self, interval: float = 0.1) -> None:
+        while True:
+            expected = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            lag = max(0.0, (time.perf_counter() - expected) * 1000)
+            self.stats.loop_lag_ms = lag
+            self.stats.max_loop_lag_ms = max(self.stats.max_loop_lag_ms, lag)
+
+    async def close(self) -> None:
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "MockServer":
+        if self._runner is None:
+            await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def _chat(self, request: web.Request) -> web.StreamResponse:
+        return await self._handle(request, completions=False)
+
+    async def _completions(self, request: web.Request) -> web.StreamResponse:
+        return await self._handle(request, completions=True)
+
+    async def _handle(self, request: web.Request, completions: bool) -> web.StreamResponse:
+        self.stats.requests += 1
+        name = request.match_info["name"]
+        profile = self.profiles.get(name, self.profile)
+        body = await request.json()
+        rng = self.rng
+
+        roll = rng.random()
+        if roll < profile.rate_429:
+            self.stats.throttled += 1
+            retry_after = profile.retry_after_s
+            return web.json_response(
+                {"error": {"code": "429", "message": f"Rate limit is exceeded. Try again in {retry_after:g} seconds."}},
+                status=429,
+                headers={
+                    "Retry-After": str(max(1, math.ceil(retry_after))),
+                    "retry-after-ms": str(int(retry_after * 1000)),
+                },
+            )
+        if roll < profile.rate_429 + profile.rate_500:
+            self.stats.server_errors += 1
+            return web.json_response(
+                {"error": {"code": "InternalServerError", "message": "The server had an error while processing your request."}},
+                status=500,
+            )
+
+        if completions:
+            prompt = body.get("prompt") or ""
+            prompt_text = "".join(prompt) if isinstance(prompt, list) else str(prompt)
+            max_tokens = body.get("max_tokens")
+        else:
+            prompt_text = "".join(str(m.get("content", "")) for m in body.get("messages") or [])
+            max_tokens = body.get("max_completion_tokens") or body.get("max_tokens")
+        output_tokens = rng.randint(*profile.tokens)
+        if max_tokens:
+            output_tokens = min(output_tokens, int(max_tokens))
+        usage = {
+            "prompt_tokens": max(1, len(prompt_text) // 4),
+            "completion_tokens": output_tokens,
+            "total_tokens": max(1, len(prompt_text) // 4) + output_tokens,
+        }
+        words = [VOCAB[rng.randrange(len(VOCAB))] for _ in range(output_tokens)]
+
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            # 卡住的位置必须落在某个 token 之前，否则流会正常结束；没有输出时无从卡住
+            stalls = output_tokens > 0 and rng.random() < profile.stall_rate
+            stall_at = rng.randrange(output_tokens) if stalls else None
+            return await self._stream(request, profile, words, usage, completions, include_usage, stall_at)
+
+        # 非流式：整段生成时间后一次性返回
+        delay = profile.ttft.sample_s(rng) + sum(
+            profile.inter_token.sample_s(rng) for _ in range(max(0, output_tokens - 1))
+        )
+        if delay:
+            await asyncio.sleep(delay)
+        text = " ".join(words)
+        if completions:
+            choice = {"index": 0, "text": text, "finish_reason": "stop"}
+            obj = "text_completion"
+        else:
+            choice = {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+            obj = "chat.completion"
+        return web.json_response({
+            "id": "mock-0",
+            "object": obj,
+            "created": int(time.time()),
+            "model": request.match_info["name"],
+            "choices": [choice],
+            "usage": usage,
+        })
+
+    async def _stream(
+        self,
+        request: web.Request,
+        profile: MockProfile,
+        words,
+        usage: dict,
+        completions: bool,
+        include_usage: bool,
+        stall_at: Optional[int],
+    ) -> web.StreamResponse:
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await resp.prepare(request)
+        stats = self.stats
+        stats.active_streams += 1
+        stats.max_active_streams = max(stats.max_active_streams, stats.active_streams)
+        rng = self.rng
+        try:
+            await asyncio.sleep(profile.ttft.sample_s(rng))
+            step = max(1, profile.tokens_per_chunk)
+            for i in range(0, len(words), step):
+                if stall_at is not None and i >= stall_at:
+                    # 模拟卡住的流：不再发送任何数据，也不结束响应
+                    stats.stalled += 1
+                    await asyncio.sleep(profile.stall_s)
+                    return resp
+                if i:
+                    await asyncio.sleep(profile.inter_token.sample_s(rng))
+                await resp.write(_frame(" ".join(words[i:i + step]) + " ", completions))
+                stats.chunks += 1
+            if include_usage:
+                await resp.write(b"data: " + json.dumps({"choices": [], "usage": usage}).encode() + b"\n\n")
+            await resp.write(b"data: [DONE]\n\n")
+            await resp.write_eof()
+        except ConnectionResetError:
+            # 客户端中止（超时或取消）；服务端自身关闭时的 CancelledError 继续向上抛出
+            pass
+        finally:
+            stats.active_streams -= 1
+        return resp
+
+
+@lru_cache(maxsize=4096)
+def _frame(text: str, completions: bool) -> bytes:
+    if completions:
+        obj = {"object": "text_completion", "choices": [{"index": 0, "text": text, "finish_reason": None}]}
+    else:
+        obj = {
+            "object": "chat.completion.chunk",
+            "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}],
+        }
+    return b"data: " + json.dumps(obj, separators=(",", ":")).encode() + b"\n\n"
+
+
+def build_profile(args: argparse.Namespace) -> MockProfile:
+    return MockProfile(
+        ttft=Distribution.parse(args.ttft),
+        inter_token=Distribution.parse(args.itl),
+        tokens=_parse_tokens(args.tokens),
+        tokens_per_chunk=args.tokens_per_chunk,
+        rate_429=args.rate_429,
+        rate_500=args.rate_500,
+        stall_rate=args.stall_rate,
+        stall_s=args.stall_s,
+        retry_after_s=args.retry_after,
+    )
+
+
+async def _serve(args: argparse.Namespace, worker: int = 0) -> None:
+    seed = None if args.seed is None else args.seed + worker
+    server = MockServer(build_profile(args), seed=seed)
+    url = await server.start(args.host, args.port, reuse_port=args.workers > 1)
+    prefix = f"[worker {worker}] " if args.workers > 1 else ""
+    if worker == 0:
+        print(f"🧪 Mock Azure OpenAI 服务已启动: {url}（{args.workers} 个进程）")
+        print(f"   TTFT={args.ttft}  ITL={args.itl}  tokens={args.tokens}  "
+              f"429={args.rate_429}  500={args.rate_500}  stall={args.stall_rate}")
+    try:
+        while True:
+            await asyncio.sleep(args.report_interval)
+            s = server.stats
+            print(f"   {prefix}requests={s.requests} active={s.active_streams} peak={s.max_active_streams} "
+                  f"429={s.throttled} 500={s.server_errors} stalled={s.stalled} chunks={s.chunks} "
+                  f"loop_lag={s.loop_lag_ms:.1f}ms (max {s.max_loop_lag_ms:.1f}ms)")
+    finally:
+        await server.close()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=18080)
+    ap.add_argument("--ttft", default="fixed:0", help="首 token 延迟分布（毫秒），如 lognormal:300,0.4")
+    ap.add_argument("--itl", default="fixed:0", help="token 间隔分布（毫秒），如 normal:20,5")
+    ap.add_argument("--tokens", default="20", help="输出 token 数，如 50-300")
+    ap.add_argument("--tokens-per-chunk", type=int, default=1)
+    ap.add_argument("--rate-429", type=float, default=0.0)
+    ap.add_argument("--rate-500", type=float, default=0.0)
+    ap.add_argument("--stall-rate", type=float, default=0.0)
+    ap.add_argument("--stall-s", type=float, default=3600.0, help="卡住的流挂起多久（秒）")
+    ap.add_argument("--retry-after", type=float, default=1.0, help="429 响应的 Retry-After（秒）")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--report-interval", type=float, default=10.0)
+    ap.add_argument(
+        "--workers", type=int, default=1,
+        help="进程数（共享端口）；单进程每秒可发出的块数有限，loop_lag 持续偏高时增加",
+    )
+    args = ap.parse_args()
+    if args.workers > 1:
+        workers = [
+            multiprocessing.Process(target=_run_worker, args=(args, i), daemon=True)
+            for i in range(args.workers)
+        ]
+        for proc in workers:
+            proc.start()
+        try:
+            for proc in workers:
+                proc.join()
+        except KeyboardInterrupt:
+            pass
+        return
+    _run_worker(args, 0)
+
+
+def _run_worker(args: argparse.Namespace, worker: int) -> None:
+    try:
+        asyncio.run(_serve(args, worker))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""多进程压测：把每个模型的并发拆到多个子进程
+
+单个事件循环（还要处理 SSE 推送）受限于一个 CPU 核心，数百路流式并发时
+客户端本身就会成为瓶颈并污染测量值。``ProcessShardedTester`` 与
+``LatencyTester`` 接口相同，但把 ``run_models`` 拆成 N 个分片，每个分片
+在独立的 Python 子进程中运行自己的事件循环和 HTTP 连接池：
+
+  - 闭环模式按并发数均分（总请求数 = 并发数 * 迭代次数 不变）；开环模式下
+    并发数不限制在途请求，按总请求数均分，目标 RPS 按同样的份额分配，恒定
+    间隔到达时各分片的起点错开一个间隔；随机种子按分片偏移；RPM/TPM 限流
+    预算同样按份额拆分
+  - 子进程把记录和流式增量批量编码（见 ``tester.record_codec``）后通过
+    stdout 管道发回，父进程解码后照常交给 record_callback / stream_callback，
+    因此聚合、归档、推送都不需要改动
+  - 分片内的 request_id 映射为 ``local_id * 分片数 + 分片号``，全局唯一
+  - start_time/end_time 是 ``time.perf_counter()``，在 Linux/macOS/Windows
+    上都是系统级单调时钟，同一台机器的不同进程可以直接比较
+
+子进程通过 ``python -m tester.process_runner`` 启动，而不是 multiprocessing，
+避免子进程重新导入父进程的 ``__main__``（例如后端应用）。
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import queue
+import struct
+import sys
+import threading
+from dataclasses import asdict, replace
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from tester.http_pool import HttpClientPool
+from tester.latency_tester import (
+    LatencyTester,
+    ModelConfig,
+    RecordCallback,
+    RequestRecord,
+    StreamCallback,
+)
+from tester.record_codec import decode_chunks, decode_records, encode_chunks, encode_records
+
+# 帧：1 字节类型 + 4 字节长度 + 负载
+_FRAME = struct.Struct("<cI")
+FRAME_RECORDS = b"R"
+FRAME_CHUNKS = b"C"
+FRAME_ERROR = b"E"
+FRAME_DONE = b"D"
+
+CANCEL_COMMAND = b"cancel\n"
+
+
+def _split(total: int, shard: int, shards: int) -> int:
+    return total // shards + (1 if shard < total % shards else 0)
+
+
+def max_shards(config: ModelConfig) -> int:
+    """一个配置最多能拆出的非空分片数"""
+    if not config.rps:
+        return max(1, config.concurrency)
+    # 开环：并发数只决定总请求数；按时长运行时可以任意拆分
+    if config.duration_s:
+        return sys.maxsize
+    return max(1, config.concurrency * config.iterations)
+
+
+def shard_config(config: ModelConfig, shard: int, shards: int) -> Optional[ModelConfig]:
+    """第 ``shard`` 个分片负责的那部分负载（分不到负载时返回 None）"""
+    iterations = config.iterations
+    arrival_offset_s = config.arrival_offset_s
+    if not config.rps:
+        concurrency = _split(config.concurrency, shard, shards)
+        if concurrency <= 0:
+            return None
+        share = concurrency / config.concurrency
+        rps = None
+    else:
+        if config.duration_s:
+            concurrency = config.concurrency
+            share = 1 / shards
+        else:
+            # 总请求数 = 并发数 * 迭代次数，分片内以 并发数 = 请求数、迭代 1 次表示
+            total = config.concurrency * config.iterations
+            concurrency, iterations = _split(total, shard, shards), 1
+            if concurrency <= 0:
+                return None
+            share = concurrency / total
+        rps = config.rps * share
+        if config.arrival == "constant":
+            # 各分片从同一时刻起按相同间隔发送会同时到达，起点依次错开一个总体间隔
+            arrival_offset_s += shard / config.rps
+    seed = config.seed + shard if config.seed is not None else None
+    # 各分片的限流器互不相通，部署配额按同样的份额拆分
+    rpm_limit = config.rpm_limit * share if config.rpm_limit else None
+    tpm_limit = config.tpm_limit * share if config.tpm_limit else None
+    # 各分片的请求编号各自从 0 开始，按请求数的预热也要拆分；按秒的预热各分片相同
+    warmup_requests = config.warmup_requests // shards + (1 if shard < config.warmup_requests % shards else 0)
+    return replace(
+        config, concurrency=concurrency, iterations=iterations, rps=rps, arrival_offset_s=arrival_offset_s,
+        seed=seed, rpm_limit=rpm_limit, tpm_limit=tpm_limit, warmup_requests=warmup_requests,
+    )
+
+
+class ProcessShardedTester:
+    """Drop-in replacement for ``LatencyTester`` that runs the load in worker processes."""
+
+    def __init__(
+        self,
+        processes: int,
+        request_timeout: float = 60.0,
+        flush_interval_ms: float = 20.0,
+    ):
+        self.processes = max(1, processes)
+        self.request_timeout = request_timeout
+        self.flush_interval_ms = flush_interval_ms
+        self.cancelled = False
+        self._procs: Set[asyncio.subprocess.Process] = set()
+
+    def cancel(self) -> None:
+        """通知所有子进程停止调度；已完成的记录仍会发回并汇总"""
+        self.cancelled = True
+        for proc in list(self._procs):
+            try:
+                proc.stdin.write(CANCEL_COMMAND)
+            except (ConnectionError, RuntimeError):
+                pass
+
+    async def run_models(
+        self,
+        configs: Iterable[ModelConfig],
+        question: Optional[str] = None,
+        stream_callback: Optional[StreamCallback] = None,
+        record_callback: Optional[RecordCallback] = None,
+        keep_records: bool = True,
+    ) -> List[RequestRecord]:
+        records: List[RequestRecord] = []
+        if self.cancelled:
+            return records
+        configs = list(configs)
+        shards = min(self.processes, max((max_shards(c) for c in configs), default=1))
+
+        def emit(batch: List[RequestRecord]):
+            for record in batch:
+                if keep_records:
+                    records.append(record)
+                if record_callback:
+                    record_callback(record)
+
+        procs = []
+        try:
+            for shard in range(shards):
+                shard_configs = [
+                    cfg for cfg in (shard_config(c, shard, shards) for c in configs) if cfg is not None
+                ]
+                procs.append(await self._spawn({
+                    "configs": [asdict(cfg) for cfg in shard_configs],
+                    "question": question,
+                    "shard": shard,
+                    "shards": shards,
+                    "request_timeout": self.request_timeout,
+                    "flush_interval_ms": self.flush_interval_ms,
+                    "stream": stream_callback is not None,
+                }))
+            errors = await asyncio.gather(*(self._drain(p, emit, stream_callback) for p in procs))
+        except BaseException:
+            # 调用方被取消或读取出错：直接结束子进程
+            for proc in procs:
+                if proc.returncode is None:
+                    proc.kill()
+            raise
+        finally:
+            for proc in procs:
+                await proc.wait()
+            self._procs.difference_update(procs)
+
+        errors = [error for error in errors if error]
+        if errors:
+            raise RuntimeError("; ".join(errors))
+        return records
+
+    async def _spawn(self, job: Dict[str, Any]) -> asyncio.subprocess.Process:
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "tester.process_runner",
+            cwd=str(Path(__file__).resolve().parent.parent),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+        )
+        proc.stdin.write(json.dumps(job, ensure_ascii=False).encode("utf-8") + b"\n")
+        if self.cancelled:
+            proc.stdin.write(CANCEL_COMMAND)
+        self._procs.add(proc)
+        return proc
+
+    @staticmethod
+    async def _drain(
+        proc: asyncio.subprocess.Process,
+        emit,
+        stream_callback: Optional[StreamCallback],
+    ) -> Optional[str]:
+        """读取一个子进程的全部帧，返回错误信息（正常结束为 None）"""
+        while True:
+            try:
+                header = await proc.stdout.readexactly(_FRAME.size)
+            except asyncio.IncompleteReadError:
+                return f"压测子进程异常退出（exit={await proc.wait()}）"
+            kind, length = _FRAME.unpack(header)
+            payload = await proc.stdout.readexactly(length) if length else b""
+            if kind == FRAME_RECORDS:
+                emit(decode_records(payload))
+            elif kind == FRAME_CHUNKS:
+                if stream_callback:
+                    for model, request_id, chunk in decode_chunks(payload):
+                        waiting = stream_callback(model, request_id, chunk)
+                        if waiting is not None:
+                            await waiting
+            elif kind == FRAME_ERROR:
+                return payload.decode("utf-8", "replace")
+            elif kind == FRAME_DONE:
+                return None
+
+
+class _FrameWriter:
+    """子进程侧：缓冲记录与增量，定时或攒满后成帧写出
+
+    帧交给后台线程写入管道：父进程读得慢、管道写满时阻塞的是写线程，
+    事件循环照常调度请求和计时。
+    """
+
+    def __init__(self, fd: int, flush_interval_ms: float, max_items: int = 1024):
+        self.fd = fd
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_items = max_items
+        self.records: List[RequestRecord] = []
+        self.chunks: List[tuple] = []
+        # None 表示写完退出
+        self._frames: "queue.SimpleQueue[Optional[bytes]]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write_frames, daemon=True)
+        self._thread.start()
+
+    def _write_frames(self) -> None:
+        while True:
+            frame = self._frames.get()
+            if frame is None:
+                return
+            data = memoryview(frame)
+            while data:
+                written = os.write(self.fd, data)
+                data = data[written:]
+
+    def _write(self, kind: bytes, payload: bytes = b"") -> None:
+        self._frames.put(_FRAME.pack(kind, len(payload)) + payload)
+
+    def add_record(self, record: RequestRecord) -> None:
+        self.records.append(record)
+        if len(self.records) >= self.max_items:
+            self.flush()
+
+    def add_chunk(self, model: str, request_id: int, chunk: str) -> None:
+        self.chunks.append((model, request_id, chunk))
+        if len(self.chunks) >= self.max_items:
+            self.flush()
+
+    def flush(self) -> None:
+        # 先写增量再写记录，保证同一请求的最终记录排在它的增量之后
+        if self.chunks:
+            self._write(FRAME_CHUNKS, encode_chunks(self.chunks))
+            self.chunks = []
+        if self.records:
+            self._write(FRAME_RECORDS, encode_records(self.records))
+            self.records = []
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    def finish(self, error: Optional[str] = None) -> None:
+        """写出剩余内容与结束帧，等待写线程把所有帧写入管道"""
+        self.flush()
+        if error is None:
+            self._write(FRAME_DONE)
+        else:
+            self._write(FRAME_ERROR, error.encode("utf-8"))
+        self._frames.put(None)
+        self._thread.join()
+
+
+async def _worker(job: Dict[str, Any], writer: _FrameWriter) -> None:
+    configs = [ModelConfig(**cfg) for cfg in job["configs"]]
+    shard, shards = job["shard"], job["shards"]
+    if any(cfg.rps for cfg in configs):
+        # 开环模式的在途请求数不受并发数限制，使用默认连接上限
+        pool = HttpClientPool()
+    else:
+        total_concurrency = sum(cfg.concurrency for cfg in configs) or 1
+        pool = HttpClientPool(limit=total_concurrency * 2, limit_per_host=total_concurrency * 2)
+    tester = LatencyTester(request_timeout=job["request_timeout"], pool=pool)
+    loop = asyncio.get_running_loop()
+
+    def watch_stdin():
+        # 父进程发送 cancel 或关闭管道（父进程退出）都视为取消
+        _read_line(0)
+        loop.call_soon_threadsafe(tester.cancel)
+
+    threading.Thread(target=watch_stdin, daemon=True).start()
+
+    def on_record(record: RequestRecord):
+        record.request_id = record.request_id * shards + shard
+        writer.add_record(record)
+
+    def on_chunk(model: str, request_id: int, chunk: str):
+        writer.add_chunk(model, request_id * shards + shard, chunk)
+
+    flusher = asyncio.create_task(writer.run())
+    try:
+        await tester.run_models(
+            configs,
+            question=job["question"],
+            stream_callback=on_chunk if job["stream"] else None,
+            record_callback=on_record,
+            keep_records=False,
+        )
+    finally:
+        flusher.cancel()
+        await pool.close()
+
+
+def _read_line(fd: int) -> bytes:
+    """不经过 sys.stdin 缓冲读一行：守护线程阻塞在缓冲读上会让解释器退出时崩溃"""
+    line = bytearray()
+    while True:
+        byte = os.read(fd, 1)
+        if not byte:
+            return bytes(line)
+        line += byte
+        if byte == b"\n":
+            return bytes(line)
+
+
+def worker_main() -> None:
+    """子进程入口：stdin 第一行为任务 JSON，帧写到原 stdout"""
+    job = json.loads(_read_line(0))
+    # 帧独占原 stdout；代码里的 print 改写到 stderr，避免破坏帧
+    frame_fd = os.dup(1)
+    os.dup2(2, 1)
+    writer = _FrameWriter(frame_fd, job.get("flush_interval_ms", 20.0))
+    try:
+        asyncio.run(_worker(job, writer))
+    except Exception as e:  # noqa: BLE001 - 任何异常都要报告给父进程
+        writer.finish(f"{type(e).__name__}: {e}")
+    else:
+        writer.finish()
+
+
+if __name__ == "__main__":
+    worker_main()
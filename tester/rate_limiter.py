@@ -0,0 +1,146 @@
+"""客户端 RPM / TPM 限流：把请求控制在部署配额以内
+
+Azure OpenAI 按部署核定每分钟请求数（RPM）与每分钟 token 数（TPM），
+在 1 秒 / 10 秒的窗口内执行，超出即返回 429。压测一旦超过配额，测到的就是
+限流而不是服务耗时。这里为每个 (endpoint, 部署) 维护一对令牌桶：
+
+  - 请求桶按 RPM 补充，token 桶按 TPM 补充，容量都是 10 秒的额度
+    （与服务端窗口一致，允许同样大小的突发）
+  - token 消耗与服务端的估算方式相同：提示词估计 token 数（约 4 字符 1 个）
+    加上 ``max_tokens``，发请求前扣除，不按实际用量退还
+  - 等待按到达顺序排队（FIFO），长请求不会被短请求一直插队
+
+限流器在进程内共享（``shared_rate_limiters``），同一进程中所有并发任务、
+所有测试共用同一份预算；多进程 / 分布式运行时配额由 ``shard_config`` 按
+分片拆分。
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+
+# 令牌桶容量对应的时间窗口（秒）
+WINDOW_S = 10.0
+# 估算提示词 token 数时每个 token 对应的字符数
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(prompt_chars: int, max_tokens: int) -> int:
+    """服务端限流使用的 token 估算：提示词 token 数 + max_tokens"""
+    return max(1, -(-prompt_chars // CHARS_PER_TOKEN)) + max(0, max_tokens)
+
+
+class TokenBucket:
+    """Continuously refilled bucket; ``take`` may drive it negative (debt).
+
+    A request larger than the capacity is let through once the bucket is
+    full and then pays the debt off before anyone else proceeds, so
+    oversize requests are throttled rather than blocked forever.
+    """
+
+    def __init__(self, per_minute: float, window_s: float = WINDOW_S):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * window_s)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def set_rate(self, per_minute: float, window_s: float = WINDOW_S) -> None:
+        self._refill()
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * window_s)
+        self.level = min(self.level, self.capacity)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until ``amount`` (capped at capacity) is available."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= amount
+
+
+class DeploymentLimiter:
+    """Request and token budgets of one deployment."""
+
+    def __init__(self, rpm: Optional[float], tpm: Optional[float]):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.rpm = rpm
+        self.tpm = tpm
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def update(self, rpm: Optional[float], tpm: Optional[float]) -> None:
+        """配额变化时调整补充速率，保留已有的桶状态"""
+        for attr, value in (("requests", rpm), ("tokens", tpm)):
+            bucket = getattr(self, attr)
+            if not value:
+                setattr(self, attr, None)
+            elif bucket is None:
+                setattr(self, attr, TokenBucket(value))
+            else:
+                bucket.set_rate(value)
+        self.rpm = rpm
+        self.tpm = tpm
+
+    async def acquire(self, tokens: int) -> float:
+        """等到一个请求和 ``tokens`` 个 token 的额度都可用后扣除，返回等待秒数（无需等待时为 0）"""
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # 锁绑定事件循环；同一进程先后运行多个事件循环时各自新建
+            self._lock, self._loop = asyncio.Lock(), loop
+        # 排在其他等待者之后也算作等待
+        waited = self._lock.locked()
+        # 持锁等待保证 FIFO：排在前面的请求拿到额度之前，后面的请求不会被放行
+        async with self._lock:
+            while True:
+                delay = max(
+                    self.requests.delay(1) if self.requests else 0.0,
+                    self.tokens.delay(tokens) if self.tokens else 0.0,
+                )
+                if delay <= 0:
+                    break
+                waited = True
+                await asyncio.sleep(delay)
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(tokens)
+        return time.perf_counter() - started if waited else 0.0
+
+
+class RateLimiterRegistry:
+    """Process-wide limiters keyed by ``(endpoint, deployment)``."""
+
+    def __init__(self):
+        self._limiters: Dict[Tuple[str, str], DeploymentLimiter] = {}
+
+    def get(
+        self,
+        endpoint: str,
+        deployment: str,
+        rpm: Optional[float],
+        tpm: Optional[float],
+    ) -> Optional[DeploymentLimiter]:
+        """取该部署的限流器（未配置配额时返回 None）"""
+        if not rpm and not tpm:
+            return None
+        key = (endpoint.rstrip("/").lower(), deployment)
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            limiter = self._limiters[key] = DeploymentLimiter(rpm, tpm)
+        elif (limiter.rpm, limiter.tpm) != (rpm, tpm):
+            limiter.update(rpm, tpm)
+        return limiter
+
+
+shared_rate_limiters = RateLimiterRegistry()
@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import json
+import math
+import sys
+from array import array
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from tester.latency_tester import RequestRecord
+
+ARCHIVE_VERSION = 1
+META_FILE = "meta.json"
+
+# 列名 -> (array typecode, numpy dtype)；缺失值：整数列为 -1，浮点列为 NaN
+NUMERIC_COLUMNS = {
+    "request_id": ("q", "<i8"),
+    "start_s": ("d", "<f8"),
+    "end_s": ("d", "<f8"),
+    "latency_ms": ("f", "<f4"),
+    "status": ("h", "<i2"),
+    "prompt_tokens": ("i", "<i4"),
+    "completion_tokens": ("i", "<i4"),
+    "total_tokens": ("i", "<i4"),
+    "first_token_latency_ms": ("f", "<f4"),
+    "schedule_lag_ms": ("f", "<f4"),
+    "tpot_ms": ("f", "<f4"),
+    "decode_tokens_per_s": ("f", "<f4"),
+    "attempts": ("h", "<i2"),
+    "throttled": ("h", "<i2"),
+    "backoff_ms": ("f", "<f4"),
+    "first_attempt_latency_ms": ("f", "<f4"),
+    "rate_limit_wait_ms": ("f", "<f4"),
+    "warmup": ("b", "<i1"),
+    "pool_wait_ms": ("f", "<f4"),
+    "dns_ms": ("f", "<f4"),
+    "connect_ms": ("f", "<f4"),
+    "send_ms": ("f", "<f4"),
+    "ttfb_ms": ("f", "<f4"),
+    "transfer_ms": ("f", "<f4"),
+    "bytes_received": ("q", "<i8"),
+}
+# 字典编码的字符串列：每行存 int32 编码，取值表保存在 meta.json；-1 表示空
+DICTIONARY_COLUMNS = ("model", "stage", "error", "prompt_band")
+# 变长列：所有请求的 chunk_times_ms 首尾相接，chunk_end[i] 为第 i 行的结束位置
+CHUNK_VALUES = ("chunk_times_ms", "f", "<f4")
+CHUNK_END = ("chunk_end", "q", "<i8")
+
+
+def _int_or_missing(value: Optional[int]) -> int:
+    return -1 if value is None else int(value)
+
+
+def _float_or_nan(value: Optional[float]) -> float:
+    return math.nan if value is None else float(value)
+
+
+class RecordArchiveWriter:
+    """Streams ``RequestRecord``s to a directory of raw little-endian column files.
+
+    Each numeric field goes to its own ``<column>.bin`` at the narrowest dtype
+    that holds it (float32 latencies, int32 token counts, int16 status).
+    ``model``/``stage``/``error`` are dictionary encoded, and per-chunk arrival
+    times are stored flat with an offsets column. ``response_text`` is not
+    archived. Rows are buffered in ``array``s and appended every
+    ``flush_rows`` records, so memory stays flat however long the run is.
+    """
+
+    def __init__(self, directory: Union[str, Path], origin: float, flush_rows: int = 4096):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # start/end 记录为相对 origin（perf_counter）的秒数
+        self.origin = origin
+        self.flush_rows = flush_rows
+        self.rows = 0
+        self._chunk_total = 0
+        self._buffers: Dict[str, array] = {}
+        self._files: Dict[str, BinaryIO] = {}
+        for name, (typecode, _) in self._layout().items():
+            self._buffers[name] = array(typecode)
+            self._files[name] = open(self.directory / f"{name}.bin", "wb")
+        self._dictionaries: Dict[str, Dict[str, int]] = {name: {} for name in DICTIONARY_COLUMNS}
+        self._closed = False
+
+    @staticmethod
+    def _layout() -> Dict[str, tuple]:
+        layout = dict(NUMERIC_COLUMNS)
+        for name in DICTIONARY_COLUMNS:
+            layout[name] = ("i", "<i4")
+        layout[CHUNK_VALUES[0]] = CHUNK_VALUES[1:]
+        layout[CHUNK_END[0]] = CHUNK_END[1:]
+        return layout
+
+    def _encode(self, column: str, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        codes = self._dictionaries[column]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+        return code
+
+    def append(self, record: RequestRecord) -> None:
+        buf = self._buffers
+        buf["request_id"].append(record.request_id)
+        buf["start_s"].append(record.start_time - self.origin)
+        buf["end_s"].append(record.end_time - self.origin)
+        buf["latency_ms"].append(record.latency_ms)
+        buf["status"].append(_int_or_missing(record.status))
+        buf["prompt_tokens"].append(_int_or_missing(record.prompt_tokens))
+        buf["completion_tokens"].append(_int_or_missing(record.completion_tokens))
+        buf["total_tokens"].append(_int_or_missing(record.total_tokens))
+        buf["first_token_latency_ms"].append(_float_or_nan(record.first_token_latency_ms))
+        buf["schedule_lag_ms"].append(_float_or_nan(record.schedule_lag_ms))
+        buf["tpot_ms"].append(_float_or_nan(record.tpot_ms))
+        buf["decode_tokens_per_s"].append(_float_or_nan(record.decode_tokens_per_s))
+        buf["attempts"].append(record.attempts)
+        buf["throttled"].append(record.throttled)
+        buf["backoff_ms"].append(record.backoff_ms)
+        buf["first_attempt_latency_ms"].append(_float_or_nan(record.first_attempt_latency_ms))
+        buf["rate_limit_wait_ms"].append(record.rate_limit_wait_ms)
+        buf["warmup"].append(record.warmup)
+        buf["pool_wait_ms"].append(_float_or_nan(record.pool_wait_ms))
+        buf["dns_ms"].append(_float_or_nan(record.dns_ms))
+        buf["connect_ms"].append(_float_or_nan(record.connect_ms))
+        buf["send_ms"].append(_float_or_nan(record.send_ms))
+        buf["ttfb_ms"].append(_float_or_nan(record.ttfb_ms))
+        buf["transfer_ms"].append(_float_or_nan(record.transfer_ms))
+        buf["bytes_received"].append(_int_or_missing(record.bytes_received))
+        buf["model"].append(self._encode("model", record.model))
+        buf["stage"].append(self._encode("stage", record.stage))
+        buf["error"].append(self._encode("error", record.error))
+        buf["prompt_band"].append(self._encode("prompt_band", record.prompt_band))
+        if record.chunk_times_ms is not None:
+            buf["chunk_times_ms"].extend(record.chunk_times_ms)
+            self._chunk_total += len(record.chunk_times_ms)
+        buf["chunk_end"].append(self._chunk_total)
+        self.rows += 1
+        if len(buf["request_id"]) >= self.flush_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        for name, values in self._buffers.items():
+            if not values:
+                continue
+            if sys.byteorder != "little":  # pragma: no cover - 主流平台均为小端
+                values.byteswap()
+            values.tofile(self._files[name])
+            del values[:]
+        for f in self._files.values():
+            f.flush()
+
+    def close(self) -> Path:
+        """Flush, write ``meta.json`` and return the archive directory."""
+        if self._closed:
+            return self.directory
+        self.flush()
+        for f in self._files.values():
+            f.close()
+        columns = {name: dtype for name, (_, dtype) in self._layout().items()}
+        meta = {
+            "version": ARCHIVE_VERSION,
+            "rows": self.rows,
+            "chunk_values": self._chunk_total,
+            "columns": columns,
+            "dictionaries": {
+                name: list(codes) for name, codes in self._dictionaries.items()
+            },
+        }
+        tmp = self.directory / (META_FILE + ".tmp")
+        tmp.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(self.directory / META_FILE)
+        self._closed = True
+        return self.directory
+
+
+class RecordArchive:
+    """Read side: every column is an ``np.memmap``, nothing is parsed up front."""
+
+    def __init__(self, directory: Union[str, Path]):
+        self.directory = Path(directory)
+        self.meta = json.loads((self.directory / META_FILE).read_text(encoding="utf-8"))
+        if self.meta.get("version") != ARCHIVE_VERSION:
+            raise ValueError(f"Unsupported record archive version: {self.meta.get('version')}")
+        self.rows: int = self.meta["rows"]
+        self._cache: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return self.rows
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.meta["columns"])
+
+    def column(self, name: str) -> np.ndarray:
+        """Raw column as a read-only memmap (dictionary columns return codes)."""
+        cached = self._cache.get(name)
+        if cached is not None:
+            return cached
+        dtype = np.dtype(self.meta["columns"][name])
+        length = self.meta["chunk_values"] if name == CHUNK_VALUES[0] else self.rows
+        if length == 0:
+            values = np.empty(0, dtype=dtype)
+        else:
+            values = np.memmap(self.directory / f"{name}.bin", dtype=dtype, mode="r", shape=(length,))
+        self._cache[name] = values
+        return values
+
+    def categories(self, name: str) -> List[str]:
+        return self.meta["dictionaries"][name]
+
+    def chunk_times(self, row: int) -> np.ndarray:
+        """Arrival times (ms since request start) of one row's output-bearing reads."""
+        ends = self.column(CHUNK_END[0])
+        start = int(ends[row - 1]) if row > 0 else 0
+        return self.column(CHUNK_VALUES[0])[start:int(ends[row])]
+
+    def to_dataframe(
+        self,
+        columns: Optional[List[str]] = None,
+        start: int = 0,
+        stop: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """Flat columns (rows ``start:stop``) as a DataFrame.
+
+        Only the requested slice is copied out of the memmaps. Missing ints
+        become ``<NA>``, missing floats ``NaN``.
+        """
+        wanted = columns or [
+            name for name in self.columns if name not in (CHUNK_VALUES[0], CHUNK_END[0])
+        ]
+        rows = slice(start, stop)
+        data: Dict[str, Any] = {}
+        for name in wanted:
+            if name in DICTIONARY_COLUMNS:
+                codes = np.asarray(self.column(name)[rows])
+                data[name] = pd.Categorical.from_codes(codes, categories=self.categories(name))
+            elif self.meta["columns"][name].startswith("<i") and name != "request_id":
+                values = np.asarray(self.column(name)[rows])
+                data[name] = pd.arrays.IntegerArray(values, values < 0)
+            else:
+                data[name] = np.asarray(self.column(name)[rows])
+        return pd.DataFrame(data)
+
+    def to_parquet(self, path: Union[str, Path], compression: str = "zstd") -> Path:
+        """Export to a compressed Parquet file (requires the optional ``pyarrow``)."""
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise RuntimeError("Parquet export requires pyarrow: pip install pyarrow") from e
+        path = Path(path)
+        self.to_dataframe().to_parquet(path, compression=compression, index=False)
+        return path
@@ -0,0 +1,173 @@
+"""RequestRecord 与流式增量的紧凑二进制编码（跨进程传输用）
+
+每条记录是一个定长 struct 头加若干变长字段，比 pickle 小且编解码不经过
+对象图遍历。缺失值约定与列式归档一致：整数为 -1，浮点为 NaN，字符串与
+数组的长度为 ``NONE_LEN``。
+"""
+from __future__ import annotations
+
+import math
+import struct
+import sys
+from array import array
+from typing import List, Optional, Tuple
+
+from tester.latency_tester import RequestRecord
+
+# request_id, start, end, latency, first_token, schedule_lag, tpot, decode_tps,
+# backoff, first_attempt_latency, rate_limit_wait, pool_wait, dns, connect, send,
+# ttfb, transfer, status, prompt_tokens, completion_tokens, total_tokens, attempts,
+# throttled, warmup, bytes_received
+_RECORD = struct.Struct("<qddddddddddddddddhiiihh?q")
+_LEN = struct.Struct("<I")
+_CHUNK = struct.Struct("<q")
+NONE_LEN = 0xFFFFFFFF
+
+ChunkEvent = Tuple[str, int, str]  # model_name, request_id, chunk
+
+
+def _put_str(out: bytearray, value: Optional[str]) -> None:
+    if value is None:
+        out += _LEN.pack(NONE_LEN)
+        return
+    data = value.encode("utf-8")
+    out += _LEN.pack(len(data))
+    out += data
+
+
+def _get_str(buf: memoryview, pos: int) -> Tuple[Optional[str], int]:
+    (length,) = _LEN.unpack_from(buf, pos)
+    pos += _LEN.size
+    if length == NONE_LEN:
+        return None, pos
+    return str(buf[pos:pos + length], "utf-8"), pos + length
+
+
+def _float(value: Optional[float]) -> float:
+    return math.nan if value is None else value
+
+
+def _opt_float(value: float) -> Optional[float]:
+    return None if value != value else value
+
+
+def _int(value: Optional[int]) -> int:
+    return -1 if value is None else value
+
+
+def _opt_int(value: int) -> Optional[int]:
+    return None if value < 0 else value
+
+
+def encode_records(records: List[RequestRecord]) -> bytes:
+    out = bytearray(_LEN.pack(len(records)))
+    for r in records:
+        out += _RECORD.pack(
+            r.request_id, r.start_time, r.end_time, r.latency_ms,
+            _float(r.first_token_latency_ms), _float(r.schedule_lag_ms),
+            _float(r.tpot_ms), _float(r.decode_tokens_per_s),
+            r.backoff_ms, _float(r.first_attempt_latency_ms), r.rate_limit_wait_ms,
+            _float(r.pool_wait_ms), _float(r.dns_ms), _float(r.connect_ms), _float(r.send_ms),
+            _float(r.ttfb_ms), _float(r.transfer_ms),
+            _int(r.status), _int(r.prompt_tokens), _int(r.completion_tokens), _int(r.total_tokens),
+            r.attempts, r.throttled, r.warmup, _int(r.bytes_received),
+        )
+        _put_str(out, r.model)
+        _put_str(out, r.stage)
+        _put_str(out, r.prompt_band)
+        _put_str(out, r.error)
+        _put_str(out, r.response_text)
+        if r.chunk_times_ms is None:
+            out += _LEN.pack(NONE_LEN)
+        else:
+            times = r.chunk_times_ms if r.chunk_times_ms.typecode == "f" else array("f", r.chunk_times_ms)
+            if sys.byteorder != "little":  # pragma: no cover - 主流平台均为小端
+                times = array("f", times)
+                times.byteswap()
+            out += _LEN.pack(len(times))
+            out += times.tobytes()
+    return bytes(out)
+
+
+def decode_records(data: bytes) -> List[RequestRecord]:
+    buf = memoryview(data)
+    (count,) = _LEN.unpack_from(buf, 0)
+    pos = _LEN.size
+    records: List[RequestRecord] = []
+    for _ in range(count):
+        (request_id, start, end, latency, first_token, schedule_lag, tpot, decode_tps,
+         backoff, first_attempt, rate_limit_wait, pool_wait, dns, connect, send, ttfb, transfer,
+         status, prompt_tokens, completion_tokens, total_tokens,
+         attempts, throttled, warmup, bytes_received) = _RECORD.unpack_from(buf, pos)
+        pos += _RECORD.size
+        model, pos = _get_str(buf, pos)
+        stage, pos = _get_str(buf, pos)
+        band, pos = _get_str(buf, pos)
+        error, pos = _get_str(buf, pos)
+        response_text, pos = _get_str(buf, pos)
+        (length,) = _LEN.unpack_from(buf, pos)
+        pos += _LEN.size
+        chunk_times = None
+        if length != NONE_LEN:
+            chunk_times = array("f")
+            chunk_times.frombytes(buf[pos:pos + length * 4])
+            if sys.byteorder != "little":  # pragma: no cover
+                chunk_times.byteswap()
+            pos += length * 4
+        records.append(RequestRecord(
+            model=model,
+            request_id=request_id,
+            start_time=start,
+            end_time=end,
+            latency_ms=latency,
+            status=_opt_int(status),
+            error=error,
+            prompt_tokens=_opt_int(prompt_tokens),
+            completion_tokens=_opt_int(completion_tokens),
+            total_tokens=_opt_int(total_tokens),
+            response_text=response_text,
+            first_token_latency_ms=_opt_float(first_token),
+            schedule_lag_ms=_opt_float(schedule_lag),
+            stage=stage,
+            chunk_times_ms=chunk_times,
+            tpot_ms=_opt_float(tpot),
+            decode_tokens_per_s=_opt_float(decode_tps),
+            attempts=attempts,
+            backoff_ms=backoff,
+            first_attempt_latency_ms=_opt_float(first_attempt),
+            throttled=throttled,
+            rate_limit_wait_ms=rate_limit_wait,
+            prompt_band=band,
+            warmup=warmup,
+            pool_wait_ms=_opt_float(pool_wait),
+            dns_ms=_opt_float(dns),
+            connect_ms=_opt_float(connect),
+            send_ms=_opt_float(send),
+            ttfb_ms=_opt_float(ttfb),
+            transfer_ms=_opt_float(transfer),
+            bytes_received=_opt_int(bytes_received),
+        ))
+    return records
+
+
+def encode_chunks(chunks: List[ChunkEvent]) -> bytes:
+    out = bytearray(_LEN.pack(len(chunks)))
+    for model, request_id, text in chunks:
+        out += _CHUNK.pack(request_id)
+        _put_str(out, model)
+        _put_str(out, text)
+    return bytes(out)
+
+
+def decode_chunks(data: bytes) -> List[ChunkEvent]:
+    buf = memoryview(data)
+    (count,) = _LEN.unpack_from(buf, 0)
+    pos = _LEN.size
+    chunks: List[ChunkEvent] = []
+    for _ in range(count):
+        (request_id,) = _CHUNK.unpack_from(buf, pos)
+        pos += _CHUNK.size
+        model, pos = _get_str(buf, pos)
+        text, pos = _get_str(buf, pos)
+        chunks.append((model, request_id, text))
+    return chunks
@@ -0,0 +1,62 @@
+"""限流感知的重试策略
+
+Azure OpenAI 限流时返回 429，并在 ``retry-after-ms``（毫秒）或
+``Retry-After``（秒或 HTTP 日期）头里给出建议的等待时间。有提示时按提示
+等待（加少量抖动，避免被限流的请求同时醒来再次撞上限额）；没有提示时按
+带全抖动的指数退避等待。等待时间都不超过 ``max_backoff_s``。
+"""
+from __future__ import annotations
+
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Mapping, Optional
+
+from tenacity import RetryCallState, wait_random_exponential
+
+# 值得重试的状态码：限流与网关 / 服务暂时不可用
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+THROTTLED_STATUS = 429
+
+# 按服务端提示等待时附加的最大抖动比例
+_HINT_JITTER = 0.1
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """从响应头解析建议等待的秒数；没有或无法解析时返回 None"""
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class RetryWait:
+    """tenacity wait strategy: honour the server's hint, else jittered exponential backoff.
+
+    The attempt result must expose ``retry_after_s`` (``None`` when the
+    response carried no hint).
+    """
+
+    def __init__(self, backoff_s: float, max_backoff_s: float, rng: Optional[random.Random] = None):
+        self.max_backoff_s = max_backoff_s
+        self.rng = rng or random.Random()
+        self._exponential = wait_random_exponential(multiplier=backoff_s, max=max_backoff_s)
+
+    def __call__(self, retry_state: RetryCallState) -> float:
+        hint = retry_state.outcome.result().retry_after_s
+        if hint is None:
+            return self._exponential(retry_state)
+        return min(self.max_backoff_s, hint * (1 + self.rng.uniform(0, _HINT_JITTER)))
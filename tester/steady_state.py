@@ -0,0 +1,81 @@
+"""稳态检测：用 MSER 截断法自动识别运行开头的预热段
+
+运行开头的请求包含建连、TLS 握手和服务端冷路径，延迟明显偏高。MSER
+（Marginal Standard Error Rule）在按完成顺序排列的延迟序列上选择截断点
+d，使剩余部分均值的标准误最小：
+
+    MSER(d) = Σ_{i>=d} (x_i - mean_d)^2 / (n - d)^2
+
+截掉开头的慢请求能显著降低剩余部分的方差，MSER 下降；截得过多则因
+n - d 变小而回升。MSER-5 先把序列每 5 个取均值再计算，降低单个离群值
+的影响；样本太少时退化为逐个请求计算。截断点只在前一半中寻找，避免把
+整个短运行都当作预热。平稳序列上 MSER 也常会截掉开头碰巧偏离的几个值，
+因此 ``detect_warmup`` 只在被截掉的部分明显更慢时才接受截断。
+"""
+from __future__ import annotations
+
+import math
+from typing import Sequence
+
+# MSER-5：每批 5 个请求
+BATCH_SIZE = 5
+# 批数少于此值时逐个请求计算（MSER-1）
+MIN_BATCHES = 10
+# 样本少于此值时不做检测
+MIN_SAMPLES = 4
+# 显式开启检测时，在每组前 500 个请求中检测预热段
+DEFAULT_WINDOW = 500
+
+
+def mser_truncation(values: Sequence[float], batch_size: int = BATCH_SIZE) -> int:
+    """Number of leading values to discard as warm-up (0 when none is detected).
+
+    ``values`` must be in completion order. The result is a multiple of the
+    batch size actually used and never exceeds half of the series.
+    """
+    n = len(values)
+    if n < MIN_SAMPLES:
+        return 0
+    if n < batch_size * MIN_BATCHES:
+        batch_size = 1
+    k = n // batch_size
+    # 末尾不满一批的样本不参与计算
+    means = [
+        sum(values[j * batch_size:(j + 1) * batch_size]) / batch_size
+        for j in range(k)
+    ]
+    # 从后往前累加，得到每个截断点之后的和与平方和
+    suffix_sum = [0.0] * (k + 1)
+    suffix_sq = [0.0] * (k + 1)
+    for j in range(k - 1, -1, -1):
+        suffix_sum[j] = suffix_sum[j + 1] + means[j]
+        suffix_sq[j] = suffix_sq[j + 1] + means[j] * means[j]
+
+    best_d, best = 0, math.inf
+    for d in range(k // 2 + 1):
+        count = k - d
+        spread = max(0.0, suffix_sq[d] - suffix_sum[d] * suffix_sum[d] / count)
+        score = spread / (count * count)
+        # 只在明显更小时才多截，平稳序列保持不截断
+        if score < best * (1 - 1e-9):
+            best_d, best = d, score
+    return best_d * batch_size
+
+
+def detect_warmup(values: Sequence[float]) -> int:
+    """MSER truncation kept only when the cut-off prefix is clearly slower.
+
+    On a stationary series MSER still trims a few leading values fairly
+    often (whichever extremes happen to come first). Latency warm-up means
+    a *slow* start, so the cut is accepted only if the prefix mean exceeds
+    the remaining mean by more than two standard errors.
+    """
+    cut = mser_truncation(values)
+    if cut == 0:
+        return 0
+    prefix, rest = values[:cut], values[cut:]
+    rest_mean = sum(rest) / len(rest)
+    spread = math.sqrt(sum((x - rest_mean) ** 2 for x in rest) / (len(rest) - 1))
+    if sum(prefix) / cut > rest_mean + 2 * spread / math.sqrt(cut):
+        return cut
+    return 0
@@ -0,0 +1,160 @@
+"""连接阶段计时：用 aiohttp TraceConfig 拆分单个请求的耗时
+
+``latency_ms`` 只是一个总数，慢的时候看不出是模型、网络还是本地连接池
+不够用。这里在 session 上挂一组 trace 钩子，按请求记录各阶段的时间点：
+
+  - pool_wait：连接池已满、排队等待空闲连接
+  - dns：域名解析（命中 DNS 缓存时为 0）
+  - connect：新建连接的 TCP 连接与 TLS 握手（aiohttp 在一次调用中完成两者，
+    无法再拆开；复用连接时为空）
+  - send：拿到连接到请求头与请求体发送完毕
+  - ttfb：发送完毕到收到响应头（服务端排队与处理 + 一个网络往返）
+  - transfer：收到响应头到读完响应体（流式时包含整个生成过程）
+
+各阶段之和约等于 ``latency_ms``。发起请求时通过 ``trace_request_ctx`` 传入
+``RequestPhases``，没有挂钩子的 session 不会填任何阶段。
+"""
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+
+@dataclass
+class RequestPhases:
+    """Phase durations and timestamps (``perf_counter``) of one request, filled by the trace hooks."""
+
+    traced: bool = False
+    pool_wait_s: float = 0.0
+    dns_s: float = 0.0
+    # 新建连接（含其中的 DNS 解析）的耗时；复用连接时为空
+    create_s: Optional[float] = None
+    connected_at: Optional[float] = None
+    sent_at: Optional[float] = None
+    headers_at: Optional[float] = None
+    # 响应体字节数（流式读取由调用方累加，其余由钩子累加）
+    bytes_received: int = 0
+    _started: float = 0.0
+    _dns_started: Optional[float] = None
+
+    def to_fields(self, end: float) -> Dict[str, Any]:
+        """Keyword arguments for ``RequestRecord``; phases stay unset when the session was not traced."""
+        if not self.traced:
+            return {"bytes_received": self.bytes_received}
+        connect_s = max(0.0, self.create_s - self.dns_s) if self.create_s is not None else None
+        return {
+            "pool_wait_ms": self.pool_wait_s * 1000,
+            "dns_ms": self.dns_s * 1000 if self.create_s is not None else None,
+            "connect_ms": _ms(connect_s),
+            "send_ms": _ms(_span(self.connected_at, self.sent_at)),
+            "ttfb_ms": _ms(_span(self.sent_at, self.headers_at)),
+            "transfer_ms": _ms(_span(self.headers_at, end)),
+            "bytes_received": self.bytes_received,
+        }
+
+
+def _span(start: Optional[float], end: Optional[float]) -> Optional[float]:
+    if start is None or end is None:
+        return None
+    return max(0.0, end - start)
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return seconds * 1000 if seconds is not None else None
+
+
+def _phases(ctx: SimpleNamespace) -> Optional[RequestPhases]:
+    phases = ctx.trace_request_ctx
+    return phases if isinstance(phases, RequestPhases) else None
+
+
+async def _on_request_start(session, ctx, params) -> None:
+    phases = _phases(ctx)
+    if phases is not None:
+        phases.traced = True
+
+
+async def _on_queued_start(session, ctx, params) -> None:
+    phases = _phases(ctx)
+    if phases is not None:
+        phases._started = time.perf_counter()
+
+
+async def _on_queued_end(session, ctx, params) -> None:
+    phases = _phases(ctx)
+    if phases is not None:
+        phases.pool_wait_s += time.perf_counter() - phases._started
+
+
+async def _on_create_start(session, ctx, params) -> None:
+    phases = _phases(ctx)
+    if phases is not None:
+        phases._started = time.perf_counter()
+
+
+async def _on_create_end(session, ctx, params) -> None:
+    phases = _phases(ctx)
+    if phases is not None:
+        phases.connected_at = time.perf_counter()
+        phases.create_s = phases.connected_at - phases._started
+
+
+async def _on_reuseconn(session, ctx, params) -> None:
+    phases = _phases(ctx)
+    if phases is not None:
+        phases.connected_at = time.perf_counter()
+
+
+async def _on_dns_start(session, ctx, params) -> None:
+    phases = _phases(ctx)
+    if phases is not None:
+        # DNS 解析发生在新建连接内部，单独记起点，不覆盖建连起点
+        phases._dns_started = time.perf_counter()
+
+
+async def _on_dns_end(session, ctx, params) -> None:
+    phases = _phases(ctx)
+    if phases is not None and phases._dns_started is not None:
+        phases.dns_s += time.perf_counter() - phases._dns_started
+
+
+async def _on_sent(session, ctx, params) -> None:
+    # 请求头发出与每个请求体分块发出都会触发，取最后一次
+    phases = _phases(ctx)
+    if phases is not None:
+        phases.sent_at = time.perf_counter()
+
+
+async def _on_request_end(session, ctx, params) -> None:
+    phases = _phases(ctx)
+    if phases is not None:
+        phases.headers_at = time.perf_counter()
+
+
+async def _on_chunk_received(session, ctx, params) -> None:
+    # 只在 resp.read()/json() 读取整个响应体时触发
+    phases = _phases(ctx)
+    if phases is not None:
+        phases.bytes_received += len(params.chunk)
+
+
+def phase_trace_config() -> aiohttp.TraceConfig:
+    """TraceConfig that fills the ``RequestPhases`` passed as ``trace_request_ctx``."""
+    config = aiohttp.TraceConfig()
+    config.on_request_start.append(_on_request_start)
+    config.on_connection_queued_start.append(_on_queued_start)
+    config.on_connection_queued_end.append(_on_queued_end)
+    config.on_connection_create_start.append(_on_create_start)
+    config.on_connection_create_end.append(_on_create_end)
+    config.on_connection_reuseconn.append(_on_reuseconn)
+    config.on_dns_resolvehost_start.append(_on_dns_start)
+    config.on_dns_resolvehost_end.append(_on_dns_end)
+    config.on_request_headers_sent.append(_on_sent)
+    config.on_request_chunk_sent.append(_on_sent)
+    config.on_request_end.append(_on_request_end)
+    config.on_response_chunk_received.append(_on_chunk_received)
+    return config
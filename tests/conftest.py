@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# 与根目录下的脚本一致：把项目根目录加入导入路径
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# 测试产生的历史库、归档与日志写到临时目录，必须在导入 backend 之前设置
+_DATA_DIR = Path(tempfile.mkdtemp(prefix="llm-eval-tests-"))
+os.environ.setdefault("HISTORY_DB", str(_DATA_DIR / "history.db"))
+os.environ.setdefault("HISTORY_FILE", str(_DATA_DIR / "test_history.json"))
+os.environ.setdefault("RECORD_ARCHIVE_DIR", str(_DATA_DIR / "records"))
+os.environ.setdefault("CALIBRATION_FILE", str(_DATA_DIR / "calibration.json"))
+os.environ.setdefault("CORPUS_DIR", str(_DATA_DIR / "corpus"))
+os.environ.setdefault("LOG_FILE", str(_DATA_DIR / "app.log"))
@@ -0,0 +1,97 @@
+"""分布式压测：两个进程内 agent 通过本机 HTTP 连接 API 服务，分片出错时任务不会挂起"""
+import asyncio
+import socket
+
+import pytest
+
+import backend.main as main
+from backend.agent_coordinator import DistributedTester
+from tester.agent import LoadAgent
+from tester.latency_tester import ModelConfig
+from tester.mock_server import MockProfile, MockServer
+
+uvicorn = pytest.importorskip("uvicorn")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _config(url: str) -> ModelConfig:
+    return ModelConfig(
+        name="mock", endpoint=url, api_key="k", api_version="v", prompt="hi",
+        max_tokens=5, concurrency=4, iterations=2, stream=True,
+    )
+
+
+def _run_with_agents(monkeypatch, prepare=None):
+    """启动 API 服务、模拟端点和两个 agent，返回分布式运行的记录数或错误"""
+    coordinator = main.agent_coordinator
+    monkeypatch.setattr(coordinator, "poll_timeout_s", 0.5)
+    monkeypatch.setattr(coordinator, "_agents", {})
+    monkeypatch.setattr(coordinator, "_assignments", {})
+
+    async def run():
+        port = _free_port()
+        server = uvicorn.Server(uvicorn.Config(
+            main.app, host="127.0.0.1", port=port, lifespan="off", log_level="warning",
+        ))
+        server_task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+
+        agents = [
+            LoadAgent(f"http://127.0.0.1:{port}", f"node-{i}", upload_interval=0.1, clock_samples=2)
+            for i in range(2)
+        ]
+        if prepare is not None:
+            prepare(agents)
+        agent_tasks = [asyncio.create_task(agent.serve_forever()) for agent in agents]
+        try:
+            async with MockServer(MockProfile(tokens=(5, 5))) as mock:
+                while len(coordinator.resolve("*")) < 2:
+                    await asyncio.sleep(0.05)
+                tester = DistributedTester(coordinator, coordinator.resolve("*"), request_timeout=10)
+                try:
+                    records = await asyncio.wait_for(tester.run_models([_config(mock.url)]), timeout=20)
+                except RuntimeError as e:
+                    return str(e)
+                return len(records)
+        finally:
+            for task in agent_tasks:
+                task.cancel()
+            await asyncio.gather(*agent_tasks, return_exceptions=True)
+            server.should_exit = True
+            await server_task
+
+    return asyncio.run(run())
+
+
+def test_two_agents_split_the_load(monkeypatch):
+    assert _run_with_agents(monkeypatch) == 8
+
+
+def test_setup_failure_is_reported(monkeypatch):
+    def prepare(agents):
+        async def broken_clock(session):
+            raise ConnectionError("clock endpoint unreachable")
+
+        agents[1].measure_clock = broken_clock
+
+    result = _run_with_agents(monkeypatch, prepare)
+    assert "node-1" in result
+    assert "clock endpoint unreachable" in result
+
+
+def test_unreported_assignment_fails_on_next_poll(monkeypatch):
+    def prepare(agents):
+        async def lost_report(session, assignment_id, error, attempts=3):
+            return None
+
+        agents[0]._report_done = lost_report
+
+    result = _run_with_agents(monkeypatch, prepare)
+    assert "node-0" in result
+    assert "未上报完成" in result
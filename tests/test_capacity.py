@@ -0,0 +1,110 @@
+"""容量搜索：倍增 / 二分的边界与探测点提前中止
+
+模拟端点每个请求固定耗时 100 ms，客户端连接池只有 6 个连接：并发不超过 6
+时延迟约 100 ms，超过后请求排队，延迟翻倍，所以满足 p90 <= 160 ms 的最高并发是 6。
+"""
+import asyncio
+import math
+from collections import Counter
+
+import pytest
+
+from tester.capacity import SLO, CapacitySearch, _ProbeBudget
+from tester.http_pool import HttpClientPool
+from tester.latency_tester import LatencyTester, ModelConfig, RequestRecord
+from tester.mock_server import Distribution, MockProfile, MockServer
+
+POOL_SIZE = 6
+
+
+def _record(latency_ms: float, error: str = None) -> RequestRecord:
+    return RequestRecord(
+        model="m", request_id=0, start_time=0.0, end_time=latency_ms / 1000, latency_ms=latency_ms,
+        status=500 if error else 200, error=error, prompt_tokens=1, completion_tokens=1,
+        total_tokens=2, response_text=None,
+    )
+
+
+def _search(slo: SLO, **kwargs):
+    """对连接池受限的客户端运行容量搜索，返回结果与各探测点实际完成的请求数"""
+    completed = Counter()
+
+    async def run():
+        pool = HttpClientPool(limit=POOL_SIZE, limit_per_host=POOL_SIZE)
+        search = CapacitySearch(lambda: LatencyTester(pool=pool), slo, **kwargs)
+        try:
+            async with MockServer(MockProfile(ttft=Distribution("fixed", 100), tokens=(5, 5))) as server:
+                config = ModelConfig(
+                    name="mock", endpoint=server.url, api_key="k", api_version="v", prompt="hi", max_tokens=5,
+                )
+                result = await search.search(
+                    config, record_callback=lambda record: completed.update([record.stage])
+                )
+        finally:
+            await pool.close()
+        return result
+
+    return asyncio.run(run()), completed
+
+
+def test_doubling_then_bisection_finds_the_pool_size():
+    result, completed = _search(SLO({"p90": 160}))
+
+    loads = [probe.load for probe in result.probes]
+    # 倍增 1, 2, 4 通过、8 失败，再在 4 与 8 之间二分：6 通过、7 失败
+    assert loads == [1, 2, 4, 8, 6, 7]
+    assert [probe.passed for probe in result.probes] == [True, True, True, False, True, False]
+    assert result.max_load == POOL_SIZE
+    assert result.best["total_requests"] == POOL_SIZE * 5
+
+    # 失败的探测点超出预算即提前中止，通过的探测点跑完全部请求
+    for probe in result.probes:
+        # 每个探测点至少 5 轮、至少 20 个请求
+        planned = probe.load * max(5, math.ceil(20 / probe.load))
+        if probe.passed:
+            assert not probe.aborted
+            assert completed[probe.label] == planned
+        else:
+            assert probe.aborted
+            assert completed[probe.label] < planned
+
+
+def test_search_stops_at_max_load():
+    result, _ = _search(SLO({"p90": 160}), max_load=4)
+    assert [probe.load for probe in result.probes] == [1, 2, 4]
+    assert result.max_load == 4
+
+
+def test_start_already_failing_has_no_capacity():
+    result, _ = _search(SLO({"p95": 10}), start=2)
+    assert [probe.load for probe in result.probes] == [2]
+    assert result.max_load is None and result.best is None
+
+
+def test_budget_allows_the_quantile_tail():
+    # p90 over 20 planned requests: up to 2 may exceed the limit
+    budget = _ProbeBudget(SLO({"p90": 100}, max_error_rate=0.1), planned=20)
+    assert not budget.add(_record(150))
+    assert not budget.add(_record(150))
+    assert not budget.add(_record(50))
+    assert budget.add(_record(150))
+
+
+def test_budget_counts_errors_separately():
+    budget = _ProbeBudget(SLO({"first_token_p50": 100}, max_error_rate=0.1), planned=20)
+    assert not budget.add(_record(10, error="HTTP 500"))
+    assert not budget.add(_record(10, error="HTTP 500"))
+    assert budget.add(_record(10, error="HTTP 500"))
+
+
+def test_slo_violations():
+    slo = SLO({"p95": 100, "first_token_p99": 50}, max_error_rate=0.01)
+    row = {"success_count": 10, "error_rate": 0.0, "p95": 90.0, "first_token_p99": 40.0}
+    assert slo.violations(row) == []
+    assert slo.violations({**row, "p95": 120.0, "error_rate": 0.05}) == [
+        "p95=120.0 > 100", "error_rate=0.050 > 0.01",
+    ]
+    assert slo.violations({**row, "first_token_p99": None}) == ["first_token_p99=None > 50"]
+    assert slo.violations({**row, "success_count": 0}) == ["no successful requests"]
+    with pytest.raises(ValueError):
+        SLO({"avg_latency": 100})
@@ -0,0 +1,100 @@
+"""流式增量合并推送：订阅者停止读取时缓冲有上限"""
+import asyncio
+
+from backend.chunk_coalescer import ChunkCoalescer
+from backend.task_manager import TaskEventLog
+
+RING_SIZE = 5
+
+
+def test_block_policy_waits_for_a_stalled_reader():
+    async def run():
+        log = TaskEventLog(ring_size=RING_SIZE, policy="block")
+        reader = await log.subscribe(0)
+        coalescer = ChunkCoalescer(
+            "t", lambda _, data: log.put(data), flush_interval_ms=1,
+            policy="block", max_buffer_bytes=100, max_buffer_events=RING_SIZE,
+        )
+        coalescer.start()
+
+        async def produce():
+            for i in range(20 * RING_SIZE):
+                await coalescer.stream_callback("m", i, "x" * 10)
+
+        producer = asyncio.create_task(produce())
+        await asyncio.sleep(0.2)
+        # 没人读取：生产者被挡住，事件日志与缓冲都停在上限
+        stalled = (producer.done(), log.qsize(), coalescer.buffered_events, coalescer.buffered_bytes)
+
+        async def drain():
+            while True:
+                await reader.get()
+
+        draining = asyncio.create_task(drain())
+        await asyncio.wait_for(producer, timeout=5)
+        await coalescer.stop()
+        draining.cancel()
+        return stalled, coalescer.dropped
+
+    (done, log_size, events, size), dropped = asyncio.run(run())
+    assert not done
+    assert log_size <= RING_SIZE
+    assert events <= RING_SIZE + 1
+    assert size <= 100 + 10
+    assert dropped == 0
+
+
+def test_drop_policy_discards_past_the_cap():
+    async def run():
+        gate = asyncio.Event()
+        pushed = []
+
+        async def push(_, data):
+            # 模拟阻塞在事件日志上的推送
+            await gate.wait()
+            pushed.append(data)
+
+        coalescer = ChunkCoalescer(
+            "t", push, flush_interval_ms=1,
+            policy="drop_chunks", max_buffer_bytes=100, max_buffer_events=RING_SIZE,
+        )
+        coalescer.start()
+        for i in range(20 * RING_SIZE):
+            coalescer.stream_callback("m", i, "x" * 10)
+            coalescer.add_event({"type": "chunk", "model": "m", "request_id": i, "chunk": "done"})
+            await asyncio.sleep(0)
+        peak = (coalescer.buffered_events, coalescer.buffered_bytes)
+        gate.set()
+        await coalescer.stop()
+        return peak, coalescer.dropped, pushed, coalescer.buffered_events
+
+    (events, size), dropped, pushed, left = asyncio.run(run())
+    assert events <= RING_SIZE and size <= 100
+    assert dropped > 0
+    assert 0 < len(pushed) <= RING_SIZE
+    assert left == 0
+
+
+def test_block_policy_bounds_completion_events():
+    async def run():
+        gate = asyncio.Event()
+
+        async def push(_, data):
+            await gate.wait()
+
+        coalescer = ChunkCoalescer(
+            "t", push, flush_interval_ms=1,
+            policy="block", max_buffer_bytes=100, max_buffer_events=RING_SIZE,
+        )
+        coalescer.start()
+        # 完成事件来自同步回调，无法等待：最多超出一倍上限
+        for i in range(20 * RING_SIZE):
+            coalescer.add_event({"type": "chunk", "model": "m", "request_id": i, "chunk": "x" * 10})
+        peak = (coalescer.buffered_events, coalescer.buffered_bytes)
+        gate.set()
+        await coalescer.stop()
+        return peak, coalescer.dropped
+
+    (events, size), dropped = asyncio.run(run())
+    assert events <= 2 * RING_SIZE and size <= 200
+    assert dropped > 0
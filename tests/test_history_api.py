@@ -0,0 +1,74 @@
+"""原始请求记录分页接口：参数校验与分页"""
+import asyncio
+import socket
+
+import aiohttp
+import pytest
+
+import backend.main as main
+from tester.latency_tester import RequestRecord
+from tester.record_archive import RecordArchiveWriter
+
+uvicorn = pytest.importorskip("uvicorn")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _archived_record(rows: int) -> str:
+    archive_dir = main.history_manager.new_archive_dir("test-history-api")
+    writer = RecordArchiveWriter(archive_dir, origin=0.0)
+    for i in range(rows):
+        writer.append(RequestRecord(
+            model="m", request_id=i, start_time=float(i), end_time=i + 0.5, latency_ms=500.0,
+            status=200, error=None, prompt_tokens=1, completion_tokens=1, total_tokens=2, response_text=None,
+        ))
+    writer.close()
+    return main.history_manager.add_record([], {"question": "q"}, archive=archive_dir)
+
+
+def _get(record_id: str, queries):
+    """启动 API 服务，依次请求给定查询参数，返回 (状态码, 响应体) 列表"""
+    async def run():
+        port = _free_port()
+        server = uvicorn.Server(uvicorn.Config(
+            main.app, host="127.0.0.1", port=port, lifespan="off", log_level="warning",
+        ))
+        server_task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+        try:
+            results = []
+            async with aiohttp.ClientSession() as session:
+                for query in queries:
+                    url = f"http://127.0.0.1:{port}/api/history/{record_id}/records"
+                    async with session.get(url, params=query) as resp:
+                        results.append((resp.status, await resp.json()))
+            return results
+        finally:
+            server.should_exit = True
+            await server_task
+
+    return asyncio.run(run())
+
+
+def test_record_pages_validate_offset_and_limit():
+    record_id = _archived_record(5)
+    results = _get(record_id, [
+        {"offset": "3", "limit": "10"},
+        {"offset": "-2", "limit": "1"},
+        {"limit": "0"},
+        {"limit": "-1"},
+        {"limit": "1001"},
+    ])
+    main.history_manager.delete_record(record_id)
+
+    status, body = results[0]
+    assert status == 200
+    assert body["total"] == 5 and body["offset"] == 3
+    assert [row["request_id"] for row in body["records"]] == [3, 4]
+    # 负数不再回绕切片，超出范围的分页参数直接拒绝
+    assert [status for status, _ in results[1:]] == [422, 422, 422, 422]
@@ -0,0 +1,159 @@
+"""历史记录存储：旧版 JSON 迁移与趋势汇总表"""
+import json
+
+from backend.history_manager import HistoryManager
+from tester.aggregator import RunAggregator
+from tester.latency_tester import RequestRecord
+
+
+def _run(latencies):
+    """按给定延迟（毫秒）构造一次运行的汇总行与草图"""
+    aggregator = RunAggregator()
+    for i, latency in enumerate(latencies):
+        aggregator.add(RequestRecord(
+            model="m", request_id=i, start_time=0.0, end_time=latency / 1000, latency_ms=latency,
+            status=200, error=None, prompt_tokens=1, completion_tokens=1, total_tokens=2,
+            response_text=None, first_token_latency_ms=latency / 2,
+        ))
+    return aggregator.summary_rows(), aggregator.sketches()
+
+
+def test_daily_quantiles_come_from_merged_sketches(tmp_path):
+    manager = HistoryManager(str(tmp_path / "history.db"), legacy_file=None)
+    # 一次 20 个请求的慢运行与一次 980 个请求的快运行：
+    # 合并后只有 2% 的请求慢，日 p95 应落在快运行的分布上
+    for latencies in ([1000.0] * 20, [100.0] * 980):
+        summary, sketches = _run(latencies)
+        manager.add_record(summary, {"question": "q"}, sketches=sketches)
+
+    runs = manager.get_trends(model="m")["m"]
+    assert [round(point["p95"]) for point in runs] == [1000, 100]
+    assert "latency_sketch" not in runs[0]
+
+    [day] = manager.get_trends(model="m", granularity="day")["m"]
+    assert day["runs"] == 2 and day["success_count"] == 1000
+    assert abs(day["p95"] - 100) <= 2
+    assert abs(day["first_token_p95"] - 50) <= 1
+    assert abs(day["p99"] - 1000) <= 20
+    assert abs(day["avg_latency"] - 118) <= 1
+
+    # 删除慢运行后日汇总只剩快运行
+    slow_id = manager.get_all_records()[-1]["id"]
+    manager.delete_record(slow_id)
+    [day] = manager.get_trends(model="m", granularity="day")["m"]
+    assert day["runs"] == 1 and round(day["p99"]) == 100
+    manager.close()
+
+
+def test_daily_quantiles_without_sketches_are_not_averaged(tmp_path):
+    manager = HistoryManager(str(tmp_path / "history.db"), legacy_file=None)
+    for latencies in ([1000.0] * 20, [100.0] * 980):
+        summary, _ = _run(latencies)
+        manager.add_record(summary, {"question": "q"})
+
+    [day] = manager.get_trends(model="m", granularity="day")["m"]
+    assert day["p95"] is None and day["first_token_p50"] is None
+    assert day["avg_latency"] is not None
+    manager.close()
+
+
+def _legacy_record(record_id, timestamp, question, rows):
+    return {
+        "id": record_id,
+        "timestamp": timestamp,
+        "test_config": {"question": question},
+        "summary": rows,
+        "model_count": len(rows),
+    }
+
+
+def test_legacy_json_is_migrated_once(tmp_path):
+    legacy = tmp_path / "test_history.json"
+    # 旧文件最新的在前
+    history = [
+        _legacy_record("b", "2024-01-02T10:00:00", "q2", [
+            {"model": "m1", "p95": 200.0, "success_count": 10, "total_requests": 10, "error_count": 0},
+        ]),
+        _legacy_record("a", "2024-01-01T10:00:00", "q1" * 40, [
+            {"model": "m1", "p95": 100.0, "success_count": 10, "total_requests": 10, "error_count": 0},
+            {"model": "m2", "p95": 300.0, "error_rate": 0.2, "success_count": 8, "total_requests": 10,
+             "error_count": 2},
+        ]),
+    ]
+    legacy.write_text(json.dumps(history), encoding="utf-8")
+
+    manager = HistoryManager(str(tmp_path / "history.db"), legacy_file=str(legacy))
+    assert not legacy.exists()
+    assert (tmp_path / "test_history.json.migrated").exists()
+    assert manager.count() == 2
+    listed = manager.get_all_records()
+    assert [record["id"] for record in listed] == ["b", "a"]
+    assert listed[1]["models"] == ["m1", "m2"]
+    assert listed[1]["question"] == "q1" * 25 + "..."
+    assert manager.get_record("a") == history[1]
+
+    # 迁移的记录同样进入趋势汇总
+    trends = manager.get_trends()
+    assert [point["p95"] for point in trends["m1"]] == [100.0, 200.0]
+    assert [point["day"] for point in trends["m1"]] == ["2024-01-01", "2024-01-02"]
+    [m2] = trends["m2"]
+    assert m2["question"] == "q1" * 40 and m2["error_rate"] == 0.2
+    manager.close()
+
+    # 重新打开不会重复导入
+    manager = HistoryManager(str(tmp_path / "history.db"), legacy_file=str(legacy))
+    assert manager.count() == 2
+    manager.close()
+
+
+def test_trend_filters_and_daily_rollup(tmp_path):
+    manager = HistoryManager(str(tmp_path / "history.db"), legacy_file=None)
+    row = {"model": "m", "avg_latency": 100.0, "success_count": 9, "total_requests": 10, "error_count": 1}
+    first = manager.add_record([row], {"question": "q"})
+    manager.add_record([{**row, "avg_latency": 200.0, "success_count": 1, "error_count": 0, "total_requests": 1}],
+                       {"question": "q"})
+    manager.add_record([{**row, "model": "other"}], {"question": "other"})
+
+    assert set(manager.get_trends()) == {"m", "other"}
+    assert set(manager.get_trends(question="other")) == {"other"}
+    assert manager.get_trends(start_date="2999-01-01") == {}
+
+    [day] = manager.get_trends(model="m", granularity="day")["m"]
+    assert day["runs"] == 2 and day["total_requests"] == 11 and day["error_count"] == 1
+    assert abs(day["error_rate"] - 1 / 11) < 1e-9
+    # 平均值按成功请求数加权
+    assert day["avg_latency"] == 110.0
+
+    manager.delete_record(first)
+    [day] = manager.get_trends(model="m", granularity="day")["m"]
+    assert day["runs"] == 1 and day["avg_latency"] == 200.0
+
+    manager.clear_all()
+    assert manager.count() == 0 and manager.get_trends(granularity="day") == {}
+    manager.close()
+
+
+def test_max_records_prunes_rollups(tmp_path):
+    manager = HistoryManager(str(tmp_path / "history.db"), legacy_file=None, max_records=2)
+    row = {"model": "m", "success_count": 1, "total_requests": 1, "error_count": 0}
+    for _ in range(3):
+        manager.add_record([row], {"question": "q"})
+    assert manager.count() == 2
+    assert len(manager.get_trends()["m"]) == 2
+    [day] = manager.get_trends(granularity="day")["m"]
+    assert day["runs"] == 2
+    manager.close()
+
+
+def test_models_are_listed_once_per_staged_run(tmp_path):
+    manager = HistoryManager(str(tmp_path / "history.db"), legacy_file=None)
+    row = {"success_count": 1, "total_requests": 1, "error_count": 0}
+    manager.add_record([
+        {**row, "model": "b", "stage": "ramp"},
+        {**row, "model": "a", "stage": "ramp"},
+        {**row, "model": "b", "stage": "peak"},
+    ], {"question": "q"})
+    [record] = manager.get_all_records()
+    assert record["models"] == ["b", "a"]
+    assert len(manager.get_trends()["b"]) == 2
+    manager.close()
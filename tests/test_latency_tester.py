@@ -0,0 +1,152 @@
+"""LatencyTester 对模拟端点的端到端行为：流式 / 非流式记录、429 重试、客户端限流与取消"""
+import asyncio
+import time
+
+from tester.latency_tester import LatencyTester, ModelConfig
+from tester.mock_server import Distribution, MockProfile, MockServer
+from tester.rate_limiter import RateLimiterRegistry
+
+
+def _config(url: str, name: str = "mock", **overrides) -> ModelConfig:
+    fields = dict(
+        name=name, endpoint=url, api_key="k", api_version="v", prompt="hi",
+        max_tokens=5, concurrency=2, iterations=2,
+    )
+    fields.update(overrides)
+    return ModelConfig(**fields)
+
+
+def _run(profile, *make_configs, seed=0, tester=None):
+    """对模拟端点运行给定配置，返回记录与模拟端统计"""
+    async def run():
+        async with MockServer(profile, seed=seed) as server:
+            records = await (tester or LatencyTester()).run_models(
+                [make(server.url) for make in make_configs]
+            )
+            return records, server.stats
+
+    return asyncio.run(run())
+
+
+def test_streaming_records():
+    profile = MockProfile(ttft=Distribution("fixed", 20), inter_token=Distribution("fixed", 2), tokens=(5, 5))
+    records, stats = _run(profile, lambda url: _config(url, stream=True))
+
+    assert len(records) == 4 == stats.requests
+    for record in records:
+        assert record.status == 200 and record.error is None
+        assert record.completion_tokens == 5
+        assert len(record.response_text.split()) == 5
+        assert 20 <= record.first_token_latency_ms <= record.latency_ms
+        # 每次带有输出的网络读取一个时间点，合并读取时少于 token 数
+        assert 1 <= len(record.chunk_times_ms) <= 5
+        assert record.tpot_ms is not None
+
+
+def test_coalesced_reads_give_no_zero_itl_samples():
+    # token 之间不等待：多个增量块常在同一次读取中到达
+    profile = MockProfile(ttft=Distribution("fixed", 5), tokens=(50, 50))
+    records, _ = _run(profile, lambda url: _config(url, stream=True, iterations=5, max_tokens=50))
+
+    for record in records:
+        assert len(record.response_text.split()) == 50
+        times = record.chunk_times_ms.tolist()
+        assert all(later > earlier for earlier, later in zip(times, times[1:]))
+
+
+def test_non_streaming_records():
+    profile = MockProfile(ttft=Distribution("fixed", 20), tokens=(5, 5))
+    records, _ = _run(
+        profile,
+        lambda url: _config(url, stream=False),
+        lambda url: _config(url, name="mock-codex", stream=False),
+    )
+
+    assert len(records) == 8
+    for record in records:
+        assert record.status == 200 and record.error is None
+        assert record.completion_tokens == 5
+        assert len(record.response_text.split()) == 5
+        assert record.first_token_latency_ms is None
+        assert record.latency_ms >= 20
+
+
+def test_429_is_retried_after_hint():
+    profile = MockProfile(rate_429=0.5, retry_after_s=0.05, tokens=(5, 5))
+    records, stats = _run(profile, lambda url: _config(url, concurrency=4, iterations=4, max_retries=10))
+
+    assert all(record.status == 200 for record in records)
+    assert sum(record.throttled for record in records) == stats.throttled > 0
+    for record in records:
+        assert record.attempts == record.throttled + 1
+        # 按 retry-after-ms 提示等待（附加不超过 10% 的抖动）
+        assert 50 * record.throttled <= record.backoff_ms <= 60 * record.throttled
+
+
+def test_429_without_retries_is_an_error():
+    profile = MockProfile(rate_429=1.0, tokens=(5, 5))
+    records, stats = _run(profile, lambda url: _config(url))
+
+    assert stats.throttled == 4
+    assert all(record.status == 429 and record.error for record in records)
+    assert all(record.attempts == 1 and record.throttled == 1 for record in records)
+
+
+def test_rpm_limit_spaces_requests():
+    # 60 RPM：桶容量为 10 秒额度（10 个请求），之后每秒放行一个
+    tester = LatencyTester(rate_limiters=RateLimiterRegistry())
+    started = time.perf_counter()
+    records, _ = _run(
+        MockProfile(tokens=(5, 5)),
+        lambda url: _config(url, concurrency=12, iterations=1, rpm_limit=60),
+        tester=tester,
+    )
+    elapsed = time.perf_counter() - started
+
+    waits = sorted(record.rate_limit_wait_ms for record in records)
+    assert waits[:10] == [0.0] * 10
+    assert 900 <= waits[10] < waits[11]
+    assert elapsed >= 1.8
+
+
+def test_open_loop_lag_excludes_rate_limit_wait():
+    # 100 RPS 调度，但 60 RPM 限流只放行前 10 个：后面的请求在限流器里等待，
+    # 这段等待不算作调度滞后
+    tester = LatencyTester(rate_limiters=RateLimiterRegistry())
+    records, _ = _run(
+        MockProfile(tokens=(5, 5)),
+        lambda url: _config(url, concurrency=12, iterations=1, rps=100.0, rpm_limit=60),
+        tester=tester,
+    )
+
+    assert max(record.rate_limit_wait_ms for record in records) >= 900
+    assert max(record.schedule_lag_ms for record in records) < 100
+
+
+def test_cancel_returns_completed_records():
+    slow = MockProfile(ttft=Distribution("fixed", 5000), tokens=(5, 5))
+    tester = LatencyTester()
+
+    async def run():
+        async with MockServer(MockProfile(tokens=(5, 5)), profiles={"slow": slow}) as server:
+            handle = asyncio.create_task(tester.run_models([
+                _config(server.url, name="fast", stream=True),
+                _config(server.url, name="slow", stream=True),
+            ]))
+            await asyncio.sleep(0.5)
+            started = time.perf_counter()
+            tester.cancel()
+            records = await handle
+            return records, time.perf_counter() - started
+
+    records, cancel_s = asyncio.run(run())
+    assert cancel_s < 1
+    assert [record.model for record in records] == ["fast"] * 4
+    assert tester.cancelled
+
+
+def test_stall_happens_before_the_last_token():
+    # 单 token 输出时卡住位置只能是第一个 token 之前
+    profile = MockProfile(tokens=(1, 1), stall_rate=1.0, stall_s=0.05)
+    _, stats = _run(profile, lambda url: _config(url, stream=True))
+    assert stats.stalled == stats.requests == 4
@@ -0,0 +1,55 @@
+"""多进程分片：开环模式按请求数与 RPS 拆分，子进程写帧不阻塞事件循环"""
+import asyncio
+
+from tester.latency_tester import ModelConfig
+from tester.mock_server import Distribution, MockProfile, MockServer
+from tester.process_runner import ProcessShardedTester, max_shards, shard_config
+
+
+def _config(**overrides):
+    fields = dict(name="m", endpoint="http://x", api_key="k", api_version="v", prompt="hi", max_tokens=5)
+    fields.update(overrides)
+    return ModelConfig(**fields)
+
+
+def test_closed_loop_shards_by_concurrency():
+    config = _config(concurrency=3, iterations=4)
+    assert max_shards(config) == 3
+    shards = [shard_config(config, i, 4) for i in range(4)]
+    assert [s.concurrency for s in shards[:3]] == [1, 1, 1] and shards[3] is None
+    assert all(s.iterations == 4 and s.rps is None for s in shards[:3])
+
+
+def test_open_loop_shards_by_requests_and_rps():
+    config = _config(concurrency=1, iterations=10, rps=40.0, seed=1)
+    assert max_shards(config) == 10
+    shards = [shard_config(config, i, 4) for i in range(4)]
+    assert [s.concurrency * s.iterations for s in shards] == [3, 3, 2, 2]
+    assert sum(s.rps for s in shards) == 40.0
+    assert [s.seed for s in shards] == [1, 2, 3, 4]
+    # 恒定间隔：起点依次错开一个总体间隔（1/40 秒）
+    assert [s.arrival_offset_s for s in shards] == [0.0, 0.025, 0.05, 0.075]
+
+    timed = _config(concurrency=1, rps=40.0, duration_s=5, arrival="poisson")
+    assert max_shards(timed) > 4
+    shards = [shard_config(timed, i, 4) for i in range(4)]
+    assert all(s.rps == 10.0 and s.arrival_offset_s == 0.0 for s in shards)
+
+
+def test_open_loop_run_uses_every_process():
+    async def run():
+        async with MockServer(MockProfile(ttft=Distribution("fixed", 5), tokens=(5, 5))) as server:
+            config = _config(endpoint=server.url, concurrency=1, iterations=12, rps=100.0, stream=True)
+            chunks = []
+            records = await ProcessShardedTester(3).run_models(
+                [config], stream_callback=lambda model, request_id, chunk: chunks.append(request_id),
+            )
+            return records, chunks, server.stats
+
+    records, chunks, stats = asyncio.run(run())
+    assert len(records) == 12 == stats.requests
+    assert sorted(record.request_id for record in records) == list(range(12))
+    # 请求编号 = 分片内编号 * 3 + 分片号：三个分片都发出了请求
+    assert {record.request_id % 3 for record in records} == {0, 1, 2}
+    assert all(record.error is None and record.schedule_lag_ms is not None for record in records)
+    assert set(chunks) == set(range(12))
@@ -0,0 +1,95 @@
+"""原始记录列式归档：写入后通过 memmap 读回"""
+import math
+from array import array
+
+import numpy as np
+import pandas as pd
+
+from tester.latency_tester import RequestRecord
+from tester.record_archive import RecordArchive, RecordArchiveWriter
+
+ORIGIN = 1000.0
+
+
+def _records():
+    full = RequestRecord(
+        model="gpt", request_id=0, start_time=ORIGIN + 1.5, end_time=ORIGIN + 2.0, latency_ms=500.0,
+        status=200, error=None, prompt_tokens=10, completion_tokens=3, total_tokens=13,
+        response_text="not archived", first_token_latency_ms=120.5, schedule_lag_ms=0.25,
+        stage="ramp", chunk_times_ms=array("f", [120.5, 130.0, 140.0]), tpot_ms=9.75,
+        decode_tokens_per_s=102.5, attempts=2, backoff_ms=50.0, first_attempt_latency_ms=30.0,
+        throttled=1, rate_limit_wait_ms=4.0, prompt_band="0-512", warmup=True,
+        pool_wait_ms=0.5, dns_ms=1.0, connect_ms=2.0, send_ms=0.125, ttfb_ms=100.0,
+        transfer_ms=400.0, bytes_received=2048,
+    )
+    # 失败请求：可选字段全部为空
+    failed = RequestRecord(
+        model="claude", request_id=1, start_time=ORIGIN + 3.0, end_time=ORIGIN + 3.25, latency_ms=250.0,
+        status=None, error="timeout", prompt_tokens=None, completion_tokens=None, total_tokens=None,
+        response_text=None,
+    )
+    # 与第一条同模型，字典编码复用同一编号
+    again = RequestRecord(
+        model="gpt", request_id=2, start_time=ORIGIN + 4.0, end_time=ORIGIN + 4.5, latency_ms=500.0,
+        status=200, error=None, prompt_tokens=10, completion_tokens=2, total_tokens=12,
+        response_text=None, chunk_times_ms=array("f", [80.0, 90.0]), stage="ramp",
+    )
+    return [full, failed, again]
+
+
+def _write(tmp_path, records, flush_rows=4096):
+    writer = RecordArchiveWriter(tmp_path / "run", origin=ORIGIN, flush_rows=flush_rows)
+    for record in records:
+        writer.append(record)
+    return RecordArchive(writer.close())
+
+
+def test_round_trip(tmp_path):
+    archive = _write(tmp_path, _records())
+    assert len(archive) == 3
+
+    latency = archive.column("latency_ms")
+    assert isinstance(latency, np.memmap) and latency.dtype == np.float32
+    assert latency.tolist() == [500.0, 250.0, 500.0]
+    assert archive.column("start_s").tolist() == [1.5, 3.0, 4.0]
+    assert archive.column("status").tolist() == [200, -1, 200]
+    assert archive.column("attempts").tolist() == [2, 1, 1]
+    assert archive.column("bytes_received").tolist() == [2048, -1, -1]
+    assert math.isnan(archive.column("first_token_latency_ms")[1])
+
+    assert archive.categories("model") == ["gpt", "claude"]
+    assert archive.column("model").tolist() == [0, 1, 0]
+    assert archive.column("error").tolist() == [-1, 0, -1]
+
+    assert archive.chunk_times(0).tolist() == [120.5, 130.0, 140.0]
+    assert archive.chunk_times(1).tolist() == []
+    assert archive.chunk_times(2).tolist() == [80.0, 90.0]
+
+
+def test_dataframe_slices_and_missing_values(tmp_path):
+    archive = _write(tmp_path, _records())
+    frame = archive.to_dataframe(start=1)
+    assert len(frame) == 2
+    assert list(frame["model"]) == ["claude", "gpt"]
+    assert pd.isna(frame["stage"].iloc[0]) and frame["stage"].iloc[1] == "ramp"
+    assert pd.isna(frame["status"].iloc[0]) and frame["status"].iloc[1] == 200
+    assert list(frame["warmup"]) == [0, 0]
+    assert "chunk_times_ms" not in frame.columns
+
+    frame = archive.to_dataframe(columns=["request_id", "tpot_ms"])
+    assert list(frame.columns) == ["request_id", "tpot_ms"]
+    assert frame["tpot_ms"].iloc[0] == 9.75
+
+
+def test_flushes_in_batches(tmp_path):
+    records = _records() * 5
+    archive = _write(tmp_path, records, flush_rows=2)
+    assert len(archive) == 15
+    assert archive.column("latency_ms").tolist() == [r.latency_ms for r in records]
+    assert archive.chunk_times(14).tolist() == [80.0, 90.0]
+
+
+def test_empty_archive(tmp_path):
+    archive = _write(tmp_path, [])
+    assert len(archive) == 0
+    assert archive.to_dataframe().empty
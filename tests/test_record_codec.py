@@ -0,0 +1,51 @@
+"""跨进程记录编码：编码后解码得到相同的记录"""
+import dataclasses
+from array import array
+
+from tester.latency_tester import RequestRecord
+from tester.record_codec import decode_chunks, decode_records, encode_chunks, encode_records
+
+
+def _full_record():
+    # 浮点字段选用可精确表示的值，chunk_times 本身为 float32
+    return RequestRecord(
+        model="gpt-4o", request_id=7, start_time=12.5, end_time=13.25, latency_ms=750.0,
+        status=200, error=None, prompt_tokens=10, completion_tokens=3, total_tokens=13,
+        response_text="你好，世界", first_token_latency_ms=120.5, schedule_lag_ms=0.25,
+        stage="稳态", chunk_times_ms=array("f", [120.5, 130.0, 140.0]), tpot_ms=9.75,
+        decode_tokens_per_s=102.5, attempts=3, backoff_ms=50.0, first_attempt_latency_ms=30.0,
+        throttled=2, rate_limit_wait_ms=4.0, prompt_band="0-512", warmup=True,
+        pool_wait_ms=0.5, dns_ms=1.0, connect_ms=2.0, send_ms=0.125, ttfb_ms=100.0,
+        transfer_ms=400.0, bytes_received=2048,
+    )
+
+
+def _sparse_record():
+    return RequestRecord(
+        model="m", request_id=8, start_time=1.0, end_time=2.0, latency_ms=1000.0,
+        status=None, error="Timeout", prompt_tokens=None, completion_tokens=None, total_tokens=None,
+        response_text=None,
+    )
+
+
+def test_records_round_trip():
+    records = [_full_record(), _sparse_record(), dataclasses.replace(_sparse_record(), chunk_times_ms=array("f"))]
+    decoded = decode_records(encode_records(records))
+    assert [dataclasses.asdict(r) for r in decoded] == [dataclasses.asdict(r) for r in records]
+
+
+def test_float64_chunk_times_are_narrowed():
+    record = dataclasses.replace(_sparse_record(), chunk_times_ms=array("d", [1.5, 2.5]))
+    [decoded] = decode_records(encode_records([record]))
+    assert decoded.chunk_times_ms.typecode == "f"
+    assert decoded.chunk_times_ms.tolist() == [1.5, 2.5]
+
+
+def test_empty_batch():
+    assert decode_records(encode_records([])) == []
+
+
+def test_chunks_round_trip():
+    chunks = [("gpt-4o", 1, "Hello"), ("gpt-4o", 2, ""), ("模型", 3, "你好")]
+    assert decode_chunks(encode_chunks(chunks)) == chunks
+    assert decode_chunks(encode_chunks([])) == []
@@ -0,0 +1,66 @@
+"""后台运行任务：出错或被取消时不留下仍在运行的快照 / 合并推送协程"""
+import asyncio
+
+import backend.main as main
+from backend.task_manager import task_manager
+from tester.latency_tester import ModelConfig
+from tester.mock_server import Distribution, MockProfile, MockServer
+
+
+def _config(url: str) -> ModelConfig:
+    return ModelConfig(
+        name="mock", endpoint=url, api_key="k", api_version="v", prompt="hi",
+        max_tokens=5, concurrency=2, iterations=1, stream=True,
+    )
+
+
+_BACKGROUND_LOOPS = ("ChunkCoalescer._run", "run_test_background.<locals>.push_snapshots")
+
+
+def _leftover(before):
+    """本次运行创建、仍未结束的后台协程（模拟服务端的请求处理协程除外）"""
+    return [
+        t.get_coro().__qualname__
+        for t in asyncio.all_tasks()
+        if t not in before and not t.done() and t.get_coro().__qualname__ in _BACKGROUND_LOOPS
+    ]
+
+
+def test_background_loops_stop_when_run_fails(monkeypatch):
+    def boom(self, model=None):
+        raise RuntimeError("summary failed")
+
+    async def run():
+        async with MockServer(MockProfile(tokens=(5, 5))) as server:
+            before = asyncio.all_tasks()
+            monkeypatch.setattr(main.RunAggregator, "summary_rows", boom)
+            task_id = task_manager.create_task()
+            task_manager.update_status(task_id, "running")
+            await main.run_test_background(task_id, [_config(server.url)], "hi")
+            await asyncio.sleep(0.1)
+            leftover = _leftover(before)
+            await main.http_pool.close()
+            return task_id, leftover
+
+    task_id, leftover = asyncio.run(run())
+    assert leftover == []
+    assert task_manager.get_task(task_id).status == "error"
+
+
+def test_background_loops_stop_when_cancelled():
+    async def run():
+        profile = MockProfile(ttft=Distribution("fixed", 5000), tokens=(5, 5))
+        async with MockServer(profile) as server:
+            before = asyncio.all_tasks()
+            task_id = task_manager.create_task()
+            task_manager.update_status(task_id, "running")
+            handle = asyncio.create_task(main.run_test_background(task_id, [_config(server.url)], "hi"))
+            await asyncio.sleep(0.3)
+            handle.cancel()
+            await asyncio.gather(handle, return_exceptions=True)
+            await asyncio.sleep(0.1)
+            leftover = _leftover(before)
+            await main.http_pool.close()
+            return leftover
+
+    assert asyncio.run(run()) == []
@@ -0,0 +1,74 @@
+"""分位数草图：相对误差、合并与序列化"""
+import math
+import random
+
+import pytest
+
+from tester.sketch import QuantileSketch
+
+
+def _exact(values, q):
+    """nearest-rank 精确分位数"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def _lognormal(n, seed):
+    rng = random.Random(seed)
+    return [rng.lognormvariate(5, 1) for _ in range(n)]
+
+
+@pytest.mark.parametrize("q", [0.01, 0.5, 0.9, 0.95, 0.99, 0.999])
+def test_quantiles_within_relative_accuracy(q):
+    values = _lognormal(20000, seed=1)
+    sketch = QuantileSketch(relative_accuracy=0.01)
+    sketch.extend(values)
+    exact = _exact(values, q)
+    assert abs(sketch.quantile(q) - exact) <= 0.01 * exact
+    assert sketch.count == len(values)
+    assert sketch.mean == pytest.approx(sum(values) / len(values))
+
+
+def test_merge_equals_single_sketch():
+    a, b = _lognormal(5000, seed=2), [v * 10 for v in _lognormal(500, seed=3)]
+    left, right, whole = QuantileSketch(), QuantileSketch(), QuantileSketch()
+    left.extend(a)
+    right.extend(b)
+    whole.extend(a + b)
+    left.merge(right)
+
+    assert left.bins == whole.bins
+    assert (left.count, left.min, left.max) == (whole.count, whole.min, whole.max)
+    for q in (0.5, 0.95, 0.99):
+        assert left.quantile(q) == whole.quantile(q)
+
+
+def test_merge_rejects_different_accuracy():
+    with pytest.raises(ValueError):
+        QuantileSketch(0.01).merge(QuantileSketch(0.02))
+
+
+def test_small_values_and_extremes():
+    sketch = QuantileSketch(min_value=1e-3)
+    sketch.extend([0.0, 0.0, 5.0, 100.0])
+    # 小于 min_value 的值按最小值计，分位数截断在观测范围内
+    assert sketch.quantile(0.25) == 0.0
+    assert sketch.quantile(1.0) == 100.0
+    assert QuantileSketch().quantile(0.5) is None
+
+
+def test_max_bins_only_costs_low_quantiles():
+    values = [1.01 ** i for i in range(2000)]
+    sketch = QuantileSketch(relative_accuracy=0.01, max_bins=100)
+    sketch.extend(values)
+    assert len(sketch.bins) <= 100
+    exact = _exact(values, 0.99)
+    assert abs(sketch.quantile(0.99) - exact) <= 0.01 * exact
+
+
+def test_dict_round_trip():
+    sketch = QuantileSketch()
+    sketch.extend(_lognormal(1000, seed=4))
+    restored = QuantileSketch.from_dict(sketch.to_dict())
+    assert restored.bins == sketch.bins
+    assert restored.quantiles() == sketch.quantiles()
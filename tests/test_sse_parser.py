@@ -0,0 +1,85 @@
+"""SSE 增量解析：跨读取拆分的帧、CRLF 行尾与多行 data 字段"""
+import json
+
+from tester.sse_parser import SSEDelta, SSEStreamParser
+
+
+def _frame(content=None, usage=None, text=False, sep=b"\n"):
+    choice = {"text": content} if text else {"delta": {"content": content}}
+    obj = {"choices": [choice] if content is not None else [], "usage": usage}
+    return b"data: " + json.dumps(obj).encode() + sep + sep
+
+
+STREAM = (
+    b": keep-alive\n\n"
+    + _frame("Hello")
+    + b"event: message\nid: 7\n" + _frame(" world")
+    + _frame(usage={"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5})
+    + b"data: [DONE]\n\n"
+)
+
+EXPECTED = [
+    SSEDelta("Hello", None),
+    SSEDelta(" world", None),
+    SSEDelta(None, {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5}),
+]
+
+
+def _feed_in_pieces(data, size, parser=None):
+    parser = parser or SSEStreamParser()
+    out = []
+    for i in range(0, len(data), size):
+        out.extend(parser.feed(data[i:i + size]))
+    return parser, out
+
+
+def test_whole_stream():
+    parser = SSEStreamParser()
+    assert parser.feed(STREAM) == EXPECTED
+    assert parser.done
+
+
+def test_frames_split_across_reads():
+    # 每种切分长度都把某些帧拆到多次读取中（最小到逐字节）
+    for size in (1, 2, 3, 7, 16, 50):
+        parser, out = _feed_in_pieces(STREAM, size)
+        assert out == EXPECTED, size
+        assert parser.done
+
+
+def test_crlf_line_endings():
+    data = STREAM.replace(b"\n", b"\r\n")
+    for size in (1, 5, len(data)):
+        parser, out = _feed_in_pieces(data, size)
+        assert out == EXPECTED
+        assert parser.done
+
+
+def test_multi_line_data_is_joined():
+    payload = json.dumps({"choices": [{"delta": {"content": "a\nb"}}]}, indent=1).encode()
+    data = b"".join(b"data: " + line + b"\n" for line in payload.split(b"\n")) + b"\n"
+    parser, out = _feed_in_pieces(data + b"data: [DONE]\n\n", 4)
+    assert out == [SSEDelta("a\nb", None)]
+    assert parser.done
+
+
+def test_event_waits_for_the_blank_line():
+    parser = SSEStreamParser()
+    assert parser.feed(b'data: {"choices":[{"delta":{"content":"x"}}]}\n') == []
+    assert parser.feed(b"\n") == [SSEDelta("x", None)]
+
+
+def test_completions_text_field():
+    parser = SSEStreamParser(completions=True)
+    assert parser.feed(_frame("abc", text=True)) == [SSEDelta("abc", None)]
+
+
+def test_nothing_after_done():
+    parser = SSEStreamParser()
+    assert parser.feed(b"data: [DONE]\n\n" + _frame("late")) == []
+    assert parser.feed(_frame("later")) == []
+
+
+def test_invalid_and_empty_payloads_are_skipped():
+    parser = SSEStreamParser()
+    assert parser.feed(b"data: {oops\n\ndata:\n\ndata: [1, 2]\n\n" + _frame("ok")) == [SSEDelta("ok", None)]
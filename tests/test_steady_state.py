@@ -0,0 +1,39 @@
+"""稳态检测：默认关闭，平稳序列不会被截断"""
+import asyncio
+
+from backend.main import resolve_steady_state_window
+from backend import models
+from tester.latency_tester import LatencyTester, ModelConfig
+from tester.metrics import summarize_latency
+from tester.mock_server import MockProfile, MockServer
+from tester.steady_state import detect_warmup
+
+
+def test_flat_series_is_not_truncated():
+    assert detect_warmup([0.0] * 40) == 0
+    assert detect_warmup([100.0] * 100) == 0
+
+
+def test_slow_start_is_truncated():
+    values = [500.0] * 10 + [100.0 + (i % 3) for i in range(90)]
+    assert detect_warmup(values) == 10
+
+
+def test_summary_keeps_every_record_of_flat_run_by_default():
+    async def run():
+        async with MockServer(MockProfile(tokens=(5, 5))) as server:
+            config = ModelConfig(
+                name="mock", endpoint=server.url, api_key="k", api_version="v", prompt="hi",
+                max_tokens=5, concurrency=4, iterations=3, stream=True,
+            )
+            return await LatencyTester().run_models([config])
+
+    records = asyncio.run(run())
+    assert len(records) == 12
+    summary = summarize_latency(records)
+    assert summary.iloc[0]["total_requests"] == 12
+
+
+def test_request_defaults_to_no_detection():
+    assert resolve_steady_state_window(models.TestRequest(models=["m"])) == 0
+    assert resolve_steady_state_window(models.TestRequest(models=["m"], steady_state=True)) > 0
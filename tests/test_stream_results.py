@@ -0,0 +1,43 @@
+"""SSE 推送：统计类事件整条送达，不丢附加字段，也不混入流式数据块"""
+import asyncio
+import json
+
+import backend.main as main
+from backend.task_manager import task_manager
+
+
+def _read_events(events):
+    async def run():
+        task_id = task_manager.create_task()
+        for event in events:
+            await task_manager.push_data(task_id, event)
+        await task_manager.push_complete(task_id)
+        response = await main.stream_results(task_id, last_event_id=None, since=None)
+        return [item async for item in response.body_iterator]
+
+    return asyncio.run(run())
+
+
+def test_stats_events_keep_every_field():
+    rows = [{"model": "m", "total_requests": 3}]
+    summary_complete = {
+        "type": "summary_complete",
+        "data": rows,
+        "is_partial": False,
+        "status": "completed",
+        "calibration": {"exceeds_calibrated_capacity": False},
+        "capacity": {"m": {"max_load": 8}},
+        "prompt_bands": [{"model": "m", "band": "0-256"}],
+        "warmup": [{"model": "m", "total_requests": 1}],
+    }
+    probe = {"type": "capacity_probe", "model_name": "m", "load": 8, "label": "8 并发", "passed": True}
+    summary = {"type": "summary", "data": rows, "model_name": "m", "prompt_bands": [{"band": "0-256"}]}
+
+    received = _read_events([summary, probe, summary_complete])
+    by_event = {item["event"]: json.loads(item["data"]) for item in received}
+
+    assert by_event["summary"] == summary
+    assert by_event["capacity_probe"] == probe
+    assert by_event["summary_complete"] == summary_complete
+    assert "chunk" not in by_event
+    assert received[-1]["event"] == "complete"
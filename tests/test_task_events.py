@@ -0,0 +1,72 @@
+"""任务事件日志：统计事件不会被流式输出挤掉"""
+import asyncio
+from datetime import datetime, timedelta
+
+from backend.task_manager import TaskEventLog, TaskManager, is_chunk_event
+
+
+def test_summary_complete_is_not_a_chunk_event():
+    assert is_chunk_event({"type": "chunks", "frames": []})
+    assert is_chunk_event({"type": "chunk", "status": "completed", "model": "m", "request_id": 1})
+    assert not is_chunk_event({"type": "summary_complete", "status": "completed", "data": []})
+    assert not is_chunk_event({"type": "summary", "data": []})
+
+
+def test_lagging_subscriber_still_gets_summary_complete():
+    async def run():
+        log = TaskEventLog(ring_size=3, policy="drop_chunks")
+        sub = await log.subscribe(0)
+        await log.put({"type": "summary_complete", "status": "completed", "data": [{"model": "m"}]})
+        for i in range(5):
+            await log.put({"type": "chunk", "status": "completed", "model": "m", "request_id": i, "chunk": "x"})
+        received = [(await sub.get())[1] for _ in range(4)]
+        return log, received
+
+    log, received = asyncio.run(run())
+    assert received[0]["type"] == "summary_complete"
+    # 只有流式输出被淘汰
+    assert [event["request_id"] for event in received[1:]] == [2, 3, 4]
+    assert log.qsize() == 4
+
+
+def test_cleanup_evicts_finished_and_abandoned_tasks():
+    async def run():
+        manager = TaskManager(cleanup_interval=3600, abandon_timeout=600)
+        long_ago = datetime.now() - timedelta(hours=2)
+        recent = datetime.now() - timedelta(minutes=5)
+
+        # 已结束超过保留时长
+        expired = manager.create_task()
+        manager.update_status(expired, "completed")
+        manager.get_task(expired).completed_at = long_ago
+        manager.get_task(expired).last_consumer_seen = recent
+        # 刚结束，但订阅者早已离开
+        left = manager.create_task()
+        manager.update_status(left, "completed")
+        manager.get_task(left).last_consumer_seen = long_ago
+        # 运行中、从未有人订阅
+        orphan = manager.create_task()
+        manager.update_status(orphan, "running")
+        manager.get_task(orphan).created_at = long_ago
+        cancelled = []
+        manager.set_cancel_callback(orphan, lambda: cancelled.append(orphan))
+        # 运行中、仍有订阅者
+        watched = manager.create_task()
+        manager.update_status(watched, "running")
+        manager.get_task(watched).created_at = long_ago
+        await manager.get_task(watched).events.subscribe(0)
+        # 刚结束，订阅者刚离开
+        fresh = manager.create_task()
+        manager.update_status(fresh, "completed")
+        manager.get_task(fresh).last_consumer_seen = recent
+
+        removed = manager.cleanup_old_tasks()
+        return manager, removed, cancelled, (expired, left, orphan, watched, fresh)
+
+    manager, removed, cancelled, (expired, left, orphan, watched, fresh) = asyncio.run(run())
+    assert removed == 2
+    assert manager.get_task(expired) is None and manager.get_task(left) is None
+    # 被遗弃的运行中任务先取消，结束后的下一轮再移除
+    assert cancelled == [orphan] and manager.get_task(orphan).status == "cancelling"
+    assert manager.get_task(watched).status == "running"
+    assert manager.get_task(fresh) is not None